@@ -21,28 +21,18 @@ function App() {
     const [isNPChecked, setIsNPChecked] = useState(true)
     const [isRPChecked, setIsRPChecked] = useState(true)
 
-    const fetchNpData = async (currLat, currLng) => {
+    const fetchData = async (location) => {
         setNpBylaws([]);
-        try {
-            const response = await axios.get(`/api/bylaws/?type=np&lat=${currLat}&lng=${currLng}`);
-            const result = await response.data;
-            setNpBylaws(result);
-            setLoading(false);
-        } catch (error) {
-            console.error("Error fetching no parking bylaws", error);
-            setLoading(false);
-        }
-    };
-
-    const fetchRpData = async (currLat, currLng) => {
         setRpBylaws([]);
         try {
-            const response = await axios.get(`/api/bylaws/?type=rp&lat=${currLat}&lng=${currLng}`);
+            // single request for both schedules, grouped by schedule on the server
+            const response = await axios.get(`/api/bylaws/?type=all&group=schedule&${location}`);
             const result = await response.data;
-            setRpBylaws(result);
+            setNpBylaws({...result, results: result.results["13"]});
+            setRpBylaws({...result, results: result.results["15"]});
             setLoading(false);
         } catch (error) {
-            console.log("Error fetching restricted parking bylaws", error);
+            console.error("Error fetching parking bylaws", error);
             setLoading(false);
         }
     };
@@ -55,8 +45,7 @@ function App() {
             center: [lng, lat],
             zoom: zoom
         });
-        fetchNpData(lat, lng);
-        fetchRpData(lat, lng);
+        fetchData(`lat=${lat}&lng=${lng}`);
 
         // handle map markers when zoom is changed
         map.current.on("zoomend", () => {
@@ -80,8 +69,11 @@ function App() {
             setZoom(updatedZoom);
 
             if (updatedZoom > 13) {
-                fetchNpData(updatedLat, updatedLng); // only fetch data based on current lat/lng and radius
-                fetchRpData(updatedLat, updatedLng); // only fetch data based on current lat/lng and radius
+                // only fetch data within the current viewport
+                const bounds = map.current.getBounds();
+                const ne = bounds.getNorthEast();
+                const sw = bounds.getSouthWest();
+                fetchData(`ne=${ne.lat.toFixed(4)},${ne.lng.toFixed(4)}&sw=${sw.lat.toFixed(4)},${sw.lng.toFixed(4)}`);
             }
         });
     }, []);
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class ApiConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "api"
+
+    def ready(self):
+        from api.tiles import purge_tile_cache
+        from whereToPark.signals import dataset_changed
+
+        dataset_changed.connect(purge_tile_cache, dispatch_uid="purge_tile_cache")
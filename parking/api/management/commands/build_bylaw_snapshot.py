@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.snapshot import build_snapshot, get_snapshot_path
+from whereToPark.models import DatasetVersion
+
+
+class Command(BaseCommand):
+    """
+    This management command writes the whole-city GeoJSON snapshot of displayable bylaws
+    (plus gzip and brotli compressed copies) for the current dataset version. It is run
+    by ``import_parking_data`` and ``set_location_data`` once they finish so the
+    snapshot endpoint never has to build it on a request.
+    """
+
+    help = "Writes the precompressed GeoJSON snapshot of bylaws for the current dataset version."
+
+    def handle(self, *args, **options):
+        key = DatasetVersion.objects.current().key
+        etag = build_snapshot(key)
+        self.stdout.write(f"Wrote {get_snapshot_path(key)} (etag {etag})")
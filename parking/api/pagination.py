@@ -0,0 +1,167 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over (``schedule``, ``source_id``). Each page is fetched
+    with a range condition on the last row seen instead of an OFFSET, so every page
+    costs the same no matter how deep it is. Cursors are opaque base64 strings and the
+    count query can be skipped with ``?count=false``.
+
+    Pages can be a queryset of model instances, dicts or named ``values_list`` rows as
+    long as they include the ordering fields.
+    """
+
+    ordering = ("schedule", "source_id")
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 5000
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.count = queryset.count() if self.should_count(request) else None
+        queryset, position, reverse = self.get_page_queryset(queryset, request)
+        return self.set_page(list(queryset[: self.limit + 1]), position, reverse)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Same as ``paginate_queryset`` but runs the queries with the async ORM, for use
+        in async views.
+        """
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.count = await queryset.acount() if self.should_count(request) else None
+        queryset, position, reverse = self.get_page_queryset(queryset, request)
+        results = [item async for item in queryset[: self.limit + 1].aiterator()]
+        return self.set_page(results, position, reverse)
+
+    def should_count(self, request):
+        return (
+            request.query_params.get(self.count_query_param, "true").lower() != "false"
+        )
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Returns the queryset ordered and filtered to start at the requested cursor,
+        along with the cursor's position and direction.
+        """
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            position, reverse = None, False
+        else:
+            *position, reverse = cursor
+
+        direction = "-" if reverse else ""
+        queryset = queryset.order_by(*[direction + field for field in self.ordering])
+        if position is not None:
+            queryset = queryset.filter(self.get_position_q(position, reverse))
+        return queryset, position, reverse
+
+    def set_page(self, results, position, reverse):
+        """Trims the extra row fetched to check for more and sets the page links."""
+        has_more = len(results) > self.limit
+        results = results[: self.limit]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = results
+        return results
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(limit, self.max_page_size))
+
+    def get_position_q(self, position, reverse):
+        """
+        Returns a Q object matching rows after (or before if ``reverse``) position. The
+        OR alone can't be used as a range on the (schedule, source_id) index, so it's
+        ANDed with the redundant bound on schedule that can.
+        """
+        schedule, source_id = position
+        lookup = "lt" if reverse else "gt"
+        bound = Q(**{f"schedule__{lookup}e": schedule})
+        return bound & (
+            Q(**{f"schedule__{lookup}": schedule})
+            | Q(schedule=schedule, **{f"source_id__{lookup}": source_id})
+        )
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return [item[field] for field in self.ordering]
+        return [getattr(item, field) for field in self.ordering]
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps([*position, reverse]).encode()
+        cursor = base64.urlsafe_b64encode(data).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            schedule, source_id, reverse = json.loads(base64.urlsafe_b64decode(cursor))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(source_id, int) or not isinstance(reverse, bool):
+            raise NotFound(self.invalid_cursor_message)
+        return str(schedule), source_id, reverse
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Nothing left after the cursor, point back to the first page
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_paginated_data(self, data):
+        paginated = {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        }
+        if self.count is not None:
+            paginated = {"count": self.count, **paginated}
+        return paginated
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True},
+                "previous": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
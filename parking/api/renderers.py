@@ -0,0 +1,47 @@
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to DRF's stdlib json renderer
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer backed by orjson. Anything orjson can't serialize natively is
+    passed to DRF's encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        return dumps(data)
+
+
+def dumps(data):
+    if orjson is None:
+        return json.dumps(data, cls=JSONEncoder, separators=(",", ":")).encode()
+    return orjson.dumps(data, default=JSONEncoder().default)
+
+
+def stream_json_array(items, batch_size=500):
+    """
+    Yields a JSON array of ``items`` in chunks of ``batch_size`` items so a response
+    can be sent without ever holding the whole array in memory.
+    """
+    yield b"["
+    batch = []
+    first = True
+    for item in items:
+        batch.append(dumps(item))
+        if len(batch) >= batch_size:
+            yield (b"" if first else b",") + b",".join(batch)
+            batch, first = [], False
+    if batch:
+        yield (b"" if first else b",") + b",".join(batch)
+    yield b"]"
@@ -0,0 +1,53 @@
+from collections import defaultdict
+
+from api.spatial import VersionedIndex
+from whereToPark.models import ByLaw
+from whereToPark.schedules import from_bytes, is_active
+
+
+class ScheduleIndex:
+    """
+    Bylaw ids grouped by their weekly time bitmap. The city only has a few hundred
+    distinct schedules, so finding the bylaws in effect at a time takes one bit test
+    per schedule rather than one per bylaw.
+    """
+
+    def __init__(self):
+        self.groups = defaultdict(list)
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.groups.values())
+
+    def insert(self, pk, bitmap):
+        self.groups[bitmap].append(pk)
+
+    def split(self, slot):
+        """
+        Returns the (active, inactive) sets of ids at the given slot of the week.
+        Bylaws with an unknown schedule are counted as active.
+        """
+        active, inactive = set(), set()
+        for bitmap, ids in self.groups.items():
+            if bitmap is None or is_active(bitmap, slot):
+                active.update(ids)
+            else:
+                inactive.update(ids)
+        return active, inactive
+
+
+def build_schedule_index():
+    """
+    Builds a ``ScheduleIndex`` over the stored time bitmaps of every bylaw we display.
+    """
+    index = ScheduleIndex()
+    rows = (
+        ByLaw.objects.get_bylaws_to_display()
+        .order_by()
+        .values_list("id", "active_times")
+    )
+    for pk, active_times in rows:
+        index.insert(pk, from_bytes(active_times))
+    return index
+
+
+schedule_index = VersionedIndex(build_schedule_index)
@@ -34,3 +34,90 @@ class ByLawSerializer(serializers.Serializer):
 
     class Meta:
         model = ByLaw
+
+
+# Columns fetched by the ``values_list`` fast path in ``ByLawViewSet.list``, unpacked
+# in this order by ``bylaw_row_to_dict``
+BYLAW_ROW_FIELDS = [
+    "boundary_start",
+    "boundary_start__main_street__name",
+    "boundary_start__cross_street__name",
+    "boundary_start__lat",
+    "boundary_start__lng",
+    "boundary_end",
+    "boundary_end__main_street__name",
+    "boundary_end__cross_street__name",
+    "boundary_end__lat",
+    "boundary_end__lng",
+    "mid_lat",
+    "mid_lng",
+    "highway__name",
+    "source_id",
+    "schedule",
+    "schedule_name",
+    "side",
+    "between",
+    "times_and_or_days",
+    "max_period_permitted",
+]
+
+
+def _highway_dict(name):
+    return None if name is None else {"name": name}
+
+
+def _intersection_dict(pk, main_street, cross_street, lat, lng):
+    if pk is None:
+        return None
+    return {
+        "main_street": _highway_dict(main_street),
+        "cross_street": _highway_dict(cross_street),
+        "lat": lat,
+        "lng": lng,
+    }
+
+
+def bylaw_row_to_dict(row):
+    """
+    Maps a ``values_list(*BYLAW_ROW_FIELDS)`` row to the same dict ``ByLawSerializer``
+    produces for that bylaw, without building any serializer instances.
+    """
+    (
+        start_id,
+        start_main_street,
+        start_cross_street,
+        start_lat,
+        start_lng,
+        end_id,
+        end_main_street,
+        end_cross_street,
+        end_lat,
+        end_lng,
+        mid_lat,
+        mid_lng,
+        highway,
+        source_id,
+        schedule,
+        schedule_name,
+        side,
+        between,
+        times_and_or_days,
+        max_period_permitted,
+    ) = row
+    return {
+        "boundary_start": _intersection_dict(
+            start_id, start_main_street, start_cross_street, start_lat, start_lng
+        ),
+        "boundary_end": _intersection_dict(
+            end_id, end_main_street, end_cross_street, end_lat, end_lng
+        ),
+        "midpoint": (mid_lat, mid_lng),
+        "highway": _highway_dict(highway),
+        "source_id": source_id,
+        "schedule": schedule,
+        "schedule_name": schedule_name,
+        "side": side,
+        "between": between,
+        "times_and_or_days": times_and_or_days,
+        "max_period_permitted": max_period_permitted,
+    }
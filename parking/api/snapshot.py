@@ -0,0 +1,157 @@
+"""
+Whole-city GeoJSON snapshot of the bylaws we display, written to disk alongside
+gzip and brotli compressed copies so they can be served as-is. Snapshots are only
+built by the ``build_bylaw_snapshot`` command, which the import commands run once they
+are done, never on a request.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from api.storage import purge_stale_versions, write_atomic
+from whereToPark.models import ByLaw
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, we fall back to gzip only
+    brotli = None
+
+SNAPSHOT_FILENAME = "bylaws.geojson"
+# Encodings in order of preference, mapped to the suffix of the file holding them
+ENCODINGS = [("br", ".br"), ("gzip", ".gz"), ("identity", "")]
+
+PROPERTY_FIELDS = [
+    ("source_id", "source_id"),
+    ("schedule", "schedule"),
+    ("schedule_name", "schedule_name"),
+    ("highway", "highway__name"),
+    ("side", "side"),
+    ("between", "between"),
+    ("times_and_or_days", "times_and_or_days"),
+    ("max_period_permitted", "max_period_permitted"),
+]
+SNAPSHOT_FIELDS = ["id", "mid_lat", "mid_lng"] + [field for _, field in PROPERTY_FIELDS]
+
+
+def get_snapshot_dir(key):
+    return os.path.join(settings.SNAPSHOT_DIR, key)
+
+
+def get_snapshot_path(key, encoding="identity"):
+    suffix = dict(ENCODINGS)[encoding]
+    return os.path.join(get_snapshot_dir(key), SNAPSHOT_FILENAME + suffix)
+
+
+def bylaw_feature(row):
+    properties = {key: row[field] for key, field in PROPERTY_FIELDS}
+    return {
+        "type": "Feature",
+        "id": row["id"],
+        "geometry": {"type": "Point", "coordinates": [row["mid_lng"], row["mid_lat"]]},
+        "properties": properties,
+    }
+
+
+def build_snapshot(key):
+    """
+    Writes the GeoJSON snapshot for the dataset version ``key`` along with its compressed copies and
+    an ``etag`` file holding the hash of the uncompressed body, then removes the
+    snapshots of older versions. Returns the etag.
+    """
+    rows = (
+        ByLaw.objects.get_bylaws_to_display()
+        .filter(mid_lat__isnull=False, mid_lng__isnull=False)
+        .order_by("schedule", "source_id")
+        .values(*SNAPSHOT_FIELDS)
+    )
+    collection = {
+        "type": "FeatureCollection",
+        "version": key,
+        "features": [bylaw_feature(row) for row in rows],
+    }
+    body = json.dumps(collection, separators=(",", ":")).encode()
+    etag = hashlib.sha256(body).hexdigest()[:32]
+
+    write_atomic(get_snapshot_path(key, "gzip"), gzip.compress(body, mtime=0))
+    if brotli is not None:
+        write_atomic(get_snapshot_path(key, "br"), brotli.compress(body))
+    write_atomic(get_snapshot_path(key), body)
+    # etag is written last, its presence means the snapshot is complete
+    write_atomic(os.path.join(get_snapshot_dir(key), "etag"), etag.encode())
+    # Older snapshots are served until this one is complete
+    purge_stale_versions(settings.SNAPSHOT_DIR, key)
+    return etag
+
+
+def get_snapshot_etag(key):
+    """
+    Returns the etag of the snapshot for the dataset version ``key``, None if it
+    isn't complete.
+    """
+    try:
+        with open(os.path.join(get_snapshot_dir(key), "etag")) as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def get_snapshot_last_modified(key):
+    """Returns when the snapshot for ``key`` was completed."""
+    mtime = os.stat(os.path.join(get_snapshot_dir(key), "etag")).st_mtime
+    return datetime.fromtimestamp(mtime, tz=timezone.utc)
+
+
+def find_snapshot(key):
+    """
+    Returns the key of the snapshot to serve for the dataset version ``key``: its own
+    once it's built, otherwise the most recently completed one still on disk (ie. while
+    an import is running). None if there isn't any.
+    """
+    if os.path.exists(os.path.join(get_snapshot_dir(key), "etag")):
+        return key
+    if not os.path.isdir(settings.SNAPSHOT_DIR):
+        return None
+    latest = None
+    for entry in os.listdir(settings.SNAPSHOT_DIR):
+        try:
+            last_modified = get_snapshot_last_modified(entry)
+        except FileNotFoundError:
+            continue
+        if latest is None or last_modified > latest[0]:
+            latest = (last_modified, entry)
+    return None if latest is None else latest[1]
+
+
+def parse_accept_encoding(header):
+    """Returns the set of content codings accepted (q > 0) by the client."""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def negotiate_encoding(key, accept_encoding):
+    """
+    Picks the best precompressed snapshot the client accepts and we have on disk.
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    for encoding, _ in ENCODINGS:
+        if encoding != "identity" and encoding not in accepted and "*" not in accepted:
+            continue
+        if os.path.exists(get_snapshot_path(key, encoding)):
+            return encoding
+    return "identity"
@@ -0,0 +1,380 @@
+import heapq
+import math
+import threading
+import weakref
+from collections import defaultdict, namedtuple
+
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from whereToPark.models import ByLaw, DatasetVersion
+from whereToPark.postgis import BYLAW_TABLE
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class BoundingBox(namedtuple("BoundingBox", "min_lat min_lng max_lat max_lng")):
+    @classmethod
+    def from_center(cls, lat, lng, radius_km):
+        """
+        Returns the box whose corners are ``radius_km`` from the given center, using an
+        equirectangular approximation (within a few metres of the geodesic at city
+        scale).
+        """
+        half_side = radius_km / math.sqrt(2)
+        dlat = math.degrees(half_side / EARTH_RADIUS_KM)
+        dlng = dlat / math.cos(math.radians(lat))
+        return cls(lat - dlat, lng - dlng, lat + dlat, lng + dlng)
+
+    @classmethod
+    def from_corners(cls, ne, sw):
+        """Returns the box between the given (lat, lng) NE and SW corners."""
+        return cls(
+            min(ne[0], sw[0]), min(ne[1], sw[1]), max(ne[0], sw[0]), max(ne[1], sw[1])
+        )
+
+    def snap(self, grid_size):
+        """
+        Returns the box grown outwards to the nearest ``grid_size`` degree grid lines so
+        nearly identical boxes end up being the same box.
+        """
+        return BoundingBox(
+            *(round(math.floor(value / grid_size) * grid_size, 6) for value in self[:2]),
+            *(round(math.ceil(value / grid_size) * grid_size, 6) for value in self[2:]),
+        )
+
+
+def snap_to_grid(value, grid_size):
+    """Rounds ``value`` to the center of its ``grid_size`` degree grid cell."""
+    return round((math.floor(value / grid_size) + 0.5) * grid_size, 6)
+
+
+def postgis_in_box(box):
+    """
+    Returns a condition matching bylaws whose PostGIS geometry overlaps the
+    ``BoundingBox``, answered from the GiST index with ``&&``.
+    """
+    return RawSQL(
+        f"{BYLAW_TABLE}.geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)",
+        (box.min_lng, box.min_lat, box.max_lng, box.max_lat),
+        output_field=BooleanField(),
+    )
+
+
+def postgis_within(lat, lng, radius_km):
+    """
+    Returns a condition matching bylaws whose PostGIS geometry is within ``radius_km``
+    of the given point. The ``&&`` against the circle's envelope lets the GiST index
+    narrow things down before the exact ``ST_DWithin`` on the spheroid.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlng = dlat / math.cos(math.radians(lat))
+    return RawSQL(
+        f"{BYLAW_TABLE}.geom"
+        " && ST_Expand(ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s, %s)"
+        f" AND ST_DWithin({BYLAW_TABLE}.geom::geography,"
+        " ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)",
+        (lng, lat, dlng, dlat, lng, lat, radius_km * 1000),
+        output_field=BooleanField(),
+    )
+
+
+class GridIndex:
+    """
+    Uniform grid over bylaw coordinates. Points are bucketed into square cells
+    ``cell_size`` degrees wide so a bounding box query only has to look at the
+    handful of cells it overlaps rather than every bylaw in the city.
+    """
+
+    def __init__(self, cell_size=0.01):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+
+    def __len__(self):
+        return sum(len(points) for points in self.cells.values())
+
+    def get_cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def insert(self, pk, lat, lng):
+        self.cells[self.get_cell(lat, lng)].append((lat, lng, pk))
+
+    def query(self, min_lat, min_lng, max_lat, max_lng):
+        """
+        Returns the set of ids with at least one point inside the given box.
+        """
+        min_row, min_col = self.get_cell(min_lat, min_lng)
+        max_row, max_col = self.get_cell(max_lat, max_lng)
+        box_size = (max_row - min_row + 1) * (max_col - min_col + 1)
+        if box_size > len(self.cells):
+            # Box covers more cells than we have populated, cheaper to walk those instead
+            cells = [
+                points
+                for (row, col), points in self.cells.items()
+                if min_row <= row <= max_row and min_col <= col <= max_col
+            ]
+        else:
+            cells = [
+                self.cells.get((row, col), ())
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+            ]
+
+        ids = set()
+        for points in cells:
+            for lat, lng, pk in points:
+                if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                    ids.add(pk)
+        return ids
+
+
+class ClusterGrid:
+    """
+    Multi-resolution grid of bylaw midpoint counts used to cluster bylaws at low zoom.
+    Level ``z`` has cells ``360 / (2 ** z * cells_per_tile)`` degrees wide (ie. roughly
+    ``cells_per_tile`` cells across a map tile at that zoom). Only the finest level is
+    built from the points, every coarser level is aggregated from the one below it
+    since each cell is exactly a 2x2 block of its children.
+    """
+
+    def __init__(self, max_zoom=16, cells_per_tile=4):
+        self.max_zoom = max_zoom
+        self.cells_per_tile = cells_per_tile
+        self.levels = [{} for _ in range(max_zoom + 1)]
+
+    def get_cell_size(self, zoom):
+        return 360 / (2**zoom * self.cells_per_tile)
+
+    def build(self, points):
+        """
+        Builds every level from an iterable of (lat, lng, schedule) points.
+        """
+        cell_size = self.get_cell_size(self.max_zoom)
+        finest = self.levels[self.max_zoom]
+        for lat, lng, schedule in points:
+            key = (math.floor(lat / cell_size), math.floor(lng / cell_size))
+            self.add_to_cell(finest, key, 1, {schedule: 1}, lat, lng)
+
+        for zoom in range(self.max_zoom, 0, -1):
+            parent_level = self.levels[zoom - 1]
+            for (row, col), cell in self.levels[zoom].items():
+                count, schedules, sum_lat, sum_lng = cell
+                key = (row // 2, col // 2)
+                self.add_to_cell(parent_level, key, count, schedules, sum_lat, sum_lng)
+        return self
+
+    def add_to_cell(self, level, key, count, schedules, sum_lat, sum_lng):
+        cell = level.get(key)
+        if cell is None:
+            level[key] = [count, dict(schedules), sum_lat, sum_lng]
+            return
+        cell[0] += count
+        for schedule, schedule_count in schedules.items():
+            cell[1][schedule] = cell[1].get(schedule, 0) + schedule_count
+        cell[2] += sum_lat
+        cell[3] += sum_lng
+
+    def get_zoom_level(self, zoom):
+        return max(0, min(int(zoom), self.max_zoom))
+
+    def query(self, box, zoom):
+        """
+        Returns the clusters whose cells overlap the given ``BoundingBox`` at ``zoom``.
+        Each cluster has its bylaw count, counts per schedule and the centroid of its
+        midpoints as representative coordinates.
+        """
+        level = self.get_zoom_level(zoom)
+        cell_size = self.get_cell_size(level)
+        min_row, min_col = (math.floor(value / cell_size) for value in box[:2])
+        max_row, max_col = (math.floor(value / cell_size) for value in box[2:])
+        cells = self.levels[level]
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(cells):
+            keys = [
+                (row, col)
+                for row, col in cells
+                if min_row <= row <= max_row and min_col <= col <= max_col
+            ]
+        else:
+            keys = [
+                (row, col)
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+                if (row, col) in cells
+            ]
+
+        clusters = []
+        for key in sorted(keys):
+            count, schedules, sum_lat, sum_lng = cells[key]
+            clusters.append(
+                {
+                    "lat": sum_lat / count,
+                    "lng": sum_lng / count,
+                    "count": count,
+                    "schedules": dict(schedules),
+                }
+            )
+        return clusters
+
+
+class KDTree:
+    """
+    2-d tree for nearest neighbour queries over bylaw midpoints. Points are projected
+    to kms on a plane around the data's mean latitude (equirectangular, accurate to a
+    few metres across the city) so plain euclidean distance can be used.
+    """
+
+    def __init__(self, points):
+        """Builds the tree from an iterable of (lat, lng, pk) points."""
+        points = list(points)
+        self.ref_lat = sum(lat for lat, _, _ in points) / len(points) if points else 0
+        self.lng_scale = math.cos(math.radians(self.ref_lat))
+        self.size = len(points)
+        self.root = self.build(
+            [(*self.project(lat, lng), pk) for lat, lng, pk in points]
+        )
+
+    def __len__(self):
+        return self.size
+
+    def project(self, lat, lng):
+        km_per_degree = math.radians(EARTH_RADIUS_KM)
+        return lng * self.lng_scale * km_per_degree, lat * km_per_degree
+
+    def build(self, points, depth=0):
+        """
+        Returns the node for ``points``, a (point, axis, left, right) tuple split on the
+        median along alternating axes.
+        """
+        if not points:
+            return None
+        axis = depth % 2
+        points.sort(key=lambda point: point[axis])
+        median = len(points) // 2
+        return (
+            points[median],
+            axis,
+            self.build(points[:median], depth + 1),
+            self.build(points[median + 1 :], depth + 1),
+        )
+
+    def query(self, lat, lng, k):
+        """
+        Returns up to ``k`` (distance_km, pk) pairs for the points closest to the given
+        location, nearest first.
+        """
+        x, y = self.project(lat, lng)
+        # Max heap (by negated distance) of the best k found so far
+        best = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, axis, left, right = node
+            dist = (point[0] - x) ** 2 + (point[1] - y) ** 2
+            if len(best) < k:
+                heapq.heappush(best, (-dist, point[2]))
+            elif dist < -best[0][0]:
+                heapq.heapreplace(best, (-dist, point[2]))
+
+            diff = (x, y)[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Only visit the far side if the splitting line is closer than the worst
+            # of the best k, pushed first so the near side is searched first
+            if len(best) < k or diff**2 < -best[0][0]:
+                stack.append(far)
+            stack.append(near)
+        return sorted((math.sqrt(-dist), pk) for dist, pk in best)
+
+
+class VersionedIndex:
+    """
+    Holds an in-process index returned by ``build`` and rebuilds it lazily the next
+    time it is requested after the dataset version has been bumped (ie. once an
+    import has finished). The index is keyed on the version number along with the
+    time of the bump, since numbers alone repeat when the database is recreated (ie.
+    between tests) while ids from the old data may not.
+    """
+
+    instances = weakref.WeakSet()
+
+    def __init__(self, build):
+        self.build = build
+        self.index = None
+        self.key = None
+        self.lock = threading.Lock()
+        VersionedIndex.instances.add(self)
+
+    def get(self):
+        key = DatasetVersion.objects.get_cached()
+        if self.index is None or self.key != key:
+            with self.lock:
+                if self.index is None or self.key != key:
+                    self.index = self.build()
+                    self.key = key
+        return self.index
+
+    def reset(self):
+        with self.lock:
+            self.index = None
+            self.key = None
+
+    @classmethod
+    def reset_all(cls):
+        """Drops every index so each one is rebuilt when next requested."""
+        for holder in list(cls.instances):
+            holder.reset()
+
+
+def build_bylaw_index():
+    """
+    Builds a ``GridIndex`` over the stored midpoints of every bylaw we display.
+    """
+    index = GridIndex()
+    rows = (
+        ByLaw.objects.get_bylaws_to_display()
+        .filter(mid_lat__isnull=False, mid_lng__isnull=False)
+        .order_by()
+        .values_list("id", "mid_lat", "mid_lng")
+    )
+    for pk, lat, lng in rows:
+        index.insert(pk, lat, lng)
+    return index
+
+
+def build_cluster_grid():
+    """
+    Builds a ``ClusterGrid`` over the stored midpoints of every bylaw we display.
+    """
+    points = (
+        ByLaw.objects.get_bylaws_to_display()
+        .filter(mid_lat__isnull=False, mid_lng__isnull=False)
+        .order_by()
+        .values_list("mid_lat", "mid_lng", "schedule")
+    )
+    return ClusterGrid().build(points)
+
+
+def build_nearest_index():
+    """
+    Builds a ``KDTree`` per schedule over the stored midpoints of every bylaw we
+    display.
+    """
+    points = defaultdict(list)
+    rows = (
+        ByLaw.objects.get_bylaws_to_display()
+        .filter(mid_lat__isnull=False, mid_lng__isnull=False)
+        .order_by()
+        .values_list("id", "mid_lat", "mid_lng", "schedule")
+    )
+    for pk, lat, lng, schedule in rows:
+        points[schedule].append((lat, lng, pk))
+    return {
+        schedule: KDTree(schedule_points)
+        for schedule, schedule_points in points.items()
+    }
+
+
+bylaw_index = VersionedIndex(build_bylaw_index)
+cluster_grid = VersionedIndex(build_cluster_grid)
+nearest_index = VersionedIndex(build_nearest_index)
@@ -0,0 +1,28 @@
+import os
+import shutil
+import tempfile
+
+
+def write_atomic(path, data):
+    """
+    Writes ``data`` to ``path`` through a temp file in the same folder so concurrent
+    readers never see a partially written file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def purge_stale_versions(root, key):
+    """
+    Removes every per-version folder under ``root`` other than the one for the
+    dataset version ``key``.
+    """
+    if not os.path.isdir(root):
+        return
+    for entry in os.listdir(root):
+        if key is not None and entry == key:
+            continue
+        shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
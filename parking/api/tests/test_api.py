@@ -1,7 +1,21 @@
+import json
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Q
+from django.test import override_settings
+from django.utils.asyncio import async_unsafe
 from django.urls import include, path, reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, URLPatternsTestCase
 
+from api.serializers import ByLawSerializer
+from api.spatial import VersionedIndex
+from api.tests.utils import create_downtown_bylaws
+from whereToPark.models import ByLaw, DatasetVersion
+
 
 # class ByLawTests(APITestCase, URLPatternsTestCase):
 #     urlpatterns = [
@@ -16,3 +30,344 @@ from rest_framework.test import APITestCase, URLPatternsTestCase
 #         response = self.client.get(url, format="json")
 #         self.assertEqual(response.status_code, status.HTTP_200_OK)
 #         self.assertEqual(len(response.data), 1)
+
+
+class ByLawAPITestCase(APITestCase):
+    """Creates a couple of geocoded bylaws around Yonge and Queen for the API tests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_downtown_bylaws()
+        DatasetVersion.objects.bump()
+
+    def setUp(self):
+        cache.clear()
+        VersionedIndex.reset_all()
+        self.url = reverse("api:bylaw-list")
+
+
+class ByLawListTests(ByLawAPITestCase):
+    def test_list_matches_serializer_output(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        bylaws = ByLaw.objects.get_bylaws_to_display().order_by("source_id")
+        expected = ByLawSerializer(bylaws, many=True).data
+        results = response.json()["results"]
+        self.assertEqual(
+            results, [{**bylaw, "midpoint": list(bylaw["midpoint"])} for bylaw in expected]
+        )
+
+    def test_list_filters_by_type(self):
+        response = self.client.get(self.url, {"type": "rp"})
+        results = response.json()["results"]
+        self.assertEqual([bylaw["source_id"] for bylaw in results], [2])
+
+    def test_list_filters_by_location(self):
+        response = self.client.get(self.url, {"lat": 43.6532, "lng": -79.3832})
+        self.assertEqual(response.json()["count"], 2)
+        response = self.client.get(self.url, {"lat": 43.7532, "lng": -79.3832})
+        self.assertEqual(response.json()["count"], 0)
+
+    def test_list_grouped_by_schedule(self):
+        response = self.client.get(
+            self.url,
+            {"type": "all", "group": "schedule", "lat": 43.6532, "lng": -79.3832},
+        )
+        body = response.json()
+        self.assertEqual(body["count"], 2)
+        self.assertEqual([bylaw["source_id"] for bylaw in body["results"]["13"]], [1])
+        self.assertEqual([bylaw["source_id"] for bylaw in body["results"]["15"]], [2])
+
+    def test_list_filters_by_bounds(self):
+        response = self.client.get(
+            self.url, {"ne": "43.6540,-79.3790", "sw": "43.6520,-79.3800"}
+        )
+        self.assertEqual([bylaw["source_id"] for bylaw in response.json()["results"]], [2])
+
+    def test_list_filters_by_radius(self):
+        params = {"lat": 43.6532, "lng": -79.3832}
+        response = self.client.get(self.url, {**params, "radius": 0.2})
+        self.assertEqual(response.json()["count"], 0)
+        response = self.client.get(self.url, {**params, "radius": 1})
+        self.assertEqual(response.json()["count"], 2)
+
+    def test_list_invalid_location(self):
+        response = self.client.get(self.url, {"lat": "north", "lng": -79.3832})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"ne": "43.6", "sw": "43.6,-79.3"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"lat": 43.6, "lng": -79.3, "radius": 500})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_non_finite_or_out_of_range_location(self):
+        for params in [
+            {"lat": "inf", "lng": 1},
+            {"lat": "nan", "lng": 1},
+            {"lat": 95, "lng": 1},
+            {"lat": 43.6, "lng": -181},
+            {"lat": 43.6, "lng": -79.3, "radius": "nan"},
+            {"ne": "inf,1", "sw": "1,1"},
+            {"ne": "nan,1", "sw": "1,1"},
+            {"ne": "43.7,-79.3", "sw": "43.6,-inf"},
+        ]:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_list_rejects_large_or_inverted_bounds(self):
+        for params in [
+            {"ne": "90,180", "sw": "-90,-180"},
+            {"ne": "43.70,-79.30", "sw": "43.60,-79.90"},
+            {"ne": "43.6520,-79.3800", "sw": "43.6540,-79.3790"},
+            {"ne": "43.6540,-79.3790", "sw": "43.6540,-79.3800"},
+        ]:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_list_filters_by_time(self):
+        # Monday 8pm and Monday 10am Toronto time
+        response = self.client.get(self.url, {"at": "2026-10-19T20:00"})
+        self.assertEqual([bylaw["source_id"] for bylaw in response.json()["results"]], [1])
+        response = self.client.get(self.url, {"at": "2026-10-19T14:00:00Z"})
+        self.assertEqual(response.json()["count"], 2)
+        response = self.client.get(self.url, {"at": "now"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_includes_unknown_times(self):
+        ByLaw.objects.filter(source_id=2).update(active_times=None)
+        DatasetVersion.objects.bump()
+        response = self.client.get(self.url, {"at": "2026-10-19T20:00"})
+        self.assertEqual(response.json()["count"], 2)
+
+    def test_list_invalid_time(self):
+        response = self.client.get(self.url, {"at": "tuesday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(USE_POSTGIS=True)
+    def test_postgis_ignored_without_postgresql(self):
+        response = self.client.get(self.url, {"lat": 43.6532, "lng": -79.3832})
+        self.assertEqual(response.json()["count"], 2)
+
+    def test_list_streamed(self):
+        response = self.client.get(self.url, {"stream": "true", "type": "np"})
+        self.assertTrue(response.streaming)
+        body = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([bylaw["source_id"] for bylaw in body], [1])
+        self.assertEqual(body[0]["highway"], {"name": "yonge street"})
+
+
+class ByLawNearestTests(ByLawAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("api:bylaw-nearest")
+
+    def test_nearest_sorted_by_distance(self):
+        # Yonge & Dundas, closer to the midpoint of bylaw 1 than Yonge & Queen
+        response = self.client.get(self.url, {"lat": 43.6560, "lng": -79.3808})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual([bylaw["source_id"] for bylaw in body], [1, 2])
+        self.assertLess(body[0]["distance"], body[1]["distance"])
+        self.assertAlmostEqual(body[0]["distance"], 200, delta=10)
+
+    def test_nearest_k_and_type(self):
+        params = {"lat": 43.6560, "lng": -79.3808}
+        response = self.client.get(self.url, {**params, "k": 1})
+        self.assertEqual([bylaw["source_id"] for bylaw in response.json()], [1])
+        response = self.client.get(self.url, {**params, "type": "rp"})
+        self.assertEqual([bylaw["source_id"] for bylaw in response.json()], [2])
+
+    def test_nearest_invalid_params(self):
+        for params in [
+            {"lat": 43.65},
+            {"lat": 43.65, "lng": -79.38, "k": 0},
+            {"lat": "nan", "lng": -79.38},
+            {"lat": 43.65, "lng": "inf"},
+            {"lat": 91, "lng": -79.38},
+            {"lat": 43.65, "lng": 200},
+        ]:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ByLawListCacheTests(ByLawAPITestCase):
+    def test_nearby_centers_share_cached_response(self):
+        first = self.client.get(self.url, {"lat": 43.65321, "lng": -79.38321})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, {"lat": 43.65329, "lng": -79.38329})
+        self.assertEqual(first.content, second.content)
+
+    def test_cache_keyed_by_other_params(self):
+        self.client.get(self.url, {"lat": 43.6532, "lng": -79.3832, "type": "np"})
+        response = self.client.get(self.url, {"lat": 43.6532, "lng": -79.3832, "type": "rp"})
+        self.assertEqual([bylaw["source_id"] for bylaw in response.json()["results"]], [2])
+
+    @override_settings(ALLOWED_HOSTS=["testserver", "internal"])
+    def test_cache_keyed_by_scheme_and_host(self):
+        self.client.get(self.url, {"limit": 1})
+        response = self.client.get(self.url, {"limit": 1}, HTTP_HOST="internal")
+        self.assertTrue(response.json()["next"].startswith("http://internal/"))
+        response = self.client.get(self.url, {"limit": 1}, secure=True)
+        self.assertTrue(response.json()["next"].startswith("https://testserver/"))
+
+    def test_bump_invalidates_cached_response(self):
+        params = {"lat": 43.6532, "lng": -79.3832}
+        self.client.get(self.url, params)
+        ByLaw.objects.filter(source_id=1).update(side="East")
+        DatasetVersion.objects.bump()
+        response = self.client.get(self.url, params)
+        sides = [bylaw["side"] for bylaw in response.json()["results"]]
+        self.assertEqual(sides, ["East", "North"])
+
+
+class ByLawConditionalGetTests(ByLawAPITestCase):
+    def test_matching_etag_returns_not_modified_without_queries(self):
+        response = self.client.get(self.url, {"type": "np"})
+        self.assertTrue(response.has_header("Last-Modified"))
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                self.url, {"type": "np"}, HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_depends_on_query_params(self):
+        np_etag = self.client.get(self.url, {"type": "np"})["ETag"]
+        rp_etag = self.client.get(self.url, {"type": "rp"})["ETag"]
+        self.assertNotEqual(np_etag, rp_etag)
+        response = self.client.get(self.url, {"type": "rp"}, HTTP_IF_NONE_MATCH=np_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_changes_after_bump(self):
+        etag = self.client.get(self.url)["ETag"]
+        DatasetVersion.objects.bump()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_now_validators_change_with_slot(self):
+        # A minute into a slot, after the dataset was last modified
+        start = datetime.now(timezone.utc).replace(minute=1, second=0, microsecond=0)
+        start += timedelta(hours=1)
+        with mock.patch("django.utils.timezone.now", return_value=start):
+            response = self.client.get(self.url, {"at": "now"})
+        validators = {
+            "HTTP_IF_NONE_MATCH": response["ETag"],
+            "HTTP_IF_MODIFIED_SINCE": response["Last-Modified"],
+        }
+        same_slot = start + timedelta(minutes=5)
+        with mock.patch("django.utils.timezone.now", return_value=same_slot):
+            response = self.client.get(self.url, {"at": "now"}, **validators)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        next_slot = start + timedelta(minutes=15)
+        with mock.patch("django.utils.timezone.now", return_value=next_slot):
+            response = self.client.get(self.url, {"at": "now"}, **validators)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response["ETag"], validators["HTTP_IF_NONE_MATCH"])
+            # Only an If-Modified-Since doesn't get a stale 304 either
+            response = self.client.get(
+                self.url,
+                {"at": "now"},
+                HTTP_IF_MODIFIED_SINCE=validators["HTTP_IF_MODIFIED_SINCE"],
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ClusterViewTests(ByLawAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("api:clusters")
+
+    def test_clusters_for_bounds(self):
+        response = self.client.get(
+            self.url, {"ne": "43.70,-79.30", "sw": "43.60,-79.45", "zoom": 10}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual(body["zoom"], 10)
+        self.assertEqual(len(body["clusters"]), 1)
+        self.assertEqual(body["clusters"][0]["schedules"], {"13": 1, "15": 1})
+        # Bigger than the list allows
+        response = self.client.get(
+            self.url, {"ne": "44,-79", "sw": "43,-80", "zoom": 5}
+        )
+        self.assertEqual(response.json()["clusters"][0]["count"], 2)
+
+    def test_clusters_require_location_and_zoom(self):
+        response = self.client.get(self.url, {"zoom": 10})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"lat": 43.65, "lng": -79.38})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_clusters_invalid_zoom(self):
+        params = {"lat": 43.65, "lng": -79.38}
+        for zoom in ["inf", "-inf", "nan", -1, 25]:
+            response = self.client.get(self.url, {**params, "zoom": zoom})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, zoom)
+        # Past the grid's finest level
+        response = self.client.get(self.url, {**params, "zoom": 20})
+        self.assertEqual(response.json()["zoom"], 16)
+
+
+class AsyncByLawListTests(ByLawAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_url = reverse("api:bylaw-list-async")
+
+    async def test_matches_sync_list(self):
+        params = {"lat": 43.6532, "lng": -79.3832, "type": "all", "group": "schedule"}
+        expected = (await self.async_client.get(self.url, params)).json()
+        response = await self.async_client.get(self.async_url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), expected)
+
+    async def test_paginates(self):
+        response = await self.async_client.get(self.async_url, {"limit": 1})
+        body = response.json()
+        self.assertEqual(body["count"], 2)
+        self.assertEqual([bylaw["source_id"] for bylaw in body["results"]], [1])
+        response = await self.async_client.get(body["next"])
+        body = response.json()
+        self.assertEqual([bylaw["source_id"] for bylaw in body["results"]], [2])
+        self.assertIsNone(body["next"])
+
+    async def test_invalid_location(self):
+        response = await self.async_client.get(self.async_url, {"lat": "north", "lng": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("detail", response.json())
+        for params in [{"lat": "inf", "lng": 1}, {"ne": "nan,1", "sw": "1,1"}]:
+            response = await self.async_client.get(self.async_url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_invalid_cursor(self):
+        response = await self.async_client.get(self.async_url, {"cursor": "zzz"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn("detail", response.json())
+
+    async def test_location_with_postgis(self):
+        # Like the real check, which reads the columns with a sync cursor
+        @async_unsafe
+        def is_enabled(using=None):
+            return True
+
+        with mock.patch("whereToPark.postgis.is_enabled", is_enabled), mock.patch(
+            "api.views.postgis_within", return_value=Q(source_id=1)
+        ):
+            response = await self.async_client.get(
+                self.async_url, {"lat": 43.6532, "lng": -79.3832}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([bylaw["source_id"] for bylaw in response.json()["results"]], [1])
+
+    async def test_bump_invalidates_cached_response(self):
+        params = {"type": "np"}
+        first = await self.async_client.get(self.async_url, params)
+        await ByLaw.objects.filter(source_id=1).aupdate(side="East")
+        cached = await self.async_client.get(self.async_url, params)
+        self.assertEqual(cached.content, first.content)
+        await sync_to_async(DatasetVersion.objects.bump)()
+        response = await self.async_client.get(self.async_url, params)
+        self.assertEqual(response.json()["results"][0]["side"], "East")
+
+    async def test_filters_by_time(self):
+        response = await self.async_client.get(self.async_url, {"at": "2026-10-19T20:00"})
+        self.assertEqual([bylaw["source_id"] for bylaw in response.json()["results"]], [1])
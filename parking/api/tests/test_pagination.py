@@ -0,0 +1,89 @@
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.pagination import KeysetPagination
+from api.spatial import VersionedIndex
+from whereToPark.models import ByLaw, DatasetVersion, Highway, Intersection
+
+
+class KeysetPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        highway = Highway.objects.create(name="yonge street")
+        intersection = Intersection.objects.create(
+            main_street=highway, lat=43.6525, lng=-79.3795, status="FS"
+        )
+        for schedule in ["15", "13"]:
+            for source_id in [3, 1, 2]:
+                ByLaw.objects.create(
+                    source_id=source_id,
+                    schedule=schedule,
+                    schedule_name="No Parking",
+                    highway=highway,
+                    boundary_start=intersection,
+                    boundary_end=intersection,
+                )
+        ByLaw.objects.update_midpoints()
+        DatasetVersion.objects.bump()
+
+    def setUp(self):
+        cache.clear()
+        VersionedIndex.reset_all()
+        self.url = reverse("api:bylaw-list")
+
+    def get_keys(self, body):
+        return [(bylaw["schedule"], bylaw["source_id"]) for bylaw in body["results"]]
+
+    def test_walks_pages_in_keyset_order(self):
+        keys = []
+        url = self.url + "?limit=4"
+        while url:
+            body = self.client.get(url).json()
+            keys.extend(self.get_keys(body))
+            url = body["next"]
+        self.assertEqual(
+            keys,
+            [("13", 1), ("13", 2), ("13", 3), ("15", 1), ("15", 2), ("15", 3)],
+        )
+
+    def test_previous_link(self):
+        first = self.client.get(self.url, {"limit": 2}).json()
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(self.get_keys(second), [("13", 3), ("15", 1)])
+        previous = self.client.get(second["previous"]).json()
+        self.assertEqual(self.get_keys(previous), self.get_keys(first))
+        self.assertIsNone(previous["previous"])
+
+    def test_count_can_be_skipped(self):
+        body = self.client.get(self.url, {"limit": 2}).json()
+        self.assertEqual(body["count"], 6)
+        body = self.client.get(self.url, {"limit": 2, "count": "false"}).json()
+        self.assertNotIn("count", body)
+        self.assertEqual(len(body["results"]), 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_position_q_bounds_schedule(self):
+        paginator = KeysetPagination()
+        queryset = ByLaw.objects.filter(paginator.get_position_q(["13", 2], False))
+        self.assertIn('"schedule" >= 13', str(queryset.query))
+        rows = queryset.order_by(*paginator.ordering)
+        self.assertEqual(
+            list(rows.values_list(*paginator.ordering)),
+            [("13", 3), ("15", 1), ("15", 2), ("15", 3)],
+        )
+        queryset = ByLaw.objects.filter(paginator.get_position_q(["15", 1], True))
+        self.assertIn('"schedule" <= 15', str(queryset.query))
+
+    def test_position_from_instance_and_dict(self):
+        paginator = KeysetPagination()
+        bylaw = ByLaw.objects.get(schedule="13", source_id=2)
+        self.assertEqual(paginator.get_position(bylaw), ["13", 2])
+        self.assertEqual(
+            paginator.get_position({"schedule": "15", "source_id": 1}), ["15", 1]
+        )
@@ -0,0 +1,28 @@
+import json
+
+from django.test import SimpleTestCase
+
+from api.renderers import FastJSONRenderer, stream_json_array
+
+
+class StreamJSONArrayTests(SimpleTestCase):
+    def test_stream_is_valid_json(self):
+        items = [{"source_id": idx, "midpoint": (43.6, -79.3)} for idx in range(7)]
+        chunks = list(stream_json_array(iter(items), batch_size=3))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(
+            json.loads(b"".join(chunks)),
+            [{"source_id": idx, "midpoint": [43.6, -79.3]} for idx in range(7)],
+        )
+
+    def test_stream_empty(self):
+        self.assertEqual(b"".join(stream_json_array(iter([]))), b"[]")
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_render(self):
+        rendered = FastJSONRenderer().render({"results": [{"side": None}]})
+        self.assertEqual(json.loads(rendered), {"results": [{"side": None}]})
+
+    def test_render_none(self):
+        self.assertEqual(FastJSONRenderer().render(None), b"")
@@ -0,0 +1,117 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+import brotli
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from api.snapshot import get_snapshot_path, parse_accept_encoding
+from api.tests.utils import create_downtown_bylaws
+from whereToPark.models import ByLaw, DatasetVersion
+
+
+class AcceptEncodingTests(SimpleTestCase):
+    def test_parse_accept_encoding(self):
+        accepted = parse_accept_encoding("gzip, deflate;q=0.5, br;q=0")
+        self.assertEqual(accepted, {"gzip", "deflate"})
+
+    def test_parse_empty_accept_encoding(self):
+        self.assertEqual(parse_accept_encoding(""), set())
+
+
+class SnapshotViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_downtown_bylaws()
+
+    def setUp(self):
+        cache.clear()
+        self.snapshot_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(SNAPSHOT_DIR=self.snapshot_dir.name)
+        self.settings_override.enable()
+        self.url = reverse("api:snapshot")
+        call_command("build_bylaw_snapshot", stdout=StringIO())
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.snapshot_dir.cleanup()
+
+    def test_command_writes_compressed_snapshots(self):
+        key = DatasetVersion.objects.current().key
+        with open(get_snapshot_path(key), "rb") as file:
+            body = file.read()
+        with open(get_snapshot_path(key, "gzip"), "rb") as file:
+            self.assertEqual(gzip.decompress(file.read()), body)
+        with open(get_snapshot_path(key, "br"), "rb") as file:
+            self.assertEqual(brotli.decompress(file.read()), body)
+        collection = json.loads(body)
+        self.assertEqual(len(collection["features"]), 2)
+        # The Queen Street bylaw only has its Yonge corner to place it at
+        self.assertEqual(
+            collection["features"][1]["geometry"]["coordinates"], [-79.3795, 43.6525]
+        )
+
+    def test_serves_brotli_when_accepted(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "br")
+        body = json.loads(brotli.decompress(b"".join(response.streaming_content)))
+        self.assertEqual(body["features"][0]["properties"]["highway"], "yonge street")
+
+    def test_serves_gzip_when_accepted(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_serves_identity_by_default(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response["Content-Type"], "application/geo+json")
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+        response = self.client.get(
+            self.url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_when_data_changes(self):
+        etag = self.client.get(self.url)["ETag"]
+        ByLaw.objects.update(side="East")
+        DatasetVersion.objects.bump()
+        call_command("build_bylaw_snapshot", stdout=StringIO())
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        # Older snapshots are purged once the new one is built
+        key = DatasetVersion.objects.current().key
+        self.assertEqual(os.listdir(self.snapshot_dir.name), [key])
+
+    def test_previous_snapshot_served_until_built(self):
+        etag = self.client.get(self.url)["ETag"]
+        DatasetVersion.objects.bump()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_unavailable_without_snapshot(self):
+        key = DatasetVersion.objects.current().key
+        shutil.rmtree(os.path.join(self.snapshot_dir.name, key))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        # Never built on a request
+        self.assertEqual(os.listdir(self.snapshot_dir.name), [])
+
+    def test_last_modified_from_snapshot(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header("Last-Modified"))
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
@@ -0,0 +1,239 @@
+import math
+import random
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, SimpleTestCase
+
+from api.spatial import (
+    BoundingBox,
+    ClusterGrid,
+    GridIndex,
+    KDTree,
+    VersionedIndex,
+    build_bylaw_index,
+    postgis_in_box,
+    postgis_within,
+)
+from api.tests.utils import create_downtown_bylaws
+from whereToPark.models import ByLaw, DatasetVersion, Highway, Intersection
+from whereToPark import postgis
+from whereToPark.postgis import update_bylaw_geometries
+
+
+class BoundingBoxTests(SimpleTestCase):
+    def test_from_center_matches_geodesic(self):
+        # Corners of the box geopy gives for 2km bearings 45/225 from Yonge & Queen
+        box = BoundingBox.from_center(43.6532, -79.3832, 2)
+        self.assertAlmostEqual(box.max_lat, 43.665927, delta=0.0001)
+        self.assertAlmostEqual(box.max_lng, -79.365666, delta=0.0001)
+        self.assertAlmostEqual(box.min_lat, 43.640470, delta=0.0001)
+        self.assertAlmostEqual(box.min_lng, -79.400727, delta=0.0001)
+
+    def test_snap_grows_box_to_grid(self):
+        box = BoundingBox(43.6531, -79.3839, 43.6559, -79.3811).snap(0.002)
+        self.assertEqual(box, (43.652, -79.384, 43.656, -79.38))
+
+    def test_from_corners_orders_bounds(self):
+        box = BoundingBox.from_corners((43.60, -79.50), (43.70, -79.30))
+        self.assertEqual(box, (43.60, -79.50, 43.70, -79.30))
+
+
+class GridIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = GridIndex(cell_size=0.01)
+        self.index.insert(1, 43.6532, -79.3832)
+        self.index.insert(2, 43.6612, -79.3957)
+        self.index.insert(3, 43.7001, -79.4163)
+
+    def test_query_returns_points_in_box(self):
+        ids = self.index.query(43.65, -79.40, 43.67, -79.38)
+        self.assertEqual(ids, {1, 2})
+
+    def test_query_is_exact_within_cells(self):
+        ids = self.index.query(43.6530, -79.3835, 43.6535, -79.3830)
+        self.assertEqual(ids, {1})
+
+    def test_query_with_large_box(self):
+        ids = self.index.query(-90, -180, 90, 180)
+        self.assertEqual(ids, {1, 2, 3})
+
+    def test_query_empty_box(self):
+        self.assertEqual(self.index.query(44.0, -80.0, 44.1, -79.9), set())
+
+
+class ClusterGridTests(SimpleTestCase):
+    def setUp(self):
+        self.grid = ClusterGrid(max_zoom=16).build(
+            [
+                (43.6532, -79.3832, "13"),
+                (43.6534, -79.3830, "15"),
+                (43.7001, -79.4163, "13"),
+            ]
+        )
+        self.city = BoundingBox(43.58, -79.64, 43.86, -79.11)
+
+    def test_low_zoom_aggregates_into_one_cluster(self):
+        clusters = self.grid.query(self.city, 8)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]["count"], 3)
+        self.assertEqual(clusters[0]["schedules"], {"13": 2, "15": 1})
+        self.assertAlmostEqual(clusters[0]["lat"], (43.6532 + 43.6534 + 43.7001) / 3)
+
+    def test_high_zoom_splits_clusters(self):
+        clusters = self.grid.query(self.city, 16)
+        self.assertEqual(sorted(cluster["count"] for cluster in clusters), [1, 1, 1])
+
+    def test_query_limited_to_box(self):
+        box = BoundingBox(43.69, -79.42, 43.71, -79.41)
+        clusters = self.grid.query(box, 14)
+        self.assertEqual([cluster["schedules"] for cluster in clusters], [{"13": 1}])
+
+    def test_zoom_clamped_to_levels(self):
+        self.assertEqual(self.grid.get_zoom_level(22.5), 16)
+        self.assertEqual(self.grid.get_zoom_level(-1), 0)
+
+
+class BylawIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        highway = Highway.objects.create(name="queen street")
+        cross_street_1 = Highway.objects.create(name="dowling avenue")
+        cross_street_2 = Highway.objects.create(name="jameson avenue")
+        start = Intersection.objects.create(
+            main_street=highway,
+            cross_street=cross_street_1,
+            lat=43.6392,
+            lng=-79.4380,
+            status="FS",
+        )
+        end = Intersection.objects.create(
+            main_street=highway,
+            cross_street=cross_street_2,
+            status="FNF",
+        )
+        cls.bylaw = ByLaw.objects.create(
+            source_id=1,
+            schedule="13",
+            schedule_name="No Parking",
+            highway=highway,
+            boundary_start=start,
+            boundary_end=end,
+            side="North",
+            between="dowling avenue and jameson avenue",
+        )
+        ByLaw.objects.update_midpoints()
+
+    def test_build_bylaw_index_uses_midpoints(self):
+        index = build_bylaw_index()
+        self.assertEqual(len(index), 1)
+        self.assertEqual(
+            index.query(43.63, -79.44, 43.64, -79.43), {self.bylaw.id}
+        )
+
+    def test_versioned_index_rebuilds_after_bump(self):
+        cache.clear()
+        builds = []
+        holder = VersionedIndex(lambda: builds.append(1) or len(builds))
+        self.assertEqual(holder.get(), 1)
+        self.assertEqual(holder.get(), 1)
+        DatasetVersion.objects.bump()
+        self.assertEqual(holder.get(), 2)
+
+    def test_versioned_index_rebuilds_when_version_number_repeats(self):
+        cache.clear()
+        builds = []
+        holder = VersionedIndex(lambda: builds.append(1) or len(builds))
+        DatasetVersion.objects.bump()
+        self.assertEqual(holder.get(), 1)
+        # Recreated data starting from the same version number
+        DatasetVersion.objects.all().delete()
+        DatasetVersion.objects.bump()
+        self.assertEqual(holder.get(), 2)
+        VersionedIndex.reset_all()
+        self.assertEqual(holder.get(), 3)
+
+
+@skipUnless(
+    connection.vendor == "postgresql" and settings.USE_POSTGIS,
+    "Needs PostgreSQL with USE_POSTGIS",
+)
+class PostGISFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_downtown_bylaws()
+        update_bylaw_geometries()
+
+    def test_box_overlapping_segment(self):
+        # Covers the north end of the segment but not its midpoint
+        box = BoundingBox(43.6550, -79.3820, 43.6570, -79.3800)
+        self.assertEqual(ByLaw.objects.filter(postgis_in_box(box)).count(), 1)
+        box = BoundingBox(43.6600, -79.3820, 43.6700, -79.3800)
+        self.assertEqual(ByLaw.objects.filter(postgis_in_box(box)).count(), 0)
+
+    def test_within_radius_of_segment(self):
+        # Queen & Bay is ~300m west of the south end of the segment, which is also
+        # where the Queen Street bylaw's point is
+        self.assertEqual(
+            ByLaw.objects.filter(postgis_within(43.6525, -79.3832, 0.4)).count(), 2
+        )
+        self.assertEqual(
+            ByLaw.objects.filter(postgis_within(43.6525, -79.3832, 0.2)).count(), 0
+        )
+
+
+class PostGISEnabledTests(SimpleTestCase):
+    def get_connection(self, geometry_columns):
+        using = mock.MagicMock(vendor="postgresql", alias="postgis-test")
+        cursor = using.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (geometry_columns,)
+        self.addCleanup(postgis.checked_aliases.discard, using.alias)
+        return using
+
+    def test_disabled_by_setting(self):
+        with self.settings(USE_POSTGIS=False):
+            self.assertFalse(postgis.is_enabled(self.get_connection(0)))
+
+    def test_missing_columns_fail_loudly(self):
+        with self.settings(USE_POSTGIS=True):
+            with self.assertRaises(ImproperlyConfigured):
+                postgis.is_enabled(self.get_connection(0))
+            self.assertTrue(postgis.is_enabled(self.get_connection(2)))
+
+
+class KDTreeTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.points = [
+            (rng.uniform(43.58, 43.85), rng.uniform(-79.64, -79.12), pk)
+            for pk in range(2000)
+        ]
+        self.tree = KDTree(self.points)
+
+    def brute_force(self, lat, lng, k):
+        return sorted(
+            (math.dist(self.tree.project(lat, lng), self.tree.project(p_lat, p_lng)), pk)
+            for p_lat, p_lng, pk in self.points
+        )[:k]
+
+    def test_query_matches_brute_force(self):
+        for lat, lng in [(43.6532, -79.3832), (43.70, -79.50), (43.50, -79.00)]:
+            result = self.tree.query(lat, lng, 10)
+            expected = self.brute_force(lat, lng, 10)
+            self.assertEqual([pk for _, pk in result], [pk for _, pk in expected])
+            for (distance, _), (expected_distance, _) in zip(result, expected):
+                self.assertAlmostEqual(distance, expected_distance)
+
+    def test_distance_in_km(self):
+        # Yonge & Queen to Yonge & Dundas is ~400m
+        tree = KDTree([(43.6560, -79.3808, 1)])
+        ((distance, pk),) = tree.query(43.6525, -79.3795, 1)
+        self.assertEqual(pk, 1)
+        self.assertAlmostEqual(distance, 0.40, delta=0.01)
+
+    def test_k_larger_than_tree(self):
+        self.assertEqual(len(KDTree(self.points[:3]).query(43.65, -79.38, 10)), 3)
+        self.assertEqual(KDTree([]).query(43.65, -79.38, 10), [])
@@ -0,0 +1,115 @@
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from api.tiles import (
+    Layer,
+    encode_geometry,
+    get_tile_path,
+    tile_bounds,
+    to_tile_coords,
+    POINT,
+)
+from api.tests.utils import create_downtown_bylaws
+from whereToPark.models import DatasetVersion
+
+
+class TileEncodingTests(SimpleTestCase):
+    def test_encode_point_geometry(self):
+        # Example from the vector tile spec
+        self.assertEqual(encode_geometry([(25, 17)]), [9, 50, 34])
+
+    def test_encode_linestring_geometry(self):
+        self.assertEqual(
+            encode_geometry([(2, 2), (2, 10), (10, 10)]), [9, 4, 4, 18, 0, 16, 16, 0]
+        )
+
+    def test_tile_bounds_contains_toronto(self):
+        min_lat, min_lng, max_lat, max_lng = tile_bounds(14, 4579, 5979)
+        self.assertTrue(min_lat <= 43.6532 <= max_lat)
+        self.assertTrue(min_lng <= -79.3832 <= max_lng)
+
+    def test_to_tile_coords_within_extent(self):
+        x, y = to_tile_coords(14, 4579, 5979, 43.6532, -79.3832)
+        self.assertTrue(0 <= x <= 4096)
+        self.assertTrue(0 <= y <= 4096)
+
+    def test_layer_dedupes_keys_and_values(self):
+        layer = Layer("bylaws")
+        layer.add_feature(1, POINT, [(1, 1)], {"schedule": "13", "side": None})
+        layer.add_feature(2, POINT, [(2, 2)], {"schedule": "13"})
+        self.assertEqual(list(layer.keys), ["schedule"])
+        self.assertEqual(list(layer.values), ["13"])
+        self.assertIn(b"bylaws", layer.encode())
+
+
+class TileViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_downtown_bylaws()
+
+    def setUp(self):
+        cache.clear()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(TILE_CACHE_DIR=self.cache_dir.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.cache_dir.cleanup()
+
+    def test_tile_is_encoded_and_cached(self):
+        url = reverse("api:tile", kwargs={"z": 14, "x": 4579, "y": 5979})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertIn(b"bylaws", response.content)
+        self.assertIn(b"segments", response.content)
+        key = DatasetVersion.objects.current().key
+        self.assertTrue(os.path.exists(get_tile_path(key, 14, 4579, 5979)))
+
+    def test_empty_tile(self):
+        url = reverse("api:tile", kwargs={"z": 14, "x": 0, "y": 0})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+    def test_deep_zoom_tile_not_cached(self):
+        url = reverse("api:tile", kwargs={"z": 18, "x": 73269, "y": 95669})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"bylaws", response.content)
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+    def test_out_of_range_tile(self):
+        url = reverse("api:tile", kwargs={"z": 1, "x": 2, "y": 0})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_bump_purges_stale_tiles(self):
+        url = reverse("api:tile", kwargs={"z": 14, "x": 4579, "y": 5979})
+        self.client.get(url)
+        old_key = DatasetVersion.objects.current().key
+        DatasetVersion.objects.bump()
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir.name, old_key)))
+
+    def test_repeated_version_number_purges_stale_tiles(self):
+        DatasetVersion.objects.bump()
+        url = reverse("api:tile", kwargs={"z": 14, "x": 4579, "y": 5979})
+        self.client.get(url)
+        old = DatasetVersion.objects.current()
+        # A rebuilt database counts versions from the start again
+        DatasetVersion.objects.update(version=old.version - 1)
+        new = DatasetVersion.objects.bump()
+        self.assertEqual(new.version, old.version)
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir.name, old.key)))
+
+    def test_matching_etag_returns_not_modified(self):
+        url = reverse("api:tile", kwargs={"z": 14, "x": 4579, "y": 5979})
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
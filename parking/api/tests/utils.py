@@ -0,0 +1,48 @@
+from whereToPark.models import ByLaw, Highway, Intersection
+from whereToPark.schedules import compile_schedule
+
+
+def create_downtown_bylaws():
+    """
+    Creates the bylaws most api tests run against: No Parking on Yonge Street from Queen
+    to Dundas, both corners geocoded, and Restricted Parking on Queen Street from Yonge
+    to a corner the geocoder didn't find. Returns them in that order.
+    """
+    yonge = Highway.objects.create(name="yonge street")
+    queen = Highway.objects.create(name="queen street")
+    dundas = Highway.objects.create(name="dundas street")
+    start = Intersection.objects.create(
+        main_street=yonge, cross_street=queen, lat=43.6525, lng=-79.3795, status="FS"
+    )
+    end = Intersection.objects.create(
+        main_street=yonge, cross_street=dundas, lat=43.6560, lng=-79.3808, status="FS"
+    )
+    not_found = Intersection.objects.create(
+        main_street=queen, cross_street=None, status="FNF"
+    )
+    no_parking = ByLaw.objects.create(
+        source_id=1,
+        schedule="13",
+        schedule_name="No Parking",
+        highway=yonge,
+        boundary_start=start,
+        boundary_end=end,
+        side="West",
+        between="queen street and dundas street",
+        times_and_or_days="anytime",
+        active_times=compile_schedule("anytime"),
+    )
+    restricted = ByLaw.objects.create(
+        source_id=2,
+        schedule="15",
+        schedule_name="Parking for Restricted Periods",
+        highway=queen,
+        boundary_start=start,
+        boundary_end=not_found,
+        side="North",
+        times_and_or_days="8:00 a.m. to 6:00 p.m., mon. to fri.",
+        active_times=compile_schedule("8:00 a.m. to 6:00 p.m., mon. to fri."),
+        max_period_permitted="1 hour",
+    )
+    ByLaw.objects.update_midpoints()
+    return no_parking, restricted
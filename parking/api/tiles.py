@@ -0,0 +1,256 @@
+"""
+Mapbox Vector Tile encoding and the on-disk tile cache for bylaw data.
+
+Tiles are encoded by hand following the vector tile spec
+(https://github.com/mapbox/vector-tile-spec/tree/master/2.1) since we only need
+points and two-point line strings.
+"""
+
+import math
+import os
+
+from django.conf import settings
+from django.db.models import Q
+
+from api.storage import purge_stale_versions, write_atomic
+from whereToPark.models import ByLaw
+
+EXTENT = 4096
+BUFFER = 64
+# Segments are fetched using their midpoint so pad the box to catch ones that cross
+# into a tile from a neighbour (~500m, longer than most bylaw segments)
+SEGMENT_MARGIN = 0.005
+
+BYLAW_FIELDS = [
+    "id",
+    "source_id",
+    "schedule",
+    "side",
+    "times_and_or_days",
+    "max_period_permitted",
+    "highway__name",
+    "mid_lat",
+    "mid_lng",
+    "boundary_start__lat",
+    "boundary_start__lng",
+    "boundary_start__status",
+    "boundary_end__lat",
+    "boundary_end__lng",
+    "boundary_end__status",
+]
+PROPERTY_FIELDS = [
+    ("source_id", "source_id"),
+    ("schedule", "schedule"),
+    ("side", "side"),
+    ("times_and_or_days", "times_and_or_days"),
+    ("max_period_permitted", "max_period_permitted"),
+    ("highway", "highway__name"),
+]
+
+# Geometry types and commands from the vector tile spec
+POINT = 1
+LINESTRING = 2
+MOVE_TO = 1
+LINE_TO = 2
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= 22 and 0 <= x < 2**z and 0 <= y < 2**z
+
+
+def tile_bounds(z, x, y):
+    """
+    Returns (min_lat, min_lng, max_lat, max_lng) covered by the given web mercator tile.
+    """
+    n = 2**z
+    min_lng = x / n * 360 - 180
+    max_lng = (x + 1) / n * 360 - 180
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def to_tile_coords(z, x, y, lat, lng):
+    """Projects lat/lng to integer coordinates within the tile extent."""
+    n = 2**z
+    tile_x = (lng + 180) / 360 * n
+    lat_rad = math.radians(lat)
+    tile_y = (1 - math.asinh(math.tan(lat_rad)) / math.pi) / 2 * n
+    return round((tile_x - x) * EXTENT), round((tile_y - y) * EXTENT)
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, value):
+    return _key(field, 2) + _varint(len(value)) + value
+
+
+def _varint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b"".join(_varint(value) for value in values))
+
+
+def encode_geometry(points):
+    """
+    Encodes a list of (x, y) tile coordinates as a MoveTo followed by LineTo commands
+    for the remaining points.
+    """
+    geometry = []
+    cursor_x, cursor_y = 0, 0
+    for idx, (x, y) in enumerate(points):
+        if idx == 0:
+            geometry.append(MOVE_TO | (1 << 3))
+        elif idx == 1:
+            geometry.append(LINE_TO | ((len(points) - 1) << 3))
+        geometry.extend([_zigzag(x - cursor_x), _zigzag(y - cursor_y)])
+        cursor_x, cursor_y = x, y
+    return geometry
+
+
+def encode_value(value):
+    if isinstance(value, bool):
+        return _varint_field(7, int(value))
+    if isinstance(value, int):
+        return _varint_field(6, _zigzag(value))
+    return _bytes_field(1, str(value).encode())
+
+
+class Layer:
+    """Collects features for a single vector tile layer."""
+
+    def __init__(self, name):
+        self.name = name
+        self.features = []
+        self.keys = {}
+        self.values = {}
+
+    def add_feature(self, feature_id, geom_type, points, properties):
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            tags.append(self.values.setdefault(value, len(self.values)))
+        feature = _varint_field(1, feature_id)
+        feature += _packed_field(2, tags)
+        feature += _varint_field(3, geom_type)
+        feature += _packed_field(4, encode_geometry(points))
+        self.features.append(feature)
+
+    def encode(self):
+        layer = _varint_field(15, 2) + _bytes_field(1, self.name.encode())
+        for feature in self.features:
+            layer += _bytes_field(2, feature)
+        for key in self.keys:
+            layer += _bytes_field(3, key.encode())
+        for value in self.values:
+            layer += _bytes_field(4, encode_value(value))
+        layer += _varint_field(5, EXTENT)
+        return layer
+
+
+def encode_tile(layers):
+    return b"".join(
+        _bytes_field(3, layer.encode()) for layer in layers if layer.features
+    )
+
+
+def build_tile(z, x, y):
+    """
+    Encodes the bylaws within the given tile. The ``bylaws`` layer holds a point at
+    each bylaw midpoint and the ``segments`` layer a line from ``boundary_start`` to
+    ``boundary_end`` for bylaws with both boundaries geocoded.
+    """
+    min_lat, min_lng, max_lat, max_lng = tile_bounds(z, x, y)
+    buffer_lat = (max_lat - min_lat) * BUFFER / EXTENT + SEGMENT_MARGIN
+    buffer_lng = (max_lng - min_lng) * BUFFER / EXTENT + SEGMENT_MARGIN
+    box_q = Q(
+        mid_lat__gte=min_lat - buffer_lat,
+        mid_lat__lte=max_lat + buffer_lat,
+        mid_lng__gte=min_lng - buffer_lng,
+        mid_lng__lte=max_lng + buffer_lng,
+    )
+    rows = (
+        ByLaw.objects.get_bylaws_to_display()
+        .filter(box_q)
+        .order_by("id")
+        .values(*BYLAW_FIELDS)
+    )
+
+    points = Layer("bylaws")
+    segments = Layer("segments")
+    min_coord, max_coord = -BUFFER, EXTENT + BUFFER
+    for row in rows:
+        properties = {key: row[field] for key, field in PROPERTY_FIELDS}
+        point = to_tile_coords(z, x, y, row["mid_lat"], row["mid_lng"])
+        if all(min_coord <= coord <= max_coord for coord in point):
+            points.add_feature(row["id"], POINT, [point], properties)
+        if (
+            row["boundary_start__status"] == "FS"
+            and row["boundary_end__status"] == "FS"
+        ):
+            start = to_tile_coords(
+                z, x, y, row["boundary_start__lat"], row["boundary_start__lng"]
+            )
+            end = to_tile_coords(
+                z, x, y, row["boundary_end__lat"], row["boundary_end__lng"]
+            )
+            if start != end:
+                segments.add_feature(row["id"], LINESTRING, [start, end], properties)
+    return encode_tile([points, segments])
+
+
+def get_tile_path(key, z, x, y):
+    return os.path.join(settings.TILE_CACHE_DIR, key, str(z), str(x), f"{y}.mvt")
+
+
+def get_tile(key, z, x, y):
+    """
+    Returns the encoded tile for the dataset version ``key``, reading it from the disk
+    cache or building and caching it on a miss. Empty tiles and tiles zoomed in past
+    ``TILE_CACHE_MAX_ZOOM`` are built every time so the cache can't grow to every tile
+    a client can ask for.
+    """
+    if z > settings.TILE_CACHE_MAX_ZOOM:
+        return build_tile(z, x, y)
+
+    path = get_tile_path(key, z, x, y)
+    try:
+        with open(path, "rb") as file:
+            return file.read()
+    except FileNotFoundError:
+        pass
+
+    tile = build_tile(z, x, y)
+    if tile:
+        write_atomic(path, tile)
+    return tile
+
+
+def purge_tile_cache(sender=None, key=None, **kwargs):
+    """
+    Removes cached tiles for every dataset version other than ``key``. Connected to
+    ``dataset_changed`` so imports clear out stale tiles.
+    """
+    purge_stale_versions(settings.TILE_CACHE_DIR, key)
@@ -10,5 +10,9 @@ router.register(r"bylaws", views.ByLawViewSet)
 # Additionally, we include login URLs for the browsable API.
 urlpatterns = [
     path("", include(router.urls)),
+    path("async/bylaws/", views.bylaw_list, name="bylaw-list-async"),
+    path("clusters/", views.ClusterView.as_view(), name="clusters"),
+    path("snapshot/bylaws.geojson", views.snapshot, name="snapshot"),
+    path("tiles/<int:z>/<int:x>/<int:y>.mvt", views.tile, name="tile"),
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
 ]
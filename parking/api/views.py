@@ -1,89 +1,555 @@
-from geopy import distance
+import hashlib
+import heapq
+import itertools
+import math
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.models import User, Group
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
+from django.views.decorators.http import condition
 from rest_framework import viewsets
 from rest_framework import filters
 from rest_framework import generics
 from rest_framework import permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from api.pagination import KeysetPagination
+from api.renderers import FastJSONRenderer, stream_json_array
+from api.schedules import schedule_index
 from api.serializers import (
+    BYLAW_ROW_FIELDS,
     ByLawSerializer,
     HighwaySerializer,
     IntersectionSerializer,
+    bylaw_row_to_dict,
+)
+from api.snapshot import (
+    find_snapshot,
+    get_snapshot_etag,
+    get_snapshot_last_modified,
+    get_snapshot_path,
+    negotiate_encoding,
 )
-from whereToPark.models import ByLaw
+from api.spatial import (
+    BoundingBox,
+    bylaw_index,
+    cluster_grid,
+    nearest_index,
+    postgis_in_box,
+    postgis_within,
+    snap_to_grid,
+)
+from api.tiles import get_tile, is_valid_tile
+from whereToPark import postgis
+from whereToPark.conditional import dataset_condition
+from whereToPark.models import ByLaw, DatasetVersion
+from whereToPark.schedules import TIMEZONE, get_slot
 from django.db.models import Q
 
 
 class BoundingBoxFilterBackend(filters.BaseFilterBackend):
+    """
+    Filters bylaws to those with a midpoint inside a bounding box. The box is either
+    given exactly with ``ne`` and ``sw`` ("lat,lng") corners, ie. the map viewport, or
+    computed from a ``lat``/``lng`` center and an optional ``radius`` in kms.
+    """
+
+    default_radius = 2
+    max_radius = 25
+    # Largest ne/sw box in degrees either way, a little over the box of a max_radius
+    # circle at Toronto's latitude (0.32 by 0.44 degrees)
+    max_span = 0.5
 
-    def get_box_from_center(self, lat, lng):
+    def get_box_from_center(self, lat, lng, radius=default_radius):
         """
         Takes in lat and lng of center on map.
-        Returns list of four coordinates (tuples) representing the box from given center:
-        [(NE_LAT, NE_LNG), (SW_LAT, SW_LNG)]
+        Returns the ``BoundingBox`` whose corners are ``radius`` kms from the center.
         """
-        ne_point = distance.distance(kilometers=2).destination((lat, lng), bearing=45)
-        sw_point = distance.distance(kilometers=2).destination((lat, lng), bearing=225)
-        return [ne_point, sw_point]
+        return BoundingBox.from_center(lat, lng, radius)
 
-    def get_box_q_obj(self, box):
+    def parse_point(self, value):
+        lat, lng = value.split(",")
+        return self.parse_lat_lng(lat, lng)
+
+    def parse_lat_lng(self, lat, lng):
+        """
+        Returns ``lat`` and ``lng`` as floats. Raises ``ValueError`` if they aren't
+        numbers and ``ParseError`` if they aren't finite or are out of range.
+        """
+        lat, lng = float(lat), float(lng)
+        if not (math.isfinite(lat) and math.isfinite(lng)):
+            raise ParseError("Invalid location, lat/lng must be finite numbers")
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ParseError("Invalid location, lat must be within ±90 and lng ±180")
+        return lat, lng
+
+    def get_bounding_box(self, request, max_span=max_span):
+        """
+        Returns the ``BoundingBox`` requested in the query params or None if no
+        location was given. Locations are snapped to a ``BYLAW_CACHE_GRID_SIZE`` grid
+        so nearby requests share the same box (and cached response). ``ne``/``sw``
+        boxes wider or taller than ``max_span`` degrees (unless None) are rejected.
         """
-        Given NE and SW points X kms from center point, return Q object
-        to filter ByLaws by these two points (ie. contained within X kms radius).
+        params = request.query_params
+        if params.get("ne") and params.get("sw"):
+            try:
+                ne = self.parse_point(params["ne"])
+                sw = self.parse_point(params["sw"])
+                if ne[0] <= sw[0] or ne[1] <= sw[1]:
+                    raise ParseError("Invalid location, ne must be north east of sw")
+                if max_span is not None and (
+                    ne[0] - sw[0] > max_span or ne[1] - sw[1] > max_span
+                ):
+                    raise ParseError(
+                        f"ne/sw can't be more than {max_span} degrees apart"
+                    )
+                box = BoundingBox.from_corners(ne, sw)
+                return box.snap(settings.BYLAW_CACHE_GRID_SIZE)
+            except ValueError:
+                raise ParseError("Invalid location, expected lat/lng numbers")
+        circle = self.get_circle(request)
+        if circle is not None:
+            return self.get_box_from_center(*circle)
+        return None
 
-        ``box`` - list of two ``geopy.point.Point``, NE and SW points
+    def get_circle(self, request):
+        """
+        Returns the (lat, lng, radius) requested in the query params, with the center
+        snapped like the bounding box, or None if no center was given or the location
+        was given as ``ne``/``sw`` corners.
         """
-        min_lat = box[1].latitude
-        min_lng = box[1].longitude
-        max_lat = box[0].latitude
-        max_lng = box[0].longitude
+        params = request.query_params
+        if params.get("ne") and params.get("sw"):
+            return None
+        if not (params.get("lat") and params.get("lng")):
+            return None
+        grid_size = settings.BYLAW_CACHE_GRID_SIZE
+        try:
+            radius = float(params.get("radius", self.default_radius))
+            lat, lng = self.parse_lat_lng(params["lat"], params["lng"])
+            if not 0 < radius <= self.max_radius:
+                raise ParseError(f"radius must be between 0 and {self.max_radius}")
+            return snap_to_grid(lat, grid_size), snap_to_grid(lng, grid_size), radius
+        except ValueError:
+            raise ParseError("Invalid location, expected lat/lng numbers")
 
-        # Filter won't be exact since we attempt to match either ``boundary_start`` or ``boundary_end``
-        # intersections rather than the midpoint (cached property on model, not filterable)
-        start_q = Q(
-            boundary_start__lat__gte=min_lat,
-            boundary_start__lat__lte=max_lat,
-            boundary_start__lng__gte=min_lng,
-            boundary_start__lng__lte=max_lng,
+    def get_box_q_obj(self, box):
+        """
+        Given a ``BoundingBox``, return Q object to filter ByLaws to those inside it.
+        """
+        # Filter on the stored midpoint so this is a single range scan on the
+        # (mid_lat, mid_lng) index without joining intersections
+        return Q(
+            mid_lat__gte=box.min_lat,
+            mid_lat__lte=box.max_lat,
+            mid_lng__gte=box.min_lng,
+            mid_lng__lte=box.max_lng,
         )
-        end_q = Q(
-            boundary_end__lat__gte=min_lat,
-            boundary_end__lat__lte=max_lat,
-            boundary_end__lng__gte=min_lng,
-            boundary_end__lng__lte=max_lng,
+
+    def filter_queryset(self, request, queryset, view):
+        bounding_box = self.get_bounding_box(request)
+        if bounding_box is None:
+            return queryset
+        index = bylaw_index.get() if use_bylaw_index() else None
+        return self.filter_by_box(
+            queryset, bounding_box, index, circle=self.get_circle(request)
         )
 
-        return start_q | end_q
+    def filter_by_box(self, queryset, bounding_box, index=None, circle=None):
+        if postgis.is_enabled():
+            # GiST indexed geometry of the whole segment, radius queries get the
+            # exact circle rather than its box
+            if circle is not None:
+                return queryset.filter(postgis_within(*circle))
+            return queryset.filter(postgis_in_box(bounding_box))
+        if index is not None:
+            # Look up candidate ids in the in-process grid index so the database
+            # only has to do a primary key fetch
+            return queryset.filter(pk__in=index.query(*bounding_box))
+        return queryset.filter(self.get_box_q_obj(bounding_box))
 
-    def filter_queryset(self, request, queryset, view):
-        lat = request.query_params.get("lat")
-        lng = request.query_params.get("lng")
-        filter_qs = Q()
-        if lat and lng:
-            bounding_box = self.get_box_from_center(lat, lng)
-            filter_qs = self.get_box_q_obj(bounding_box)
 
-        return queryset.filter(filter_qs)
+def use_bylaw_index():
+    return settings.BYLAW_SPATIAL_INDEX and not postgis.is_enabled()
 
 
 class TypeFilterBackend(filters.BaseFilterBackend):
-    def filter_queryset(self, request, queryset, view):
+    def get_schedule(self, request):
+        """Returns the schedule for the ``type`` requested, None for all bylaws."""
         bylaw_type = request.query_params.get("type")
-        if not bylaw_type:
-            return queryset
+        if not bylaw_type or bylaw_type == "all":
+            return None
 
         if bylaw_type == "np":
-            return queryset.filter(schedule="13")
+            return "13"
         else:
-            return queryset.filter(schedule="15")
+            return "15"
+
+    def filter_queryset(self, request, queryset, view):
+        schedule = self.get_schedule(request)
+        if schedule is None:
+            return queryset
+        return queryset.filter(schedule=schedule)
 
 
-class ByLawViewSet(viewsets.ReadOnlyModelViewSet):
+class TimeFilterBackend(filters.BaseFilterBackend):
+    """
+    Filters bylaws to those in effect at the ``at`` query param, an ISO 8601 timestamp
+    (Toronto time if it has no offset) or ``now``. Bylaws whose times couldn't be
+    parsed are always included.
+    """
+
+    def get_slot(self, request):
+        """Returns the slot of the week requested or None if ``at`` wasn't given."""
+        at = request.query_params.get("at")
+        if not at:
+            return None
+        if at == "now":
+            return get_slot(timezone.now())
+        try:
+            when = parse_datetime(at)
+        except ValueError:
+            when = None
+        if when is None:
+            raise ParseError("Invalid at, expected an ISO 8601 timestamp or now")
+        if timezone.is_naive(when):
+            when = when.replace(tzinfo=TIMEZONE)
+        return get_slot(when)
+
+    def filter_queryset(self, request, queryset, view):
+        slot = self.get_slot(request)
+        if slot is None:
+            return queryset
+        return self.filter_by_slot(queryset, slot, schedule_index.get())
+
+    def filter_by_slot(self, queryset, slot, index):
+        active, inactive = index.split(slot)
+        # Whichever list of ids is shorter keeps the query small
+        if len(inactive) < len(active):
+            return queryset.exclude(pk__in=inactive)
+        return queryset.filter(pk__in=active)
+
+
+class DatasetConditionalMixin:
+    """
+    Adds ETag/Last-Modified headers derived from the dataset version to responses and
+    answers matching conditional requests with a 304 before any queries run.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        return dataset_condition(super().dispatch)(request, *args, **kwargs)
+
+
+def get_list_cache_key(request, bounding_box, version_key):
+    """
+    Returns the cache key for a rendered bylaw listing, built from the URL the request
+    was made to, the snapped bounding box, the remaining query params and the dataset
+    version key.
+    """
+    params = sorted(
+        (key, value)
+        for key, value in request.query_params.items()
+        if key not in ByLawViewSet.location_params and key != "at"
+    )
+    # Timestamps are keyed by their slot of the week so the whole slot shares an entry
+    slot = TimeFilterBackend().get_slot(request)
+    # Pagination links are absolute URLs back to the endpoint, so they're only valid
+    # for requests to the same scheme, host and path
+    key = (request.scheme, request.get_host(), request.path, bounding_box, slot, params)
+    digest = hashlib.md5(repr(key).encode()).hexdigest()
+    return f"bylaws:{version_key}:{digest}"
+
+
+def group_by_schedule(bylaws):
+    """
+    Groups bylaws by schedule so a client can get both No Parking (13) and
+    Restricted Parking (15) bylaws for an area from a single bounding box scan
+    (``?type=all&group=schedule``).
+    """
+    grouped = {"13": [], "15": []}
+    for bylaw in bylaws:
+        grouped.setdefault(bylaw["schedule"], []).append(bylaw)
+    return grouped
+
+
+class ByLawViewSet(DatasetConditionalMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that No Parking Bylaws to be viewed.
     """
 
-    queryset = ByLaw.objects.get_bylaws_to_display().order_by("source_id")
+    queryset = ByLaw.objects.get_bylaws_to_display().order_by("schedule", "source_id")
     serializer_class = ByLawSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [BoundingBoxFilterBackend, TypeFilterBackend]
+    filter_backends = [BoundingBoxFilterBackend, TypeFilterBackend, TimeFilterBackend]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    location_params = ["lat", "lng", "radius", "ne", "sw"]
+    default_nearest = 10
+    max_nearest = 100
+
+    def list(self, request, *args, **kwargs):
+        """
+        Serves JSON listings from the cache when possible. Responses are cached
+        rendered, keyed by the snapped bounding box, the remaining query params and the
+        dataset version, so an import invalidates every cached response at once.
+        """
+        if request.query_params.get("stream") == "true":
+            return self.stream_bylaws(request)
+        if not isinstance(request.accepted_renderer, FastJSONRenderer):
+            return self.list_bylaws(request)
+
+        bounding_box = BoundingBoxFilterBackend().get_bounding_box(request)
+        version_key = DatasetVersion.objects.current_key()
+        cache_key = get_list_cache_key(request, bounding_box, version_key)
+        content = cache.get(cache_key)
+        if content is None:
+            response = self.list_bylaws(request)
+            content = request.accepted_renderer.render(response.data)
+            cache.set(cache_key, content, settings.BYLAW_RESPONSE_CACHE_TIMEOUT)
+        return HttpResponse(content, content_type=request.accepted_renderer.media_type)
+
+    def list_bylaws(self, request):
+        """
+        Fast path for listing bylaws. Fetches only the columns ``ByLawSerializer`` needs
+        with ``values_list`` and maps each row straight to a dict, skipping the nested
+        serializers entirely. Output is the same as the serializer's.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        # Named rows so the keyset paginator can read the schedule/source_id cursor
+        rows = queryset.values_list(*BYLAW_ROW_FIELDS, named=True)
+        page = self.paginate_queryset(rows)
+        bylaws = [bylaw_row_to_dict(row) for row in (rows if page is None else page)]
+        if request.query_params.get("group") == "schedule":
+            bylaws = group_by_schedule(bylaws)
+        if page is not None:
+            return self.get_paginated_response(bylaws)
+        return Response(bylaws)
+
+    @action(detail=False)
+    def nearest(self, request):
+        """
+        Returns the ``k`` bylaws (10 by default) closest to ``lat``/``lng`` nearest
+        first, each with its ``distance`` in metres. Looked up in an in-process
+        KD-tree per schedule, ``type`` picks the schedule like in the list.
+        """
+        try:
+            lat, lng = BoundingBoxFilterBackend().parse_lat_lng(
+                request.query_params["lat"], request.query_params["lng"]
+            )
+            k = int(request.query_params.get("k", self.default_nearest))
+        except (KeyError, ValueError):
+            raise ParseError("lat and lng numbers are required, k must be an integer")
+        if not 0 < k <= self.max_nearest:
+            raise ParseError(f"k must be between 1 and {self.max_nearest}")
+
+        trees = nearest_index.get()
+        schedule = TypeFilterBackend().get_schedule(request)
+        schedules = list(trees) if schedule is None else [schedule]
+        matches = heapq.nsmallest(
+            k,
+            itertools.chain.from_iterable(
+                trees[schedule].query(lat, lng, k)
+                for schedule in schedules
+                if schedule in trees
+            ),
+        )
+
+        rows = (
+            ByLaw.objects.filter(pk__in=[pk for _, pk in matches])
+            .order_by()
+            .values_list("id", *BYLAW_ROW_FIELDS)
+        )
+        bylaws = {row[0]: bylaw_row_to_dict(row[1:]) for row in rows}
+        return Response(
+            [
+                {**bylaws[pk], "distance": round(distance * 1000, 1)}
+                for distance, pk in matches
+                if pk in bylaws
+            ]
+        )
+
+    def stream_bylaws(self, request):
+        """
+        Streams every matching bylaw as one JSON array (``?stream=true``), without
+        pagination. Rows are read from the database ``BYLAW_STREAM_CHUNK_SIZE`` at a time
+        and written out as they arrive so memory use stays flat however many match.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values_list(*BYLAW_ROW_FIELDS).iterator(
+            chunk_size=settings.BYLAW_STREAM_CHUNK_SIZE
+        )
+        bylaws = (bylaw_row_to_dict(row) for row in rows)
+        return StreamingHttpResponse(
+            stream_json_array(bylaws), content_type="application/json"
+        )
+
+
+async def bylaw_list(request):
+    """
+    Async version of the bylaw list for ASGI deployments. Takes the same params and
+    returns the same JSON as ``ByLawViewSet.list`` but awaits the cache and database
+    through the async ORM, so a single worker can have many map pans in flight instead
+    of tying up a process per slow query. The browsable API, ``?stream=true`` and
+    conditional GETs are only on the sync endpoint.
+    """
+    # Wrapped for ``query_params`` so the filter backends and paginator can be shared
+    request = Request(request)
+    renderer = FastJSONRenderer()
+    try:
+        bounding_box = BoundingBoxFilterBackend().get_bounding_box(request)
+        version_key = await DatasetVersion.objects.acurrent_key()
+        cache_key = get_list_cache_key(request, bounding_box, version_key)
+        content = await cache.aget(cache_key)
+        if content is None:
+            content = renderer.render(await alist_bylaws(request))
+            await cache.aset(cache_key, content, settings.BYLAW_RESPONSE_CACHE_TIMEOUT)
+    except APIException as error:
+        # Bad params or cursors, answered the way DRF answers them on the sync list
+        return HttpResponse(
+            renderer.render({"detail": error.detail}),
+            content_type=renderer.media_type,
+            status=error.status_code,
+        )
+    return HttpResponse(content, content_type=renderer.media_type)
+
+
+async def alist_bylaws(request):
+    """Async version of ``ByLawViewSet.list_bylaws``, returns the paginated data."""
+    queryset = ByLaw.objects.get_bylaws_to_display()
+    # Picking the location filter can need the sync ORM (building the index, checking
+    # the PostGIS columns), the queryset it returns is only run below
+    queryset = await sync_to_async(BoundingBoxFilterBackend().filter_queryset)(
+        request, queryset, None
+    )
+    queryset = TypeFilterBackend().filter_queryset(request, queryset, None)
+    slot = TimeFilterBackend().get_slot(request)
+    if slot is not None:
+        index = await sync_to_async(schedule_index.get)()
+        queryset = TimeFilterBackend().filter_by_slot(queryset, slot, index)
+
+    paginator = KeysetPagination()
+    rows = queryset.values_list(*BYLAW_ROW_FIELDS, named=True)
+    page = await paginator.apaginate_queryset(rows, request)
+    bylaws = [bylaw_row_to_dict(row) for row in page]
+    if request.query_params.get("group") == "schedule":
+        bylaws = group_by_schedule(bylaws)
+    return paginator.get_paginated_data(bylaws)
+
+
+class ClusterView(DatasetConditionalMixin, APIView):
+    """
+    API endpoint returning bylaw clusters for a map view. Takes the same location
+    params as the bylaw list (``ne``/``sw`` or ``lat``/``lng``/``radius``) plus the map
+    ``zoom`` and returns per-cell counts broken down by schedule, with the centroid of
+    each cell's bylaws as its coordinates.
+    """
+
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    # Deepest zoom of Mapbox GL maps
+    max_zoom = 24
+
+    def get(self, request):
+        # Counts come from the cluster grid whatever the box, so a whole city view at
+        # a low zoom is fine
+        bounding_box = BoundingBoxFilterBackend().get_bounding_box(
+            request, max_span=None
+        )
+        if bounding_box is None:
+            raise ParseError("A location (ne/sw or lat/lng) is required")
+        try:
+            zoom = float(request.query_params["zoom"])
+        except (KeyError, ValueError):
+            raise ParseError("zoom must be a number")
+        # Zooms past the grid's finest level are clamped to it
+        if not (math.isfinite(zoom) and 0 <= zoom <= self.max_zoom):
+            raise ParseError(f"zoom must be between 0 and {self.max_zoom}")
+
+        grid = cluster_grid.get()
+        level = grid.get_zoom_level(zoom)
+        return Response(
+            {
+                "zoom": level,
+                "cell_size": grid.get_cell_size(level),
+                "clusters": grid.query(bounding_box, level),
+            }
+        )
+
+
+@dataset_condition
+def tile(request, z, x, y):
+    """
+    Serves bylaw points and segments as a Mapbox Vector Tile, cached on disk per
+    dataset version.
+    """
+    if not is_valid_tile(z, x, y):
+        raise Http404("Tile out of range")
+    version_key = DatasetVersion.objects.current_key()
+    response = HttpResponse(
+        get_tile(version_key, z, x, y),
+        content_type="application/vnd.mapbox-vector-tile",
+    )
+    response["Cache-Control"] = "public, max-age=3600"
+    return response
+
+
+def snapshot_last_modified(request):
+    snapshot_key = find_snapshot(DatasetVersion.objects.current_key())
+    if snapshot_key is None:
+        return None
+    try:
+        return get_snapshot_last_modified(snapshot_key)
+    except FileNotFoundError:
+        return None
+
+
+@condition(last_modified_func=snapshot_last_modified)
+def snapshot(request):
+    """
+    Serves the precompressed GeoJSON snapshot of every bylaw we display, picking the
+    best encoding the client accepts. Clients revalidating with a matching
+    ``If-None-Match`` get a 304. While the current version's snapshot is being built
+    the previous one is served, if there's no snapshot at all we answer 503.
+    """
+    snapshot_key = find_snapshot(DatasetVersion.objects.current_key())
+    # Also None if a newer snapshot was finished and this one purged since
+    etag = None if snapshot_key is None else get_snapshot_etag(snapshot_key)
+    if etag is None:
+        response = HttpResponse("Snapshot not built yet", status=503)
+        response["Retry-After"] = "60"
+        return response
+    accept_encoding = request.headers.get("Accept-Encoding", "")
+    encoding = negotiate_encoding(snapshot_key, accept_encoding)
+    if encoding != "identity":
+        etag = f"{etag}-{encoding}"
+    etag = f'"{etag}"'
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(
+            open(get_snapshot_path(snapshot_key, encoding), "rb"),
+            content_type="application/geo+json",
+        )
+        if encoding != "identity":
+            response["Content-Encoding"] = encoding
+    response["ETag"] = etag
+    patch_vary_headers(response, ["Accept-Encoding"])
+    response["Cache-Control"] = "public, no-cache"
+    return response
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+Load generator for comparing the sync bylaw list under WSGI with the async one under
+ASGI. Keeps ``--concurrency`` keep-alive connections busy for ``--duration`` seconds,
+each panning a map viewport around downtown (so a share of requests miss the response
+cache), and reports throughput and latency.
+
+Start the server to test, then run from the ``parking`` folder, eg.
+
+    gunicorn -w 4 parking.wsgi
+    python benchmarks/bench_asgi.py http://127.0.0.1:8000/api/bylaws/
+
+    gunicorn -w 1 -k uvicorn.workers.UvicornWorker parking.asgi
+    python benchmarks/bench_asgi.py http://127.0.0.1:8000/api/async/bylaws/
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from urllib.parse import urlencode, urlsplit
+
+CENTER = (43.6532, -79.3832)
+# Half the size of a phone sized viewport at street zoom, in degrees
+VIEWPORT = (0.006, 0.01)
+# Pans land on this many distinct viewports, wrapping around once all have been seen
+PAN_POSITIONS = 400
+
+
+def viewport_params(rng):
+    step = rng.randrange(PAN_POSITIONS)
+    lat = CENTER[0] + (step // 20 - 10) * 0.004
+    lng = CENTER[1] + (step % 20 - 10) * 0.004
+    ne = f"{lat + VIEWPORT[0]:.4f},{lng + VIEWPORT[1]:.4f}"
+    sw = f"{lat - VIEWPORT[0]:.4f},{lng - VIEWPORT[1]:.4f}"
+    return urlencode({"type": "all", "group": "schedule", "ne": ne, "sw": sw})
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed")
+    status = int(status_line.split()[1])
+    length, chunked, keep_alive = 0, False, True
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+        elif name == "connection" and "close" in value.lower():
+            # gunicorn's sync workers close the connection after every response
+            keep_alive = False
+    if not chunked:
+        await reader.readexactly(length)
+        return status, keep_alive
+    while True:
+        size = int((await reader.readline()).split(b";")[0], 16)
+        await reader.readexactly(size + 2)
+        if size == 0:
+            return status, keep_alive
+
+
+async def client(url, deadline, rng, latencies, errors):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    connection = None
+    while time.perf_counter() < deadline:
+        path = f"{parts.path}?{viewport_params(rng)}"
+        request = f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n\r\n"
+        # Connection time counts towards latency, as it would for a browser
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            reader, writer = connection
+            writer.write(request.encode())
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError):
+            errors.append("connection")
+            connection = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(status)
+        if not keep_alive:
+            writer.close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def run(url, concurrency, duration, seed):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            client(url, deadline, random.Random(seed + idx), latencies, errors)
+            for idx in range(concurrency)
+        )
+    )
+    return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("url")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    latencies, errors, elapsed = asyncio.run(
+        run(args.url, args.concurrency, args.duration, args.seed)
+    )
+    latencies.sort()
+    print(f"{args.url} with {args.concurrency} connections for {elapsed:.1f}s")
+    print(f"  requests:   {len(latencies)} ({len(errors)} errors)")
+    print(f"  throughput: {len(latencies) / elapsed:8.1f} req/s")
+    if latencies:
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"  latency:    p50 {statistics.median(latencies) * 1000:.1f} ms, "
+            f"p99 {p99 * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
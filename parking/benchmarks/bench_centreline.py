@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Times ``set_location_data``'s geocoding pass over every intersection of the synthetic
+city from ``synthetic.py`` offline, with ``CentrelineGeocoder`` reading the city's
+street grid from a GeoJSON centreline file. Loading the file is included, updating
+midpoints and building the snapshot afterwards aren't. The dataset replaces any bylaw
+data in the database.
+
+Run from the ``parking`` folder:
+``python benchmarks/bench_centreline.py [bylaw count]``
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "parking.settings")
+
+import django
+
+django.setup()
+
+from django.test.utils import override_settings
+
+from synthetic import create_dataset
+from whereToPark.management.commands.set_location_data import Command
+from whereToPark.models import GeocodingRun, Intersection
+
+
+def write_centreline(path):
+    """
+    Writes a centreline segment for every block of the synthetic grid, split at each
+    intersection like Toronto's, then takes the grid's locations away.
+    """
+    features = []
+    points = {}
+    for main_street, cross_street, lat, lng in Intersection.objects.values_list(
+        "main_street__name", "cross_street__name", "lat", "lng"
+    ):
+        points.setdefault(main_street, []).append((lat, lng))
+        points.setdefault(cross_street, []).append((lat, lng))
+    for street, nodes in points.items():
+        nodes.sort()
+        for (lat, lng), (next_lat, next_lng) in zip(nodes, nodes[1:]):
+            features.append(
+                {
+                    "type": "Feature",
+                    "properties": {"LINEAR_NAME_FULL": street},
+                    "geometry": {
+                        "type": "LineString",
+                        "coordinates": [[lng, lat], [next_lng, next_lat]],
+                    },
+                }
+            )
+    with open(path, "w") as file:
+        json.dump({"type": "FeatureCollection", "features": features}, file)
+    Intersection.objects.update(lat=None, lng=None, status="NA")
+    return len(features)
+
+
+def main(bylaw_count):
+    create_dataset(bylaw_count)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "centreline.geojson")
+        segments = write_centreline(path)
+        print(
+            f"set_location_data over {bylaw_count} bylaws, "
+            f"{Intersection.objects.count()} intersections, {segments} segments"
+        )
+        start = time.perf_counter()
+        with override_settings(
+            GEOCODER_BACKEND="whereToPark.centreline.CentrelineGeocoder",
+            GEOCODER_CENTRELINE_PATH=path,
+        ):
+            Command(stdout=StringIO()).set_intersections_with_loc(
+                GeocodingRun.objects.create(), batch_size=1000
+            )
+        elapsed = time.perf_counter() - start
+    found = Intersection.objects.filter(status="FS").count()
+    print(f"  {elapsed:.1f}s, {found} intersections found")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Times ``set_location_data``'s ``import_intersections`` linking every bylaw of the
+synthetic city from ``synthetic.py`` to its boundary intersections, first from scratch
+(every intersection created) and then again with nothing left to change. The dataset
+replaces any bylaw data in the database.
+
+Run from the ``parking`` folder:
+``python benchmarks/bench_import_intersections.py [bylaw count]``
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "parking.settings")
+
+import django
+
+django.setup()
+
+from django.db import connection
+
+from synthetic import create_dataset
+from whereToPark.management.commands.set_location_data import Command
+from whereToPark.models import ByLaw, Intersection
+
+
+def run(label):
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    with connection.execute_wrapper(count_query):
+        updated = Command().import_intersections()
+    elapsed = time.perf_counter() - start
+    print(f"  {label}: {elapsed:.2f}s, {queries} queries, {updated} bylaws linked")
+
+
+def main(bylaw_count):
+    create_dataset(bylaw_count)
+    # Unlink everything so the first run has to create every intersection. Bylaws
+    # cascade from intersections so they're unlinked before the delete.
+    ByLaw.objects.update(boundary_start=None, boundary_end=None)
+    Intersection.objects.all().delete()
+
+    print(f"import_intersections over {bylaw_count} bylaws ({connection.vendor})")
+    run("from scratch")
+    run("already linked")
+    print(f"  {Intersection.objects.count()} intersections")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Compares the query plans and execution times of bylaw location filters on the stored
+midpoints (B-tree range scan) against the PostGIS geometry filters (GiST ``&&`` and
+``ST_DWithin``) for random viewports and radii over the synthetic city from
+``synthetic.py``. The dataset replaces any bylaw data in the database.
+
+Needs PostgreSQL with the postgis extension and ``USE_POSTGIS=true`` (migrations
+applied with it on). Run from the ``parking`` folder:
+``python benchmarks/bench_postgis.py [bylaw count]``
+"""
+
+import json
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "parking.settings")
+
+import django
+
+django.setup()
+
+from django.db import connection
+
+from api.serializers import BYLAW_ROW_FIELDS
+from api.spatial import BoundingBox, postgis_in_box, postgis_within
+from api.views import BoundingBoxFilterBackend
+from synthetic import MAX_LAT, MAX_LNG, MIN_LAT, MIN_LNG, create_dataset
+from whereToPark import postgis
+from whereToPark.models import ByLaw
+
+QUERIES = 200
+
+
+def explain(queryset):
+    """Returns the execution time in ms and the scan node types of the plan."""
+    plan = json.loads(queryset.explain(analyze=True, format="json"))[0]
+    nodes, scans = [plan["Plan"]], set()
+    while nodes:
+        node = nodes.pop()
+        if node.get("Relation Name") == "whereToPark_bylaw":
+            index = node.get("Index Name")
+            scans.add(node["Node Type"] + (f" on {index}" if index else ""))
+        nodes.extend(node.get("Plans", []))
+    return plan["Execution Time"], scans
+
+
+def run(label, querysets):
+    timings, scans = [], set()
+    for queryset in querysets:
+        timing, plan_scans = explain(queryset.values_list(*BYLAW_ROW_FIELDS))
+        timings.append(timing)
+        scans |= plan_scans
+    timings.sort()
+    print(f"  {label}")
+    print(
+        f"    median {statistics.median(timings):.2f} ms, "
+        f"p95 {timings[int(len(timings) * 0.95)]:.2f} ms"
+    )
+    print(f"    bylaw scans: {', '.join(sorted(scans))}")
+
+
+def main(bylaw_count):
+    if not postgis.is_enabled():
+        sys.exit("Needs PostgreSQL with USE_POSTGIS=true")
+    create_dataset(bylaw_count)
+    postgis.update_bylaw_geometries()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE "whereToPark_bylaw", "whereToPark_intersection"')
+
+    rng = random.Random(0)
+    backend = BoundingBoxFilterBackend()
+    bylaws = ByLaw.objects.get_bylaws_to_display()
+    boxes, circles = [], []
+    for _ in range(QUERIES):
+        lat, lng = rng.uniform(MIN_LAT, MAX_LAT), rng.uniform(MIN_LNG, MAX_LNG)
+        boxes.append(BoundingBox(lat - 0.006, lng - 0.01, lat + 0.006, lng + 0.01))
+        circles.append((lat, lng, rng.choice([0.5, 1, 2])))
+
+    print(f"{bylaw_count} bylaws, {QUERIES} random queries each")
+    run(
+        "viewport, midpoint range",
+        [bylaws.filter(backend.get_box_q_obj(box)) for box in boxes],
+    )
+    run("viewport, PostGIS &&", [bylaws.filter(postgis_in_box(box)) for box in boxes])
+    run(
+        "radius, midpoint range over the center box",
+        [
+            bylaws.filter(backend.get_box_q_obj(BoundingBox.from_center(*circle)))
+            for circle in circles
+        ],
+    )
+    run(
+        "radius, PostGIS ST_DWithin",
+        [bylaws.filter(postgis_within(*circle)) for circle in circles],
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Compares the time to serialize and render one 5000 row page of bylaws through
+``ByLawSerializer`` + DRF's ``JSONRenderer`` against the ``values_list`` fast path
+(``bylaw_row_to_dict`` + ``FastJSONRenderer``). Rows are built in memory so no database
+is needed.
+
+Run from the ``parking`` folder: ``python benchmarks/bench_serializers.py``
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "parking.settings")
+
+import django
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import FastJSONRenderer
+from api.serializers import ByLawSerializer, bylaw_row_to_dict
+from whereToPark.models import ByLaw, Highway, Intersection
+
+PAGE_SIZE = 5000
+ROUNDS = 5
+
+
+def make_page():
+    """Returns the same page of bylaws as model instances and as fast path rows."""
+    instances, rows = [], []
+    for idx in range(PAGE_SIZE):
+        highway = Highway(name=f"street {idx}")
+        start = Intersection(
+            pk=idx * 2 + 1,
+            main_street=highway,
+            cross_street=Highway(name=f"cross {idx}"),
+            lat=43.65 + idx * 1e-5,
+            lng=-79.38,
+            status="FS",
+        )
+        end = Intersection(
+            pk=idx * 2 + 2,
+            main_street=highway,
+            cross_street=Highway(name=f"cross {idx + 1}"),
+            lat=43.66 + idx * 1e-5,
+            lng=-79.39,
+            status="FS",
+        )
+        fields = dict(
+            source_id=idx,
+            schedule="13",
+            schedule_name="No Parking",
+            side="North",
+            between=f"cross {idx} and cross {idx + 1}",
+            times_and_or_days="8:00 a.m. to 6:00 p.m., mon. to fri.",
+            max_period_permitted=None,
+            mid_lat=(start.lat + end.lat) / 2,
+            mid_lng=(start.lng + end.lng) / 2,
+        )
+        instances.append(
+            ByLaw(highway=highway, boundary_start=start, boundary_end=end, **fields)
+        )
+        rows.append(
+            (
+                start.pk, highway.name, start.cross_street.name, start.lat, start.lng,
+                end.pk, highway.name, end.cross_street.name, end.lat, end.lng,
+                fields["mid_lat"], fields["mid_lng"], highway.name, idx,
+                fields["schedule"], fields["schedule_name"], fields["side"],
+                fields["between"], fields["times_and_or_days"],
+                fields["max_period_permitted"],
+            )
+        )
+    return instances, rows
+
+
+def serializer_page(instances):
+    return JSONRenderer().render(ByLawSerializer(instances, many=True).data)
+
+
+def fast_page(rows):
+    return FastJSONRenderer().render([bylaw_row_to_dict(row) for row in rows])
+
+
+def best_of(func, arg):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    instances, rows = make_page()
+    assert JSONRenderer().render(ByLawSerializer(instances, many=True).data) == (
+        JSONRenderer().render([bylaw_row_to_dict(row) for row in rows])
+    ), "fast path output differs from ByLawSerializer"
+
+    before = best_of(serializer_page, instances)
+    after = best_of(fast_page, rows)
+    print(f"{PAGE_SIZE} row page, best of {ROUNDS}")
+    print(f"  ByLawSerializer + JSONRenderer:       {before * 1000:8.1f} ms")
+    print(f"  bylaw_row_to_dict + FastJSONRenderer: {after * 1000:8.1f} ms")
+    print(f"  speedup: {before / after:.1f}x")
@@ -0,0 +1,109 @@
+"""
+Fills the configured database with a synthetic city's worth of geocoded bylaws for the
+benchmarks that need real queries. Streets are laid out on a grid over Toronto's extent
+and every bylaw runs along one block between two neighbouring intersections.
+
+Run from the ``parking`` folder: ``python benchmarks/synthetic.py [bylaw count]``
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "parking.settings")
+
+import django
+
+django.setup()
+
+from django.db import transaction
+
+from whereToPark.models import ByLaw, DatasetVersion, Highway, Intersection
+
+MIN_LAT, MAX_LAT = 43.58, 43.85
+MIN_LNG, MAX_LNG = -79.64, -79.12
+BATCH_SIZE = 5000
+
+
+@transaction.atomic
+def create_dataset(bylaw_count=50000, seed=0):
+    """
+    Replaces the bylaw data with ``bylaw_count`` synthetic bylaws. Returns the number of
+    intersections created.
+    """
+    rng = random.Random(seed)
+    ByLaw.objects.all().delete()
+    Intersection.objects.all().delete()
+    Highway.objects.all().delete()
+
+    # Two bylaws (one per side) per block, blocks run both ways along the grid
+    streets = max(2, int((bylaw_count / 4) ** 0.5) + 1)
+    highways = Highway.objects.bulk_create(
+        [Highway(name=f"{idx} street") for idx in range(streets)]
+        + [Highway(name=f"{idx} avenue") for idx in range(streets)],
+        batch_size=BATCH_SIZE,
+    )
+    streets_ns, streets_ew = highways[:streets], highways[streets:]
+    lat_step = (MAX_LAT - MIN_LAT) / (streets - 1)
+    lng_step = (MAX_LNG - MIN_LNG) / (streets - 1)
+    intersections = Intersection.objects.bulk_create(
+        [
+            Intersection(
+                main_street=streets_ns[col],
+                cross_street=streets_ew[row],
+                lat=MIN_LAT + row * lat_step,
+                lng=MIN_LNG + col * lng_step,
+                status="FS",
+            )
+            for row in range(streets)
+            for col in range(streets)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    grid = {
+        (row, col): intersections[row * streets + col]
+        for row in range(streets)
+        for col in range(streets)
+    }
+
+    bylaws = []
+    blocks = [
+        (highway, grid[start], grid[end])
+        for (row, col), _ in grid.items()
+        for highway, start, end in (
+            (streets_ns[col], (row, col), (row + 1, col)),
+            (streets_ew[row], (row, col), (row, col + 1)),
+        )
+        if end in grid
+    ]
+    for source_id in range(bylaw_count):
+        highway, start, end = blocks[source_id // 2 % len(blocks)]
+        schedule = rng.choice(["13", "15"])
+        bylaws.append(
+            ByLaw(
+                source_id=source_id,
+                schedule=schedule,
+                schedule_name=(
+                    "No Parking" if schedule == "13" else "Restricted Parking"
+                ),
+                highway=highway,
+                side=["North", "South"][source_id % 2],
+                boundary_start=start,
+                boundary_end=end,
+                between=f"{start.cross_street.name} and {end.cross_street.name}",
+                times_and_or_days="8:00 a.m. to 6:00 p.m., mon. to fri.",
+                max_period_permitted="1 hour" if schedule == "15" else None,
+                mid_lat=(start.lat + end.lat) / 2,
+                mid_lng=(start.lng + end.lng) / 2,
+            )
+        )
+    ByLaw.objects.bulk_create(bylaws, batch_size=BATCH_SIZE)
+    DatasetVersion.objects.bump()
+    return len(intersections)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    intersections = create_dataset(count)
+    print(f"Created {count} bylaws over {intersections} intersections")
@@ -140,9 +140,65 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.KeysetPagination",
     "PAGE_SIZE": 5000,
 }
+
+# Store bylaw and intersection geometries in PostGIS (needs the postgis extension, as
+# in the postgis/postgis image) and filter locations with GiST indexed && / ST_DWithin
+# queries. Only takes effect on PostgreSQL and takes over from BYLAW_SPATIAL_INDEX.
+USE_POSTGIS = os.getenv("USE_POSTGIS", "false").lower() in ("1", "true")
+
+# Answer bounding box queries from an in-process grid index (api/spatial.py) rather
+# than range filters on the stored bylaw midpoints
+BYLAW_SPATIAL_INDEX = True
+
+# Encoded vector tiles are cached here under a folder per dataset version. Only tiles
+# with bylaws in them up to TILE_CACHE_MAX_ZOOM are kept, the rest are built per request
+TILE_CACHE_DIR = os.path.join(BASE_DIR, "tile_cache")
+TILE_CACHE_MAX_ZOOM = 16
+
+# Bylaw list responses are cached per grid cell (in degrees) of the requested location
+# and dataset version. The version itself is cached for a short time so most requests
+# don't hit the database at all.
+BYLAW_CACHE_GRID_SIZE = 0.002
+BYLAW_RESPONSE_CACHE_TIMEOUT = 60 * 60
+DATASET_VERSION_CACHE_TIMEOUT = 30
+
+# Rows fetched per database round trip when streaming bylaws (?stream=true)
+BYLAW_STREAM_CHUNK_SIZE = 2000
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# Geocoding for set_location_data (whereToPark/geocoding.py). The rate is in requests
+# per second and backs off on its own when the geocoder throttles us.
+# GEOCODER_BACKEND can be set to "whereToPark.centreline.CentrelineGeocoder" to geocode
+# offline from the street centreline file at GEOCODER_CENTRELINE_PATH instead.
+GEOCODER_BACKEND = os.getenv("GEOCODER_BACKEND", "whereToPark.geocoding.Geocoder")
+GEOCODER_CENTRELINE_PATH = os.getenv("GEOCODER_CENTRELINE_PATH", "")
+GEOCODER_URL = os.getenv("GEOCODER_URL", "https://geocoder.ca/")
+GEOCODER_RATE = float(os.getenv("GEOCODER_RATE", "1"))
+GEOCODER_WORKERS = int(os.getenv("GEOCODER_WORKERS", "4"))
+
+# Geocoder results are also cached in this SQLite file by street pair, so rebuilding the
+# database doesn't mean geocoding everything again. Found locations are kept for good,
+# misses are retried once their TTL (in seconds) is up and timeouts aren't cached.
+# Empty disables it.
+GEOCODE_CACHE_PATH = os.getenv(
+    "GEOCODE_CACHE_PATH", os.path.join(BASE_DIR, "geocode_cache.sqlite3")
+)
+GEOCODE_CACHE_TTLS = {"FNF": 30 * 24 * 60 * 60}
+
+# Precompressed whole-city GeoJSON snapshots, also kept per dataset version
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "snapshots")
+
 CORS_ORIGIN_WHITELIST = [
     "http://localhost:5173",
     "https://street-parking-toronto.vercel.app",
@@ -0,0 +1,128 @@
+"""
+Offline geocoding backend reading a street centreline export, such as Toronto's
+Centreline or Centreline Intersection datasets, as GeoJSON or as a shapefile (needs
+pyshp). Coordinates are expected as WGS84 longitude/latitude.
+
+Centreline segments are split wherever streets meet, so two streets intersect where
+their segments share an end point. Intersection points described as "Street A /
+Street B" are indexed as is.
+"""
+
+import json
+from collections import defaultdict
+from itertools import combinations
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from whereToPark.geocode_cache import get_key, normalize_street
+from whereToPark.geocoding import BaseGeocoder
+
+try:
+    import shapefile
+except ImportError:  # pyshp is optional, only needed to read shapefiles
+    shapefile = None
+
+# Properties holding a segment's street name, the first one present is used. Shapefile
+# field names are cut to 10 characters.
+NAME_FIELDS = ["LINEAR_NAME_FULL", "LINEAR_NAM", "LF_NAME", "name"]
+# Properties describing an intersection point, ie. "Bloor St W / Spadina Ave"
+DESCRIPTION_FIELDS = ["INTERSECTION_DESC", "description"]
+# End points are rounded to this many decimal places (~10 cm) before being matched
+PRECISION = 6
+# Streets meeting at points further apart than this (in degrees, ~200 m) are ambiguous,
+# ie. a crescent meeting the same street at both of its ends
+MAX_SPREAD = 0.002
+
+
+def read_features(path):
+    """Yields (properties, geometry) for each feature of a GeoJSON file or shapefile."""
+    if path.lower().endswith(".shp"):
+        if shapefile is None:
+            raise ImproperlyConfigured("Reading shapefiles needs pyshp installed")
+        with shapefile.Reader(path) as reader:
+            for shape_record in reader.iterShapeRecords():
+                yield (
+                    shape_record.record.as_dict(),
+                    shape_record.shape.__geo_interface__,
+                )
+        return
+    with open(path) as file:
+        collection = json.load(file)
+    for feature in collection["features"]:
+        yield feature.get("properties") or {}, feature.get("geometry")
+
+
+def get_first(properties, fields):
+    for field in fields:
+        if properties.get(field):
+            return properties[field]
+    return None
+
+
+def get_lines(geometry):
+    if geometry["type"] == "LineString":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiLineString":
+        return geometry["coordinates"]
+    return []
+
+
+class CentrelineGeocoder(BaseGeocoder):
+    """
+    Geocodes intersections from an in-memory index of the centreline file at ``path``,
+    or of ``features`` given as (properties, geometry). Street names are normalized
+    the same way as geocode cache keys, so "Bloor St W" matches "bloor street west".
+    Intersections that aren't in the file are "FNF". Nothing ever times out.
+    """
+
+    def __init__(self, path=None, features=None):
+        # Street name -> rounded (lat, lng) end points of its segments
+        self.nodes = defaultdict(set)
+        # Street pair key -> (lat, lng) of points described as their intersection
+        self.points = defaultdict(list)
+        if features is None:
+            features = read_features(path)
+        for properties, geometry in features:
+            self.add_feature(properties, geometry)
+
+    @classmethod
+    def from_settings(cls, **options):
+        if not settings.GEOCODER_CENTRELINE_PATH:
+            raise ImproperlyConfigured("GEOCODER_CENTRELINE_PATH isn't set")
+        return cls(settings.GEOCODER_CENTRELINE_PATH)
+
+    def add_feature(self, properties, geometry):
+        if not geometry:
+            return
+        description = get_first(properties, DESCRIPTION_FIELDS)
+        if description and geometry["type"] == "Point":
+            lng, lat = geometry["coordinates"][:2]
+            streets = [street for street in description.split("/") if street.strip()]
+            for street, other_street in combinations(streets, 2):
+                self.points[get_key(street, other_street)].append((lat, lng))
+            return
+
+        name = get_first(properties, NAME_FIELDS)
+        if not name:
+            return
+        nodes = self.nodes[normalize_street(name)]
+        for line in get_lines(geometry):
+            for lng, lat, *_ in (line[0], line[-1]):
+                nodes.add((round(lat, PRECISION), round(lng, PRECISION)))
+
+    def geocode(self, highway, cross_street):
+        if not highway or not cross_street:
+            return (None, None), "FNF"
+        points = self.points.get(get_key(highway, cross_street))
+        if not points:
+            nodes = self.nodes.get(normalize_street(highway), set())
+            cross_nodes = self.nodes.get(normalize_street(cross_street), set())
+            points = nodes & cross_nodes
+        if not points:
+            return (None, None), "FNF"
+        lats, lngs = zip(*points)
+        if max(lats) - min(lats) > MAX_SPREAD or max(lngs) - min(lngs) > MAX_SPREAD:
+            return (None, None), "FNF"
+        # Divided roads meet at a few nearby points, use the middle of them
+        return (sum(lats) / len(lats), sum(lngs) / len(lngs)), "FS"
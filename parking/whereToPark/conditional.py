@@ -0,0 +1,46 @@
+"""
+Conditional GET support for read views. Our data only changes when the management
+commands bump the ``DatasetVersion``, so ETags and Last-Modified are derived from it
+(plus the request's query params) and a matching ``If-None-Match`` or
+``If-Modified-Since`` gets a 304 before the view runs any queries. Listings filtered
+with ``at=now`` also change every slot of the week, so the current slot is part of
+their validators.
+"""
+
+import hashlib
+
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from whereToPark.models import DatasetVersion
+from whereToPark.schedules import SLOT_MINUTES, get_slot
+
+
+def dataset_etag(request, *args, **kwargs):
+    params = sorted(request.GET.lists())
+    slot = get_slot(timezone.now()) if request.GET.get("at") == "now" else None
+    key = (
+        DatasetVersion.objects.current_key(),
+        request.path,
+        params,
+        slot,
+        request.headers.get("Accept", ""),
+    )
+    return hashlib.md5(repr(key).encode()).hexdigest()
+
+
+def dataset_last_modified(request, *args, **kwargs):
+    last_modified = DatasetVersion.objects.last_modified()
+    if request.GET.get("at") != "now":
+        return last_modified
+    # Toronto is a whole number of hours off UTC so slots start on the same minutes
+    now = timezone.now()
+    slot_start = now.replace(
+        minute=now.minute - now.minute % SLOT_MINUTES, second=0, microsecond=0
+    )
+    return slot_start if last_modified is None else max(last_modified, slot_start)
+
+
+dataset_condition = condition(
+    etag_func=dataset_etag, last_modified_func=dataset_last_modified
+)
@@ -0,0 +1,116 @@
+"""
+On-disk SQLite cache of geocoder results keyed by street pair, so rebuilding the
+database or recreating intersections doesn't mean geocoding everything again.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+
+# Common abbreviations spelled out so "Queen St. W" and "queen street west" share a key
+ABBREVIATIONS = {
+    "ave": "avenue",
+    "blvd": "boulevard",
+    "cres": "crescent",
+    "crt": "court",
+    "dr": "drive",
+    "e": "east",
+    "n": "north",
+    "pl": "place",
+    "rd": "road",
+    "s": "south",
+    "st": "street",
+    "w": "west",
+}
+
+# Timeouts say nothing about the intersection, so they are always retried. Caching them
+# would also count them against a run's timeout limit without making any request.
+UNCACHED_STATUSES = ("TO",)
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS geocode (
+        street_a TEXT NOT NULL,
+        street_b TEXT NOT NULL,
+        status TEXT NOT NULL,
+        lat REAL,
+        lng REAL,
+        confidence REAL,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY (street_a, street_b)
+    )
+"""
+
+
+def normalize_street(name):
+    words = re.sub(r"[^\w\s]", " ", name.lower()).split()
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def get_key(highway, cross_street):
+    """
+    Returns the cache key for an intersection. Both names are normalized and sorted,
+    since A at B is the same place as B at A.
+    """
+    return tuple(sorted([normalize_street(highway), normalize_street(cross_street)]))
+
+
+class GeocodeCache:
+    """
+    Geocoder results stored in the SQLite file at ``path``. Entries with a status in
+    ``ttls`` expire after that many seconds so misses get retried, entries with any
+    other status (ie. found) are kept for good. Timeouts aren't stored. Safe to share
+    between the geocoder's worker threads.
+    """
+
+    def __init__(self, path, ttls=None):
+        self.ttls = ttls or {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(CREATE_TABLE_SQL)
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, highway, cross_street, now=None):
+        """
+        Returns the cached ((lat, lng), status) of the intersection, None if it isn't
+        cached or has expired.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT status, lat, lng, fetched_at FROM geocode "
+                "WHERE street_a = ? AND street_b = ?",
+                get_key(highway, cross_street),
+            ).fetchone()
+            # Timeouts may have been stored by older versions
+            if row is not None and row[0] not in UNCACHED_STATUSES:
+                status, lat, lng, fetched_at = row
+                ttl = self.ttls.get(status)
+                if ttl is None or (now or time.time()) - fetched_at < ttl:
+                    self.hits += 1
+                    return (lat, lng), status
+            self.misses += 1
+            return None
+
+    def set(self, highway, cross_street, location, status, confidence=None):
+        if status in UNCACHED_STATUSES:
+            return
+        lat, lng = location
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    *get_key(highway, cross_street),
+                    status,
+                    lat,
+                    lng,
+                    confidence,
+                    time.time(),
+                ),
+            )
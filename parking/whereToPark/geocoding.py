@@ -0,0 +1,274 @@
+"""
+Geocoding of intersections for ``set_location_data``. ``BaseGeocoder`` is the interface
+backends implement, picked with the ``GEOCODER_BACKEND`` setting. ``Geocoder`` (the
+default) geocodes through geocoder.ca and ``whereToPark.centreline`` has an offline
+backend reading a local street centreline file.
+
+Requests to geocoder.ca go
+through one pooled HTTP session shared by a bounded pool of worker threads. A token
+bucket paces them. The bucket's rate is cut when the provider throttles us (403/429)
+and creeps back up as requests succeed. Results can be kept in a ``GeocodeCache`` which
+is checked before making any request.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from xml.etree import ElementTree as ET
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from whereToPark.geocode_cache import GeocodeCache
+
+GEOCODER_API_ENDPOINT = "https://geocoder.ca/"
+THROTTLED_STATUSES = (403, 429)
+
+
+class BudgetExhausted(Exception):
+    """Raised instead of making a request once the geocoder's budget is used up."""
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket handing out ``rate`` tokens a second, with bursts of up to
+    ``capacity``. ``throttle`` halves the rate (down to ``min_rate``) and pauses every
+    caller for a while, ``recover`` adds back ``rate_step`` up to the starting rate.
+    """
+
+    def __init__(self, rate, capacity=1, min_rate=None, rate_step=None):
+        self.max_rate = self.rate = rate
+        self.min_rate = min_rate or rate / 32
+        self.rate_step = rate_step or rate / 10
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    elapsed = now - max(self.updated, self.paused_until)
+                    self.tokens = min(
+                        self.capacity, self.tokens + max(elapsed, 0) * self.rate
+                    )
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def throttle(self, delay):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    def recover(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.rate_step)
+
+
+def parse_geocode_xml(tree):
+    """Given an element tree with XML from geocoder API, parse latitude and longitude
+    fields.
+    """
+    lat, lng = None, None
+    confidence_score = 0
+    for child in tree:
+        if child.tag == "error":
+            return (None, None), "FNF"
+        if child.tag == "latt" and child.text:
+            lat = float(child.text)
+        elif child.tag == "longt" and child.text:
+            lng = float(child.text)
+        elif child.tag == "confidence" and child.text:
+            confidence_score = child.text
+
+    if float(confidence_score) < 0.5:
+        return (None, None), "FNF"
+    return (lat, lng), "FS"
+
+
+class BaseGeocoder:
+    """
+    Interface of the geocoding backends. ``geocode`` returns ((lat, lng), status) for
+    the intersection of two streets, with status one of the intersection
+    ``BOUNDARY_STATUSES``. ``geocode_many`` geocodes them one at a time unless a backend
+    has a faster way. Backends are built by ``set_location_data`` with
+    ``from_settings``, which is passed the command's options.
+    """
+
+    cache = None
+    request_count = 0
+
+    @classmethod
+    def from_settings(cls, **options):
+        return cls()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def geocode(self, highway, cross_street):
+        raise NotImplementedError
+
+    def geocode_many(self, intersections):
+        """
+        Geocodes ``intersections``, an iterable of (key, highway, cross street). Yields
+        (key, ((lat, lng), status)) for each one.
+        """
+        for key, highway, cross_street in intersections:
+            yield key, self.geocode(highway, cross_street)
+
+
+class Geocoder(BaseGeocoder):
+    """
+    Geocodes intersections with up to ``workers`` requests in flight at a time, at no
+    more than ``rate`` requests a second. Throttled, failed and unparseable responses
+    are retried up to ``max_retries`` times with exponential backoff (or the server's
+    ``Retry-After``), after which the intersection is marked as timed out ("TO").
+    With a ``cache`` (see ``whereToPark.geocode_cache``) cached results are returned
+    without a request and new ones, other than timeouts, are stored. With a ``budget`` at most that many
+    requests (retries included) are made, after which ``BudgetExhausted`` is raised.
+    """
+
+    def __init__(
+        self,
+        endpoint=GEOCODER_API_ENDPOINT,
+        rate=1.0,
+        workers=4,
+        max_retries=5,
+        backoff=1.0,
+        timeout=10,
+        cache=None,
+        budget=None,
+    ):
+        self.endpoint = endpoint
+        self.cache = cache
+        self.budget = budget
+        self.request_count = 0
+        self.request_lock = threading.Lock()
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = TokenBucket(rate)
+        # One connection per worker, reused across requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def from_settings(cls, workers=None, rate=None, budget=None, **options):
+        cache = None
+        if settings.GEOCODE_CACHE_PATH:
+            cache = GeocodeCache(
+                settings.GEOCODE_CACHE_PATH, ttls=settings.GEOCODE_CACHE_TTLS
+            )
+        return cls(
+            endpoint=settings.GEOCODER_URL,
+            rate=rate or settings.GEOCODER_RATE,
+            workers=workers or settings.GEOCODER_WORKERS,
+            cache=cache,
+            budget=budget,
+        )
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def get_backoff(self, attempt, response=None):
+        """Returns how long to wait before retry number ``attempt`` (from 0)."""
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return int(response.headers["Retry-After"])
+        return self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+
+    def geocode(self, highway, cross_street):
+        """Returns ((lat, lng), status) for the intersection of the two streets."""
+        if not highway or not cross_street:
+            return (None, None), "FNF"
+        if self.cache is not None:
+            cached = self.cache.get(highway, cross_street)
+            if cached is not None:
+                return cached
+        location, status, confidence = self.fetch(highway, cross_street)
+        if self.cache is not None:
+            self.cache.set(highway, cross_street, location, status, confidence)
+        return location, status
+
+    def fetch(self, highway, cross_street):
+        """
+        Requests the intersection from the geocoder. Returns ((lat, lng), status,
+        confidence).
+        """
+        params = {
+            "street1": highway,
+            "street2": cross_street,
+            "city": "toronto",
+            "geoit": "xml",
+        }
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            self.count_request()
+            try:
+                response = self.session.get(
+                    self.endpoint, params=params, timeout=self.timeout
+                )
+            except requests.RequestException:
+                time.sleep(self.get_backoff(attempt))
+                continue
+            if response.status_code in THROTTLED_STATUSES:
+                # The provider wants everyone to slow down, not just this worker
+                self.limiter.throttle(self.get_backoff(attempt, response))
+                continue
+            try:
+                response.raise_for_status()
+                tree = ET.fromstring(response.content)
+            except (requests.HTTPError, ET.ParseError):
+                time.sleep(self.get_backoff(attempt))
+                continue
+            self.limiter.recover()
+            confidence = float(tree.findtext("confidence") or 0)
+            return (*parse_geocode_xml(tree), confidence)
+        return (None, None), "TO", None
+
+    def count_request(self):
+        with self.request_lock:
+            if self.budget is not None and self.request_count >= self.budget:
+                raise BudgetExhausted
+            self.request_count += 1
+
+    def geocode_many(self, intersections):
+        """
+        Geocodes ``intersections``, an iterable of (key, highway, cross street), on the
+        worker pool. Yields (key, ((lat, lng), status)) as each one completes. Requests
+        that haven't started are cancelled if the caller stops iterating early, or if
+        one of them raises (ie. ``BudgetExhausted``).
+        """
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {
+                executor.submit(self.geocode, highway, cross_street): key
+                for key, highway, cross_street in intersections
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -1,12 +1,21 @@
+import hashlib
+import itertools
+import json
+import time
+from collections import Counter
 import xml.etree.ElementTree as ET
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 
 from whereToPark.models import (
     ByLaw,
+    DatasetVersion,
     Highway,
-    ByLaw,
 )
+from whereToPark.pipeline import chunked, prefetch
+from whereToPark.schedules import compile_schedule
 
 FIELD_MAPPINGS = {
     "ID": "source_id",
@@ -19,27 +28,161 @@ FIELD_MAPPINGS = {
     "Maximum_Period_Permitted": "max_period_permitted",
     "Times_and_or_Days": "times_and_or_days",
 }
+# Fields written when an existing bylaw is updated from a newer dump
+UPDATE_FIELDS = [
+    "schedule_name",
+    "highway",
+    "side",
+    "between",
+    "times_and_or_days",
+    "max_period_permitted",
+    "active_times",
+    "content_hash",
+]
+CHANGE_KINDS = ["inserted", "updated", "deleted", "unchanged"]
+
+
+def get_content_hash(attributes):
+    """Returns a hash of a parsed record, used to tell if it changed between dumps."""
+    data = json.dumps(attributes, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(data).hexdigest()[:32]
 
 
 class Command(BaseCommand):
     """This mgmt command imports the data found within the 'fixtures' folder
     into respective models either NoParkingByLaw or RestrictedParkingByLaw.
+
+    Records are streamed from the XML files and written in batches of
+    ``--batch-size``, so memory use is bounded by the batch rather than the dataset.
+
+    With ``--delta`` only records whose content hash differs from the stored one are
+    written, and bylaws missing from the dump or repealed in it are deleted.
     """
 
+    files = ["fixtures/restricted_parking.xml", "fixtures/no_parking.xml"]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Number of bylaws written per bulk_create",
+        )
+        parser.add_argument(
+            "--delta",
+            action="store_true",
+            help="Only write bylaws that were added, changed or removed since the last import",
+        )
+
     def handle(self, *args, **options):
-        self.bylaws = self.fetch_bylaws("fixtures/restricted_parking.xml")
-        self.bylaws.extend(self.fetch_bylaws("fixtures/no_parking.xml"))
-        self.import_highways()
-        self.import_bylaws()
+        records = itertools.chain.from_iterable(
+            self.iter_bylaws(xml_file) for xml_file in self.files
+        )
+        self.query_count = 0
+        start = time.perf_counter()
+        with connection.execute_wrapper(self.count_query):
+            if options["delta"]:
+                changes, changed_ids = self.import_delta(records, options["batch_size"])
+                summary = ", ".join(f"{changes[key]} {key}" for key in CHANGE_KINDS)
+            else:
+                imported = self.import_all(records, options["batch_size"])
+                changed_ids = None
+                summary = f"{imported} bylaws"
+            # A delta import that changed nothing leaves the version (and caches) alone
+            changed = changed_ids is None or bool(changed_ids)
+            if changed:
+                DatasetVersion.objects.bump(changed_ids=changed_ids)
+        self.stdout.write(
+            f"Imported {summary} in {time.perf_counter() - start:.2f}s "
+            f"({self.query_count} queries)"
+        )
+        if changed:
+            call_command("build_bylaw_snapshot", stdout=self.stdout)
+
+    def count_query(self, execute, sql, params, many, context):
+        self.query_count += 1
+        return execute(sql, params, many, context)
+
+    def import_all(self, records, batch_size):
+        """Upserts every record that hasn't been repealed. Returns the count written."""
+        records = (record for record in records if not record.pop("repealed", False))
+        imported = 0
+        # Parse the next batch while the current one is being written
+        for batch in prefetch(chunked(records, batch_size)):
+            self.import_batch(batch)
+            imported += len(batch)
+        return imported
+
+    def import_delta(self, records, batch_size):
+        """
+        Compares the content hash of every record with the one stored for its
+        (schedule, source_id) and only writes new and changed bylaws. Bylaws that are
+        no longer in the dump, or are repealed in it, are deleted. Returns a counter of
+        changes by kind and the set of ids of the bylaws written or deleted.
+        """
+        existing = {
+            (schedule, source_id): (pk, content_hash)
+            for pk, schedule, source_id, content_hash in ByLaw.objects.values_list(
+                "id", "schedule", "source_id", "content_hash"
+            ).iterator()
+        }
+        seen = set()
+        changes = Counter()
+        changed_ids = set()
+        for batch in prefetch(chunked(records, batch_size)):
+            inserts, updates = [], []
+            for bylaw in batch:
+                key = (bylaw["schedule"], bylaw["source_id"])
+                if bylaw.pop("repealed", False) or key in seen:
+                    continue
+                seen.add(key)
+                pk, content_hash = existing.get(key, (None, None))
+                if pk is None:
+                    inserts.append(bylaw)
+                elif content_hash != bylaw["content_hash"]:
+                    updates.append({**bylaw, "id": pk})
+                else:
+                    changes["unchanged"] += 1
+            if not inserts and not updates:
+                continue
+
+            self.import_highways(inserts + updates)
+            created = ByLaw.objects.bulk_create([ByLaw(**bylaw) for bylaw in inserts])
+            ByLaw.objects.bulk_update(
+                [ByLaw(**bylaw) for bylaw in updates], UPDATE_FIELDS
+            )
+            changed_ids.update(bylaw.pk for bylaw in created)
+            changed_ids.update(bylaw["id"] for bylaw in updates)
+            changes["inserted"] += len(inserts)
+            changes["updated"] += len(updates)
 
-    def import_highways(self):
-        highway_objs = [Highway(name=bylaw["highway"]) for bylaw in self.bylaws]
+        deleted = [pk for key, (pk, _) in existing.items() if key not in seen]
+        for ids in chunked(deleted, batch_size):
+            ByLaw.objects.filter(id__in=ids).delete()
+        changed_ids.update(deleted)
+        changes["deleted"] = len(deleted)
+        return changes, changed_ids
+
+    def import_batch(self, bylaws):
+        self.import_highways(bylaws)
+        self.import_bylaws(bylaws)
+
+    def import_highways(self, bylaws):
+        """
+        Creates any new highways in ``bylaws`` and swaps each bylaw's highway name for
+        its id, using one query to map all the names in the batch to ids.
+        """
+        names = {bylaw["highway"] for bylaw in bylaws}
+        highway_objs = [Highway(name=name) for name in names]
 
         Highway.objects.bulk_create(highway_objs, ignore_conflicts=True)
 
-        for entry in self.bylaws:
-            highway_name = entry["highway"]
-            entry["highway"] = Highway.objects.filter(name=highway_name).first()
+        # ignore_conflicts doesn't give back ids, so look them all up at once
+        highway_ids = dict(
+            Highway.objects.filter(name__in=names).values_list("name", "id")
+        )
+        for entry in bylaws:
+            entry["highway_id"] = highway_ids[entry.pop("highway")]
 
     def process_highway_name(self, attributes):
         """Given a highway name from the XML source, returns a tuple containing
@@ -51,31 +194,52 @@ class Command(BaseCommand):
         if len(tokens) >= 2:
             attributes["highway"] = "".join(tokens[:-1]).strip()
 
-    def import_bylaws(self):
-        entries = map(lambda x: ByLaw(**x), self.bylaws)
+    def import_bylaws(self, bylaws):
+        entries = map(lambda x: ByLaw(**x), bylaws)
 
         ByLaw.objects.bulk_create(
             entries,
             update_conflicts=True,
-            update_fields=["highway"],
+            update_fields=UPDATE_FIELDS,
             unique_fields=["schedule", "source_id"],
         )
 
-    def fetch_bylaws(self, xml_file):
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        records = []
-        for child in root:
-            attributes = {}
-            for item in child:
-                if item.tag not in FIELD_MAPPINGS.keys():
-                    continue
-                if item.tag == "ByLawNo":  # Bylaw has been repealed, we can skip
-                    break
-                if not item.text:
-                    break
-                attributes[FIELD_MAPPINGS[item.tag]] = item.text.lower()
-                attributes["source_id"] = int(attributes["source_id"])
-            self.process_highway_name(attributes)
-            records.append(attributes)
-        return records
+    def iter_bylaws(self, xml_file):
+        """
+        Yields the attributes of each record in ``xml_file``. The file is read with
+        ``iterparse`` and every record is cleared from the tree once read, so only
+        one record is held in memory at a time.
+        """
+        depth = 0
+        root = None
+        for event, element in ET.iterparse(xml_file, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                # Records are the children of the root element
+                yield self.parse_record(element)
+                root.clear()
+
+    def parse_record(self, record):
+        attributes = {}
+        for item in record:
+            if item.tag == "ByLawNo" and item.text:  # Bylaw has been repealed
+                attributes["repealed"] = True
+                continue
+            if item.tag not in FIELD_MAPPINGS.keys():
+                continue
+            if not item.text:
+                break
+            attributes[FIELD_MAPPINGS[item.tag]] = item.text.lower()
+            attributes["source_id"] = int(attributes["source_id"])
+        self.process_highway_name(attributes)
+        attributes["content_hash"] = get_content_hash(attributes)
+        # Parsed once here so requests only have to test a bit
+        attributes["active_times"] = compile_schedule(
+            attributes.get("times_and_or_days")
+        )
+        return attributes
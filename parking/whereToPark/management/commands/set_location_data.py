@@ -1,108 +1,255 @@
-from urllib3.util import Retry
-from requests import Session
-import time
-from requests.exceptions import RetryError
-from requests.adapters import HTTPAdapter
-from xml.etree import ElementTree as ET
-from decimal import Decimal
+from contextlib import closing
 
-from django.db.models import Q
-from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection, transaction
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.module_loading import import_string
 
-from whereToPark.models import ByLaw, Intersection, Highway
+from whereToPark.geocoding import BudgetExhausted, parse_geocode_xml
+from whereToPark.models import (
+    ByLaw,
+    DatasetVersion,
+    GeocodingRun,
+    Intersection,
+    Highway,
+    get_street_pair,
+)
+from whereToPark.pipeline import chunked
+from whereToPark.postgis import update_bylaw_geometries
 
-GEOCODER_API_ENDPOINT = "https://geocoder.ca/"
-URL_PARAMS = "&city=toronto&geoit=xml"
+# Sets the boundaries of a batch of bylaws in one statement. VALUES columns are named
+# column1, column2, ... on both PostgreSQL and SQLite (3.33+ for UPDATE ... FROM).
+UPDATE_BOUNDARIES_SQL = """
+    UPDATE {table}
+    SET boundary_start_id = boundaries.column2, boundary_end_id = boundaries.column3
+    FROM (VALUES {values}) AS boundaries
+    WHERE {table}.id = boundaries.column1
+"""
+# Sets the geocoded location and status of a batch of intersections the same way. A
+# VALUES column of only NULLs is text on PostgreSQL, so lat/lng are cast back.
+UPDATE_LOCATIONS_SQL = """
+    UPDATE {table}
+    SET status = locations.column2,
+        lat = CAST(locations.column3 AS double precision),
+        lng = CAST(locations.column4 AS double precision)
+    FROM (VALUES {values}) AS locations
+    WHERE {table}.id = locations.column1
+"""
+
+
+# Give up on the run after this many intersections time out
+MAX_TIMEOUTS = 5
 
 
 class Command(BaseCommand):
-    intersections_to_update = {}
-    timeout_count = 0
+    """
+    Links bylaws to their boundary intersections and geocodes the intersections that
+    haven't been yet. Results are written in batches along with a ``GeocodingRun``
+    checkpoint, so stopping (Ctrl-C, too many timeouts, ``--limit`` or ``--budget``)
+    only loses the batch in flight and ``--resume`` continues where the run stopped.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.GEOCODER_WORKERS,
+            help="Number of geocoding requests in flight at a time",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=settings.GEOCODER_RATE,
+            help="Maximum geocoding requests per second",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Maximum number of bylaws to geocode the boundaries of",
+        )
+        parser.add_argument(
+            "--budget",
+            type=int,
+            help="Maximum number of requests to make to the geocoder",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last run that didn't finish",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Number of bylaws geocoded per checkpoint",
+        )
 
     def handle(self, *args, **options):
         self.import_intersections()
-        self.set_intersections_with_loc()
-        update_fields = ["status", "lat", "lng"]
-        Intersection.objects.bulk_update(
-            list(self.intersections_to_update.values()), update_fields
+        run = GeocodingRun.objects.get_resumable() if options["resume"] else None
+        if run is None:
+            run = GeocodingRun.objects.create()
+        else:
+            self.stdout.write(f"Resuming {run}")
+        self.set_intersections_with_loc(
+            run,
+            workers=options["workers"],
+            rate=options["rate"],
+            limit=options["limit"],
+            budget=options["budget"],
+            batch_size=options["batch_size"],
         )
+        ByLaw.objects.update_midpoints()
+        update_bylaw_geometries()
+        DatasetVersion.objects.bump()
+        call_command("build_bylaw_snapshot", stdout=self.stdout)
 
-    def set_intersections_with_loc(self):
+    def set_intersections_with_loc(
+        self, run, workers=None, rate=None, limit=None, budget=None, batch_size=50
+    ):
         """
         Intersections to update are fetched and ordered by bylaws. This is because
         we want to update both boundaries for a bylaw rather than have one boundary set
         for a bylaw. ie. a bylaw with only the boundary_start or boundary_end field
         set isn't helpful to us.
+
+        Bylaws after ``run``'s checkpoint are taken in id order, ``batch_size`` at a
+        time. The intersections of each batch are geocoded concurrently and written in
+        one transaction with the new checkpoint. Returns True if the run got through
+        every bylaw.
         """
-        for bylaw in ByLaw.objects.get_bylaws_to_update()[:90]:
-            self.set_boundaries(bylaw)
-            if self.timeout_count >= 5:
-                break
-
-    def set_boundaries(self, law):
-        for intersection in [law.boundary_start, law.boundary_end]:
-            if (
-                intersection.status in ["FNF", "FS"]
-                or intersection.id in self.intersections_to_update
-            ):
-                continue
-            (lat, lng), status = self.fetch_geocode(intersection)
-            intersection.lat = lat
-            intersection.lng = lng
-            intersection.status = status
-            self.intersections_to_update[intersection.id] = intersection
-
-    def fetch_geocode(self, intersection):
-        """Handles calling the geocoder API endpoint to fetch lat/lng data
-        for the highway (road) and cross street given. Currently uses the free tier which
-        is heavily throttled"""
-        highway = intersection.main_street.name
-        cross_street = intersection.cross_street.name
-        if not highway or not cross_street:
-            return (None, None), "FNF"
-        print(f"fetching {highway} at {cross_street}")
-        url = f"{GEOCODER_API_ENDPOINT}?street1={highway}&street2={cross_street}{URL_PARAMS}"
+        bylaw_ids = (
+            ByLaw.objects.get_bylaws_to_update()
+            .filter(id__gt=run.last_bylaw_id)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        if limit is not None:
+            bylaw_ids = bylaw_ids[:limit]
+
+        backend = import_string(settings.GEOCODER_BACKEND)
+        geocoder = backend.from_settings(workers=workers, rate=rate, budget=budget)
+        self.timeout_count = 0
+        self.requests_saved = 0
+        # Intersections shared by several bylaws are only tried once per run
+        attempted = set()
+        finished = True
+        with geocoder:
+            for batch_ids in chunked(list(bylaw_ids), batch_size):
+                intersections = {}
+                bylaws = ByLaw.objects.filter(id__in=batch_ids).select_related(
+                    *ByLaw.objects.related_objs
+                )
+                for bylaw in bylaws:
+                    for intersection in [bylaw.boundary_start, bylaw.boundary_end]:
+                        if (
+                            intersection.status in ["FNF", "FS"]
+                            or intersection.id in attempted
+                        ):
+                            continue
+                        intersections.setdefault(intersection.id, intersection)
+                attempted.update(intersections)
+
+                geocoded, stopped = self.geocode_intersections(geocoder, intersections)
+                # A batch that was cut short is done again when the run is resumed
+                self.save_checkpoint(
+                    run, geocoded, None if stopped else batch_ids, geocoder
+                )
+                if stopped:
+                    finished = False
+                    break
+
+        if finished and limit is None:
+            run.finished_at = timezone.now()
+            run.save(update_fields=["finished_at", "updated_at"])
+        self.stdout.write(
+            f"{run}: {run.bylaws_done} bylaws geocoded, "
+            f"{geocoder.request_count} requests made"
+        )
+        if geocoder.cache is not None:
+            self.stdout.write(
+                f"Geocoded {geocoder.cache.hits} intersections from the cache"
+            )
+        return finished
+
+    def geocode_intersections(self, geocoder, intersections):
+        """
+        Geocodes ``intersections`` (a map of id to intersection), setting their location
+        and status. Returns the intersections geocoded, and whether the run has to stop
+        because of timeouts or the budget running out.
+        """
+        geocoded = []
+        pending = (
+            (pk, intersection.main_street.name, intersection.cross_street.name)
+            for pk, intersection in intersections.items()
+        )
         try:
-            s = Session()
-            retries = Retry(
-                total=5,
-                backoff_factor=1,
-                status_forcelist=[403],
-                allowed_methods=["GET"],
+            # Closing the results cancels outstanding requests if we stop early
+            with closing(geocoder.geocode_many(pending)) as results:
+                for pk, ((lat, lng), status) in results:
+                    intersection = intersections[pk]
+                    intersection.lat = lat
+                    intersection.lng = lng
+                    intersection.status = status
+                    geocoded.append(intersection)
+                    if status == "TO":
+                        self.timeout_count += 1
+                        self.stdout.write(f"Timed out on {intersection}, gave up")
+                        if self.timeout_count >= MAX_TIMEOUTS:
+                            return geocoded, True
+        except BudgetExhausted:
+            self.stdout.write("Geocoding budget used up, stopping")
+            return geocoded, True
+        return geocoded, False
+
+    def save_checkpoint(self, run, intersections, bylaw_ids, geocoder):
+        """
+        Writes the geocoded ``intersections`` and moves ``run``'s checkpoint past
+        ``bylaw_ids`` (unless None) in one transaction.
+        """
+        with transaction.atomic():
+            self.update_locations(intersections)
+            if bylaw_ids:
+                run.last_bylaw_id = bylaw_ids[-1]
+                run.bylaws_done += len(bylaw_ids)
+            run.requests_made += geocoder.request_count - self.requests_saved
+            self.requests_saved = geocoder.request_count
+            run.save()
+
+    def update_locations(self, intersections):
+        """
+        Writes the status and location of ``intersections``, in one UPDATE ... FROM on
+        the backends that support it like ``update_boundaries``.
+        """
+        if connection.vendor not in ("postgresql", "sqlite"):
+            Intersection.objects.bulk_update(intersections, ["status", "lat", "lng"])
+            return
+        # Kept well under SQLite's bound parameter limit whatever the batch size
+        for batch in chunked(intersections, 2000):
+            sql = UPDATE_LOCATIONS_SQL.format(
+                table=connection.ops.quote_name(Intersection._meta.db_table),
+                values=", ".join(["(%s, %s, %s, %s)"] * len(batch)),
             )
-            s.mount("https://", HTTPAdapter(max_retries=retries))
-            resp = s.get(url)
-        except RetryError as err:
-            print(f"Fetching geocode for {highway} at {cross_street} failed: {err}")
-        else:
-            tree = ET.fromstring(resp.content)
-            return self.parse_geocode_xml(tree)
-        self.timeout_count += 1
-        print(f"Timed out on {highway} at {cross_street}, gave up")
-        return (None, None), "TO"
+            params = [
+                value
+                for intersection in batch
+                for value in (
+                    intersection.pk,
+                    intersection.status,
+                    intersection.lat,
+                    intersection.lng,
+                )
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
 
     def parse_geocode_xml(self, tree):
-        """Given an element tree with XML from geocoder API, parse latitude and longitude
-        fields.
-        """
-        lat, lng = None, None
-        confidence_score = 0
-        for child in tree:
-            if child.tag == "error":
-                return (None, None), "FNF"
-            if child.tag == "latt" and child.text:
-                lat = float(child.text)
-            elif child.tag == "longt" and child.text:
-                lng = float(child.text)
-            elif child.tag == "confidence" and child.text:
-                confidence_score = child.text
-
-        if float(confidence_score) < 0.5:
-            print("Geocode for intersection not found")
-            return (None, None), "FNF"
-        return (lat, lng), "FS"
+        return parse_geocode_xml(tree)
 
     def parse_between_field(self, between):
+        """Returns the names of the two cross streets in a bylaw's ``between`` field."""
         if not between:
             return None, None
         cross_streets = between.split(" and ")
@@ -113,25 +260,84 @@ class Command(BaseCommand):
             first_street = cross_streets[0].split("of")[1].strip()
         if " of " in cross_streets[1]:
             second_street = cross_streets[1].split("of")[1].strip()
+        return first_street, second_street
 
-        cross_highway_a = Highway.objects.filter(name=first_street).first()
-        cross_highway_b = Highway.objects.filter(name=second_street).first()
-        return cross_highway_a, cross_highway_b
-
-    def import_intersections(self):
-        bylaws_to_update = []
-        for bylaw in ByLaw.objects.all():
-            cross_highway_a, cross_highway_b = self.parse_between_field(bylaw.between)
+    def import_intersections(self, batch_size=2000):
+        """
+        Links every bylaw to the intersections at either end of it. The ``between``
+        fields are parsed in memory and street names resolved through a single
+        name->id map. Missing intersections are created in bulk and only bylaws whose
+        boundaries changed are written, so the query count doesn't grow with the
+        number of bylaws.
+        """
+        highway_ids = dict(Highway.objects.values_list("name", "id"))
+        links = []
+        for pk, highway_id, between, start_id, end_id in ByLaw.objects.values_list(
+            "id", "highway_id", "between", "boundary_start_id", "boundary_end_id"
+        ).iterator(chunk_size=batch_size):
+            first_street, second_street = self.parse_between_field(between)
+            cross_highway_a = highway_ids.get(first_street)
+            cross_highway_b = highway_ids.get(second_street)
             if not cross_highway_a or not cross_highway_b:
                 continue
-            main_highway = bylaw.highway
-            intersection_start, _ = Intersection.objects.get_or_create(
-                main_street=main_highway, cross_street=cross_highway_a
+            start = get_street_pair(highway_id, cross_highway_a)
+            end = get_street_pair(highway_id, cross_highway_b)
+            links.append((pk, start, end, start_id, end_id))
+
+        intersection_ids = self.get_intersection_ids()
+        missing = {
+            pair
+            for _, start, end, _, _ in links
+            for pair in (start, end)
+            if pair not in intersection_ids
+        }
+        if missing:
+            Intersection.objects.bulk_create(
+                [
+                    Intersection(main_street_id=main, cross_street_id=cross)
+                    for main, cross in missing
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            intersection_ids = self.get_intersection_ids()
+
+        boundaries = []
+        for pk, start, end, start_id, end_id in links:
+            boundary_ids = (intersection_ids[start], intersection_ids[end])
+            if boundary_ids != (start_id, end_id):
+                boundaries.append((pk, *boundary_ids))
+        for batch in chunked(boundaries, batch_size):
+            self.update_boundaries(batch)
+        return len(boundaries)
+
+    def update_boundaries(self, boundaries):
+        """
+        Sets the boundaries from a list of (bylaw id, boundary_start id, boundary_end
+        id). ``bulk_update`` spends most of its time building a CASE per row in Python,
+        so on the backends that support it this is a single UPDATE ... FROM instead.
+        """
+        if connection.vendor not in ("postgresql", "sqlite"):
+            ByLaw.objects.bulk_update(
+                [
+                    ByLaw(pk=pk, boundary_start_id=start_id, boundary_end_id=end_id)
+                    for pk, start_id, end_id in boundaries
+                ],
+                ["boundary_start", "boundary_end"],
             )
-            intersection_end, _ = Intersection.objects.get_or_create(
-                main_street=main_highway, cross_street=cross_highway_b
+            return
+        sql = UPDATE_BOUNDARIES_SQL.format(
+            table=connection.ops.quote_name(ByLaw._meta.db_table),
+            values=", ".join(["(%s, %s, %s)"] * len(boundaries)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in boundaries for value in row])
+
+    def get_intersection_ids(self):
+        """Returns a map of (main street id, cross street id) to intersection id."""
+        return {
+            (main, cross): pk
+            for pk, main, cross in Intersection.objects.values_list(
+                "id", "main_street_id", "cross_street_id"
             )
-            bylaw.boundary_start = intersection_start
-            bylaw.boundary_end = intersection_end
-            bylaws_to_update.append(bylaw)
-        ByLaw.objects.bulk_update(bylaws_to_update, ["boundary_start", "boundary_end"])
+        }
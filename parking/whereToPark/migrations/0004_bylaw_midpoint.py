@@ -0,0 +1,48 @@
+# Generated by Django 4.2.2 on 2026-10-18 00:47
+
+from django.db import migrations, models
+
+
+def set_midpoints(apps, schema_editor):
+    """Backfills the stored midpoint for bylaws geocoded before the columns existed."""
+    ByLaw = apps.get_model("whereToPark", "ByLaw")
+    bylaws = ByLaw.objects.exclude(boundary_start=None).exclude(boundary_end=None)
+    bylaws_to_update = []
+    for bylaw in bylaws.select_related("boundary_start", "boundary_end").iterator():
+        start, end = bylaw.boundary_start, bylaw.boundary_end
+        if start.status == "FS" and end.status != "FS":
+            bylaw.mid_lat, bylaw.mid_lng = start.lat, start.lng
+        elif end.status == "FS" and start.status != "FS":
+            bylaw.mid_lat, bylaw.mid_lng = end.lat, end.lng
+        elif None not in (start.lat, start.lng, end.lat, end.lng):
+            bylaw.mid_lat = (start.lat + end.lat) / 2
+            bylaw.mid_lng = (start.lng + end.lng) / 2
+        else:
+            continue
+        bylaws_to_update.append(bylaw)
+    ByLaw.objects.bulk_update(bylaws_to_update, ["mid_lat", "mid_lng"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whereToPark', '0003_datasetversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bylaw',
+            name='mid_lat',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='bylaw',
+            name='mid_lng',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='bylaw',
+            index=models.Index(fields=['mid_lat', 'mid_lng'], name='whereToPark_mid_lat_b6c89b_idx'),
+        ),
+        migrations.RunPython(set_midpoints, migrations.RunPython.noop),
+    ]
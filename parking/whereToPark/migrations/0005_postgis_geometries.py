@@ -0,0 +1,78 @@
+# Generated by Django 4.2.2 on 2026-10-18 09:12
+
+from django.conf import settings
+from django.db import DatabaseError, migrations, transaction
+
+# Copied rather than imported from whereToPark.postgis so later changes there can't
+# change what this migration does
+ADD_GEOMETRIES_SQL = [
+    'ALTER TABLE "whereToPark_intersection" ADD COLUMN IF NOT EXISTS geom geometry(Point, 4326) '
+    'GENERATED ALWAYS AS (CASE WHEN lat IS NOT NULL AND lng IS NOT NULL '
+    'THEN ST_SetSRID(ST_MakePoint(lng, lat), 4326) END) STORED',
+    'CREATE INDEX IF NOT EXISTS "whereToPark_intersection_geom_gist" '
+    'ON "whereToPark_intersection" USING GIST (geom)',
+    'ALTER TABLE "whereToPark_bylaw" ADD COLUMN IF NOT EXISTS geom geometry(Geometry, 4326)',
+    'CREATE INDEX IF NOT EXISTS "whereToPark_bylaw_geom_gist" '
+    'ON "whereToPark_bylaw" USING GIST (geom)',
+    '''
+    UPDATE "whereToPark_bylaw" AS bylaw
+    SET geom = CASE
+        WHEN start.status = 'FS' AND "end".status = 'FS'
+            AND NOT ST_Equals(start.geom, "end".geom)
+            THEN ST_MakeLine(start.geom, "end".geom)
+        WHEN start.status = 'FS' THEN start.geom
+        WHEN "end".status = 'FS' THEN "end".geom
+    END
+    FROM "whereToPark_intersection" AS start, "whereToPark_intersection" AS "end"
+    WHERE start.id = bylaw.boundary_start_id AND "end".id = bylaw.boundary_end_id
+    ''',
+]
+REMOVE_GEOMETRIES_SQL = [
+    'ALTER TABLE "whereToPark_bylaw" DROP COLUMN IF EXISTS geom',
+    'ALTER TABLE "whereToPark_intersection" DROP COLUMN IF EXISTS geom',
+]
+
+
+def create_postgis_extension(schema_editor):
+    """
+    Returns whether the postgis extension is (or could be) enabled. Only a failure
+    with ``USE_POSTGIS`` on is an error.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return False
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+    except DatabaseError:
+        if settings.USE_POSTGIS:
+            raise
+        return False
+    return True
+
+
+def add_geometries(apps, schema_editor):
+    """
+    Adds the PostGIS geometry columns on PostgreSQL whenever PostGIS is available, so
+    turning ``USE_POSTGIS`` on later doesn't need another migration.
+    """
+    if create_postgis_extension(schema_editor):
+        for sql in ADD_GEOMETRIES_SQL:
+            schema_editor.execute(sql)
+
+
+def remove_geometries(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in REMOVE_GEOMETRIES_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whereToPark', '0004_bylaw_midpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_geometries, remove_geometries),
+    ]
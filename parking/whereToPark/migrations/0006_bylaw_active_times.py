@@ -0,0 +1,33 @@
+# Generated by Django 4.2.2 on 2026-10-18 01:08
+
+from django.db import migrations, models
+
+from whereToPark.schedules import compile_schedule
+
+
+def set_active_times(apps, schema_editor):
+    """Compiles the time bitmap of bylaws imported before the column existed."""
+    ByLaw = apps.get_model("whereToPark", "ByLaw")
+    bylaws = ByLaw.objects.exclude(times_and_or_days=None).only("times_and_or_days")
+    bylaws_to_update = []
+    for bylaw in bylaws.iterator():
+        bylaw.active_times = compile_schedule(bylaw.times_and_or_days)
+        if bylaw.active_times is not None:
+            bylaws_to_update.append(bylaw)
+    ByLaw.objects.bulk_update(bylaws_to_update, ["active_times"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whereToPark', '0005_postgis_geometries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bylaw',
+            name='active_times',
+            field=models.BinaryField(max_length=84, null=True),
+        ),
+        migrations.RunPython(set_active_times, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whereToPark', '0006_bylaw_active_times'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bylaw',
+            name='content_hash',
+            field=models.CharField(max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.2 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whereToPark', '0007_bylaw_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('last_bylaw_id', models.BigIntegerField(default=0)),
+                ('bylaws_done', models.PositiveIntegerField(default=0)),
+                ('requests_made', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
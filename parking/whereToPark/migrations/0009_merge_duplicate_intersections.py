@@ -0,0 +1,69 @@
+# Generated by Django 4.2.2 on 2026-10-18 01:41
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+# Best first, the merged intersection keeps the most useful result of its duplicates
+STATUS_RANKS = {'FS': 0, 'FNF': 1, 'TO': 2, 'NA': 3}
+BATCH_SIZE = 500
+
+
+def merge_intersections(apps, schema_editor):
+    """
+    Merges intersections stored as both "A at B" and "B at A" into one row under the
+    ordered street pair. The row with the best status (and so its coordinates) is kept
+    and bylaws pointing at the others are repointed to it before they are deleted.
+    """
+    Intersection = apps.get_model('whereToPark', 'Intersection')
+    ByLaw = apps.get_model('whereToPark', 'ByLaw')
+
+    groups = defaultdict(list)
+    intersections = Intersection.objects.exclude(main_street=None).exclude(
+        cross_street=None
+    )
+    for intersection in intersections.order_by('id').iterator():
+        pair = tuple(sorted([intersection.main_street_id, intersection.cross_street_id]))
+        groups[pair].append(intersection)
+
+    merged_into, to_reorder = {}, []
+    for (main_street_id, cross_street_id), duplicates in groups.items():
+        kept = min(duplicates, key=lambda row: STATUS_RANKS.get(row.status, 4))
+        for duplicate in duplicates:
+            if duplicate.id != kept.id:
+                merged_into[duplicate.id] = kept.id
+        if (kept.main_street_id, kept.cross_street_id) != (main_street_id, cross_street_id):
+            kept.main_street_id, kept.cross_street_id = main_street_id, cross_street_id
+            to_reorder.append(kept)
+
+    bylaws = ByLaw.objects.filter(
+        models.Q(boundary_start__in=merged_into) | models.Q(boundary_end__in=merged_into)
+    )
+    bylaws_to_update = []
+    for bylaw in bylaws.only('boundary_start', 'boundary_end').iterator():
+        bylaw.boundary_start_id = merged_into.get(bylaw.boundary_start_id, bylaw.boundary_start_id)
+        bylaw.boundary_end_id = merged_into.get(bylaw.boundary_end_id, bylaw.boundary_end_id)
+        bylaws_to_update.append(bylaw)
+    ByLaw.objects.bulk_update(
+        bylaws_to_update, ['boundary_start', 'boundary_end'], batch_size=BATCH_SIZE
+    )
+
+    # Nothing points at the duplicates anymore so deleting them doesn't cascade
+    duplicate_ids = list(merged_into)
+    for idx in range(0, len(duplicate_ids), BATCH_SIZE):
+        Intersection.objects.filter(id__in=duplicate_ids[idx : idx + BATCH_SIZE]).delete()
+    # Only reordered once the duplicates holding the ordered pair are gone
+    Intersection.objects.bulk_update(
+        to_reorder, ['main_street', 'cross_street'], batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whereToPark', '0008_geocodingrun'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_intersections, migrations.RunPython.noop),
+    ]
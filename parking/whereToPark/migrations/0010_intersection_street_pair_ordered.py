@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-18 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whereToPark', '0009_merge_duplicate_intersections'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='intersection',
+            constraint=models.CheckConstraint(check=models.Q(('main_street__lte', models.F('cross_street'))), name='intersection_street_pair_ordered'),
+        ),
+    ]
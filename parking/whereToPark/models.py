@@ -1,7 +1,13 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
-from django.db.models import Q
-from django.utils.functional import cached_property
+from django.db.models import F, Q
+from django.utils import timezone
 
+from whereToPark.schedules import BITMAP_BYTES
+from whereToPark.signals import dataset_changed
+
+DATASET_VERSION_CACHE_KEY = "dataset_version"
 
 STREET_SIDES = (("W", "West"), ("E", "East"), ("N", "North"), ("S", "South"))
 BOUNDARY_STATUSES = (
@@ -12,6 +18,24 @@ BOUNDARY_STATUSES = (
 )
 
 
+def get_street_pair(street_id, other_street_id):
+    """
+    Returns the (main_street, cross_street) ids an intersection of the two streets is
+    stored under. "A at B" and "B at A" are the same corner, so intersections are kept
+    with the lower id as the main street and each corner is only geocoded once.
+    """
+    return tuple(sorted([street_id, other_street_id]))
+
+
+def get_version_key(version, updated_at):
+    """
+    Returns the key caches and folders built from a dataset version are stored under.
+    The version number alone starts over when the database is rebuilt, so a stale
+    cache could pass for a fresh one, the time it was bumped at doesn't.
+    """
+    return f"{version}-{updated_at:%Y%m%d%H%M%S%f}"
+
+
 class Intersection(models.Model):
     main_street = models.ForeignKey(
         "Highway", on_delete=models.CASCADE, related_name="main_street", null=True
@@ -28,6 +52,12 @@ class Intersection(models.Model):
 
     class Meta:
         unique_together = ["main_street", "cross_street"]
+        constraints = [
+            models.CheckConstraint(
+                check=Q(main_street__lte=F("cross_street")),
+                name="intersection_street_pair_ordered",
+            )
+        ]
 
 
 class ByLawManager(models.Manager):
@@ -78,6 +108,27 @@ class ByLawManager(models.Manager):
             .select_related(*self.related_objs)
         )
 
+    def update_midpoints(self, batch_size=1000):
+        """
+        Recomputes and stores the midpoint of every bylaw with both boundaries set. Run
+        once intersection coordinates have been written by ``set_location_data``.
+        """
+        exclude_qs = Q(boundary_start=None) | Q(boundary_end=None)
+        bylaws = self.exclude(exclude_qs).select_related(
+            "boundary_start", "boundary_end"
+        )
+        bylaws_to_update = []
+        for bylaw in bylaws.iterator(chunk_size=batch_size):
+            midpoint = bylaw.compute_midpoint()
+            if midpoint == bylaw.midpoint:
+                continue
+            bylaw.mid_lat, bylaw.mid_lng = midpoint
+            bylaws_to_update.append(bylaw)
+        self.bulk_update(
+            bylaws_to_update, ["mid_lat", "mid_lng"], batch_size=batch_size
+        )
+        return len(bylaws_to_update)
+
 
 class ByLaw(models.Model):
     """
@@ -105,13 +156,28 @@ class ByLaw(models.Model):
     max_period_permitted = models.CharField(
         max_length=100, null=True
     )  # only set for restricted parking
+    mid_lat = models.FloatField(null=True)
+    mid_lng = models.FloatField(null=True)
+    # Weekly bitmap of when times_and_or_days applies (see whereToPark.schedules),
+    # null if the text couldn't be parsed
+    active_times = models.BinaryField(max_length=BITMAP_BYTES, null=True)
+    # Hash of the source record, compared by delta imports to find changed rows
+    content_hash = models.CharField(max_length=32, null=True)
     objects = ByLawManager()
 
     def __str__(self):
         return f"{self.highway} ({self.side}) - {self.source_id}"
 
-    @cached_property
+    @property
     def midpoint(self):
+        return (self.mid_lat, self.mid_lng)
+
+    def compute_midpoint(self):
+        """
+        Computes the midpoint of the bylaw from its boundary intersections. Stored on
+        ``mid_lat``/``mid_lng`` by ``ByLawManager.update_midpoints`` so requests don't
+        have to recompute it for every row.
+        """
         lat_mid = None
         lng_mid = None
         if not self.boundary_start and not self.boundary_end:
@@ -125,6 +191,13 @@ class ByLaw(models.Model):
         ):
             lat_mid = self.boundary_end.lat
             lng_mid = self.boundary_end.lng
+        elif None in (
+            self.boundary_start.lat,
+            self.boundary_start.lng,
+            self.boundary_end.lat,
+            self.boundary_end.lng,
+        ):
+            return (None, None)
         else:
             lat_mid = (self.boundary_start.lat + self.boundary_end.lat) / 2
             lng_mid = (self.boundary_start.lng + self.boundary_end.lng) / 2
@@ -132,6 +205,7 @@ class ByLaw(models.Model):
 
     class Meta:
         unique_together = ["schedule", "source_id"]
+        indexes = [models.Index(fields=["mid_lat", "mid_lng"])]
 
 
 class Highway(models.Model):
@@ -139,3 +213,118 @@ class Highway(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class DatasetVersionManager(models.Manager):
+    def current(self):
+        """Returns the single dataset version row, creating it on first use."""
+        version, _ = self.get_or_create(pk=1)
+        return version
+
+    def get_cached(self):
+        """
+        Returns the current (version, updated_at), cached for
+        ``DATASET_VERSION_CACHE_TIMEOUT`` seconds so hot request paths don't need a
+        query to check it.
+        """
+        cached = cache.get(DATASET_VERSION_CACHE_KEY)
+        if cached is None:
+            version = self.current()
+            cached = self.set_cached(version)
+        return cached
+
+    async def aget_cached(self):
+        """Async version of ``get_cached`` for async views."""
+        cached = await cache.aget(DATASET_VERSION_CACHE_KEY)
+        if cached is None:
+            version = await self.filter(pk=1).afirst()
+            if version is None:
+                version, _ = await self.aget_or_create(pk=1)
+            cached = (version.version, version.updated_at)
+            await cache.aset(
+                DATASET_VERSION_CACHE_KEY,
+                cached,
+                settings.DATASET_VERSION_CACHE_TIMEOUT,
+            )
+        return cached
+
+    def set_cached(self, version):
+        cached = (version.version, version.updated_at)
+        cache.set(
+            DATASET_VERSION_CACHE_KEY, cached, settings.DATASET_VERSION_CACHE_TIMEOUT
+        )
+        return cached
+
+    def current_version(self):
+        return self.get_cached()[0]
+
+    def current_key(self):
+        return get_version_key(*self.get_cached())
+
+    async def acurrent_key(self):
+        return get_version_key(*await self.aget_cached())
+
+    def last_modified(self):
+        return self.get_cached()[1]
+
+    def bump(self, changed_ids=None):
+        """
+        Increments the dataset version. Called by the management commands once they are
+        done writing so anything built from an older version of the data (ie. in-process
+        indexes, cached tiles) knows to rebuild itself. ``changed_ids`` is passed on to
+        receivers when the caller knows exactly which bylaws changed.
+        """
+        self.current()
+        self.filter(pk=1).update(version=F("version") + 1, updated_at=timezone.now())
+        version = self.get(pk=1)
+        self.set_cached(version)
+        dataset_changed.send(
+            sender=self.model,
+            version=version.version,
+            key=version.key,
+            changed_ids=changed_ids,
+        )
+        return version
+
+
+class DatasetVersion(models.Model):
+    """
+    Single row tracking the version of the imported bylaw data.
+    """
+
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = DatasetVersionManager()
+
+    def __str__(self):
+        return f"v{self.version} ({self.updated_at})"
+
+    @property
+    def key(self):
+        return get_version_key(self.version, self.updated_at)
+
+
+class GeocodingRunManager(models.Manager):
+    def get_resumable(self):
+        """Returns the latest run that didn't finish, None if there isn't one."""
+        return self.filter(finished_at=None).order_by("-started_at", "-id").first()
+
+
+class GeocodingRun(models.Model):
+    """
+    Checkpoint of a ``set_location_data`` geocoding run. Bylaws are geocoded in id order
+    and ``last_bylaw_id`` is saved along with each batch of results, so a stopped run
+    can be resumed after the last bylaw it wrote.
+    """
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True)
+    last_bylaw_id = models.BigIntegerField(default=0)
+    bylaws_done = models.PositiveIntegerField(default=0)
+    requests_made = models.PositiveIntegerField(default=0)
+    objects = GeocodingRunManager()
+
+    def __str__(self):
+        state = "finished" if self.finished_at else f"at bylaw {self.last_bylaw_id}"
+        return f"Geocoding run {self.pk} ({state})"
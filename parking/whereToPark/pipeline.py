@@ -0,0 +1,58 @@
+"""
+Small generator helpers for the import commands, so records can be streamed from the
+source files into the database in bounded batches.
+"""
+
+import queue
+import threading
+from itertools import islice
+
+_DONE = object()
+
+
+def chunked(iterable, size):
+    """Yields lists of up to ``size`` items from ``iterable``."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def prefetch(iterable, buffer_size=2):
+    """
+    Consumes ``iterable`` in a background thread, keeping up to ``buffer_size`` items
+    ready, so producing the next items (eg. parsing a batch of records) overlaps with
+    whatever the caller does with the current one (eg. writing it to the database).
+    Exceptions raised by ``iterable`` are re-raised in the caller.
+    """
+    items = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put(item)
+        except BaseException as error:
+            items.put((_DONE, error))
+            return
+        items.put((_DONE, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if isinstance(item, tuple) and len(item) == 2 and item[0] is _DONE:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+    finally:
+        stop.set()
+        # Unblock the producer if it's waiting on a full queue
+        while thread.is_alive():
+            try:
+                items.get_nowait()
+            except queue.Empty:
+                thread.join(0.01)
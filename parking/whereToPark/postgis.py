@@ -0,0 +1,71 @@
+"""
+Optional PostGIS support. On PostgreSQL with the postgis extension available,
+migration 0005 adds a generated point ``geom`` column to intersections and a ``geom``
+column to bylaws holding the segment from ``boundary_start`` to ``boundary_end``, both
+GiST indexed. They are only used with ``USE_POSTGIS`` on. The columns aren't model
+fields so they are only read and written with SQL.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+BYLAW_TABLE = '"whereToPark_bylaw"'
+INTERSECTION_TABLE = '"whereToPark_intersection"'
+
+# Segment for bylaws with both boundaries geocoded, the geocoded point otherwise
+UPDATE_BYLAW_GEOMETRIES_SQL = f"""
+    UPDATE {BYLAW_TABLE} AS bylaw
+    SET geom = CASE
+        WHEN start.status = 'FS' AND "end".status = 'FS'
+            AND NOT ST_Equals(start.geom, "end".geom)
+            THEN ST_MakeLine(start.geom, "end".geom)
+        WHEN start.status = 'FS' THEN start.geom
+        WHEN "end".status = 'FS' THEN "end".geom
+    END
+    FROM {INTERSECTION_TABLE} AS start, {INTERSECTION_TABLE} AS "end"
+    WHERE start.id = bylaw.boundary_start_id AND "end".id = bylaw.boundary_end_id
+"""
+
+
+# Aliases of the databases whose geometry columns have been found
+checked_aliases = set()
+
+HAS_GEOMETRIES_SQL = """
+    SELECT COUNT(*) FROM information_schema.columns
+    WHERE table_schema = current_schema() AND column_name = 'geom'
+        AND table_name IN ('whereToPark_bylaw', 'whereToPark_intersection')
+"""
+
+
+def is_enabled(using=connection):
+    """
+    Returns whether location queries should use PostGIS. Raises ImproperlyConfigured
+    if ``USE_POSTGIS`` is on but the database doesn't have the geometry columns, rather
+    than failing on every query that needs them.
+    """
+    if not (settings.USE_POSTGIS and using.vendor == "postgresql"):
+        return False
+    if using.alias not in checked_aliases:
+        with using.cursor() as cursor:
+            cursor.execute(HAS_GEOMETRIES_SQL)
+            if cursor.fetchone()[0] != 2:
+                raise ImproperlyConfigured(
+                    "USE_POSTGIS is on but the geom columns are missing, install "
+                    "PostGIS on the database and run migration 0005 again (see the "
+                    "README)"
+                )
+        checked_aliases.add(using.alias)
+    return True
+
+
+def update_bylaw_geometries():
+    """
+    Rebuilds the ``geom`` column of every bylaw with both boundaries set from its
+    intersections. Returns the number of bylaws updated, 0 if PostGIS isn't enabled.
+    """
+    if not is_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(UPDATE_BYLAW_GEOMETRIES_SQL)
+        return cursor.rowcount
@@ -0,0 +1,155 @@
+"""
+Parses the free text ``times_and_or_days`` of a bylaw (eg. "8:00 a.m. to 6:00 p.m.,
+mon. to fri.") into a weekly bitmap of 15 minute slots, so whether a bylaw is in
+effect at a given time is a single bit test.
+
+Bitmaps are 672 bits (7 days of 96 slots, starting Monday 00:00 Toronto time) packed
+little endian into 84 bytes. Text we can't fully make sense of (seasonal dates,
+durations like "12 hours", ...) parses to None, meaning unknown.
+"""
+
+import re
+from zoneinfo import ZoneInfo
+
+TIMEZONE = ZoneInfo("America/Toronto")
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+BITMAP_BYTES = SLOTS_PER_WEEK // 8
+
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+TOKENS = re.compile(
+    r"""
+    (?P<time>(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<meridiem>[ap])\.?\s?m\b\.?)
+    |(?P<noon>(?:12(?::00)?\s*)?noon)
+    |(?P<midnight>(?:12(?::00)?\s*)?midnight)
+    |(?P<day>(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?)
+    |(?P<daily>daily|every\s+day)
+    |(?P<anytime>any\s*time|at\s+all\s+times)
+    |(?P<to>to\b|-|–)
+    |(?P<except>except\b)
+    |(?P<skip>(?:and\s+)?(?:public\s+)?holidays?|of\s+the\s+following\s+day|and\b|&|,|;|\s+)
+    """,
+    re.VERBOSE,
+)
+
+
+def tokenize(text):
+    """
+    Splits schedule text into (kind, value) tokens. Returns None if any part of the
+    text isn't recognised.
+    """
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKENS.match(text, position)
+        if match is None:
+            return None
+        position = match.end()
+        kind = match.lastgroup
+        if kind == "skip":
+            continue
+        if kind == "time":
+            hour = int(match["hour"]) % 12 + (12 if match["meridiem"] == "p" else 0)
+            minute = int(match["minute"] or 0)
+            if hour > 23 or minute > 59:
+                return None
+            tokens.append(("time", hour * 60 + minute))
+        elif kind == "noon":
+            tokens.append(("time", 12 * 60))
+        elif kind == "midnight":
+            tokens.append(("time", 0))
+        elif kind == "day":
+            tokens.append(("day", DAYS.index(match.group()[:3])))
+        else:
+            tokens.append((kind, None))
+    return tokens
+
+
+def parse_schedule(text):
+    """
+    Returns the weekly bitmap of slots covered by the schedule ``text`` as an int, or
+    None if it can't be parsed.
+    """
+    if not text:
+        return None
+    tokens = tokenize(text.strip().lower())
+    if not tokens:
+        return None
+
+    ranges, days, excluded_days = [], set(), set()
+    all_day, excluding = False, False
+    idx = 0
+    while idx < len(tokens):
+        kind, value = tokens[idx]
+        next_kinds = [token[0] for token in tokens[idx + 1 : idx + 3]]
+        # Days listed after "except" are taken out of the ones before it (or all)
+        target = excluded_days if excluding else days
+        if kind == "time" and next_kinds == ["to", "time"]:
+            ranges.append((value, tokens[idx + 2][1]))
+            idx += 3
+        elif kind == "day" and next_kinds == ["to", "day"]:
+            last = tokens[idx + 2][1]
+            target.update(
+                day % 7 for day in range(value, last + 7 * (last < value) + 1)
+            )
+            idx += 3
+        elif kind == "day":
+            target.add(value)
+            idx += 1
+        elif kind == "daily":
+            target.update(range(7))
+            idx += 1
+        elif kind == "anytime":
+            all_day = True
+            idx += 1
+        elif kind == "except" and not excluding:
+            excluding = True
+            idx += 1
+        else:
+            return None
+
+    if not (ranges or days or all_day or excluded_days):
+        return None
+    days = (days or set(range(7))) - excluded_days
+    if all_day or not ranges:
+        ranges = [(0, 24 * 60)]
+
+    bitmap = 0
+    for day in days:
+        for start, end in ranges:
+            if end <= start:
+                # Runs past midnight into the following day
+                end += 24 * 60
+            first = start // SLOT_MINUTES
+            last = -(-end // SLOT_MINUTES)
+            for slot in range(first, last):
+                bitmap |= 1 << ((day * SLOTS_PER_DAY + slot) % SLOTS_PER_WEEK)
+    return bitmap
+
+
+def to_bytes(bitmap):
+    return None if bitmap is None else bitmap.to_bytes(BITMAP_BYTES, "little")
+
+
+def from_bytes(data):
+    return None if data is None else int.from_bytes(bytes(data), "little")
+
+
+def compile_schedule(text):
+    """Returns the packed bitmap for ``text`` to store on a bylaw, None if unknown."""
+    return to_bytes(parse_schedule(text))
+
+
+def get_slot(when):
+    """Returns the slot of the week an aware datetime falls in, in Toronto time."""
+    local = when.astimezone(TIMEZONE)
+    return (
+        local.weekday() * SLOTS_PER_DAY
+        + (local.hour * 60 + local.minute) // SLOT_MINUTES
+    )
+
+
+def is_active(bitmap, slot):
+    return bool(bitmap >> slot & 1)
@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Sent by ``DatasetVersion.objects.bump`` once an import or geocoding run has written
+# new data. Receivers get the new ``version`` number, its ``key`` (see
+# ``get_version_key``) and ``changed_ids``, the ids of the bylaws inserted, updated or
+# deleted when known (delta imports), otherwise None.
+dataset_changed = Signal()
@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from whereToPark.centreline import CentrelineGeocoder, shapefile
+from whereToPark.models import ByLaw, Highway
+
+BLOOR = [[[-79.41, 43.665], [-79.40, 43.666]], [[-79.40, 43.666], [-79.39, 43.667]]]
+CENTRELINE = {
+    "type": "FeatureCollection",
+    "features": [
+        {
+            "type": "Feature",
+            "properties": {"LINEAR_NAME_FULL": "Bloor St W"},
+            "geometry": {"type": "MultiLineString", "coordinates": BLOOR},
+        },
+        {
+            "type": "Feature",
+            "properties": {"LINEAR_NAME_FULL": "Spadina Ave"},
+            "geometry": {
+                "type": "LineString",
+                "coordinates": [[-79.40, 43.660], [-79.40, 43.666]],
+            },
+        },
+        {
+            "type": "Feature",
+            "properties": {"LINEAR_NAME_FULL": "Huron St"},
+            "geometry": {
+                "type": "LineString",
+                "coordinates": [[-79.398, 43.655], [-79.398, 43.660]],
+            },
+        },
+        # Meets Bloor at both ends, far apart
+        {
+            "type": "Feature",
+            "properties": {"LINEAR_NAME_FULL": "Elm Cres"},
+            "geometry": {
+                "type": "LineString",
+                "coordinates": [[-79.41, 43.665], [-79.40, 43.67], [-79.39, 43.667]],
+            },
+        },
+        {
+            "type": "Feature",
+            "properties": {"INTERSECTION_DESC": "King St W / Bathurst St"},
+            "geometry": {"type": "Point", "coordinates": [-79.403, 43.644]},
+        },
+    ],
+}
+
+
+def get_features():
+    return [
+        (feature["properties"], feature["geometry"])
+        for feature in CENTRELINE["features"]
+    ]
+
+
+class CentrelineGeocoderTests(SimpleTestCase):
+    def setUp(self):
+        self.geocoder = CentrelineGeocoder(features=get_features())
+
+    def test_streets_meeting(self):
+        result = self.geocoder.geocode("bloor street west", "spadina avenue")
+        self.assertEqual(result, ((43.666, -79.40), "FS"))
+        self.assertEqual(self.geocoder.geocode("spadina ave", "bloor st w"), result)
+
+    def test_intersection_points(self):
+        result = self.geocoder.geocode("bathurst street", "king street west")
+        self.assertEqual(result, ((43.644, -79.403), "FS"))
+
+    def test_not_found(self):
+        not_found = ((None, None), "FNF")
+        self.assertEqual(self.geocoder.geocode("bloor st w", "huron st"), not_found)
+        self.assertEqual(self.geocoder.geocode("bloor st w", "nowhere"), not_found)
+        self.assertEqual(self.geocoder.geocode("bloor st w", ""), not_found)
+
+    def test_ambiguous(self):
+        result = self.geocoder.geocode("bloor street west", "elm crescent")
+        self.assertEqual(result, ((None, None), "FNF"))
+
+    def test_reads_geojson(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "centreline.geojson")
+            with open(path, "w") as file:
+                json.dump(CENTRELINE, file)
+            geocoder = CentrelineGeocoder(path)
+        _, status = geocoder.geocode("bloor street west", "spadina avenue")
+        self.assertEqual(status, "FS")
+
+    @skipUnless(shapefile, "pyshp isn't installed")
+    def test_reads_shapefile(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "centreline.shp")
+            with shapefile.Writer(path, shapeType=shapefile.POLYLINE) as writer:
+                writer.field("LINEAR_NAM", "C")
+                writer.line(BLOOR)
+                writer.record("Bloor St W")
+                writer.line([[[-79.40, 43.660], [-79.40, 43.666]]])
+                writer.record("Spadina Ave")
+            geocoder = CentrelineGeocoder(path)
+        result = geocoder.geocode("bloor street west", "spadina avenue")
+        self.assertEqual(result, ((43.666, -79.40), "FS"))
+
+
+class SetLocationDataOfflineTests(TestCase):
+    def test_geocoded_from_centreline(self):
+        bloor = Highway.objects.create(name="bloor street west")
+        Highway.objects.create(name="spadina avenue")
+        Highway.objects.create(name="huron street")
+        ByLaw.objects.create(
+            source_id=1,
+            schedule="13",
+            schedule_name="No Parking",
+            highway=bloor,
+            between="spadina avenue and huron street",
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "centreline.geojson")
+            with open(path, "w") as file:
+                json.dump(CENTRELINE, file)
+            with self.settings(
+                GEOCODER_BACKEND="whereToPark.centreline.CentrelineGeocoder",
+                GEOCODER_CENTRELINE_PATH=path,
+                SNAPSHOT_DIR=tmp_dir,
+            ):
+                call_command("set_location_data", stdout=StringIO())
+
+        bylaw = ByLaw.objects.get()
+        self.assertEqual(bylaw.boundary_start.status, "FS")
+        self.assertEqual(bylaw.boundary_end.status, "FNF")
+        self.assertEqual(bylaw.midpoint, (43.666, -79.40))
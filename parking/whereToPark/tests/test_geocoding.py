@@ -0,0 +1,296 @@
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from whereToPark.geocode_cache import GeocodeCache, get_key
+from whereToPark.geocoding import Geocoder, TokenBucket
+from whereToPark.models import ByLaw, GeocodingRun, Highway, Intersection
+
+FOUND_XML = """<geodata>
+<latt>43.690601</latt><longt>-79.439944</longt><confidence>0.9</confidence>
+</geodata>"""
+NOT_FOUND_XML = """<geodata><error><code>008</code></error></geodata>"""
+
+
+class StandInGeocoderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            server.clients.add(self.client_address)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            throttled = server.throttle_next > 0
+            server.throttle_next -= throttled
+        time.sleep(server.latency)
+        with server.lock:
+            server.in_flight -= 1
+
+        if throttled:
+            self.respond(429, b"", {"Retry-After": "0"})
+            return
+        street = parse_qs(urlparse(self.path).query)["street1"][0]
+        body = NOT_FOUND_XML if street == "nowhere" else FOUND_XML
+        self.respond(200, body.encode())
+
+    def respond(self, status, body, headers=None):
+        self.send_response(status)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInGeocoder(ThreadingHTTPServer):
+    """
+    Local stand in for geocoder.ca. Answers after ``latency`` seconds and responds with
+    429 to the next ``throttle_next`` requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0):
+        super().__init__(("127.0.0.1", 0), StandInGeocoderHandler)
+        self.latency = latency
+        self.throttle_next = 0
+        self.request_count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.clients = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class StandInGeocoderMixin:
+    def setUp(self):
+        super().setUp()
+        self.server = StandInGeocoder()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+
+class GeocoderTests(StandInGeocoderMixin, SimpleTestCase):
+    def get_geocoder(self, **kwargs):
+        kwargs = {"rate": 1000, "backoff": 0.01, **kwargs}
+        geocoder = Geocoder(endpoint=self.server.url, **kwargs)
+        self.addCleanup(geocoder.close)
+        return geocoder
+
+    def test_found(self):
+        (lat, lng), status = self.get_geocoder().geocode("ashbury avenue", "oakwood")
+        self.assertEqual((lat, lng), (43.690601, -79.439944))
+        self.assertEqual(status, "FS")
+
+    def test_not_found(self):
+        result = self.get_geocoder().geocode("nowhere", "oakwood avenue")
+        self.assertEqual(result, ((None, None), "FNF"))
+        self.assertEqual(self.get_geocoder().geocode("", "oakwood"), result)
+
+    def test_throttled_requests_back_off_and_retry(self):
+        self.server.throttle_next = 2
+        geocoder = self.get_geocoder()
+        _, status = geocoder.geocode("ashbury avenue", "oakwood avenue")
+        self.assertEqual(status, "FS")
+        self.assertEqual(self.server.request_count, 3)
+        # Halved twice, then recovered a step on success
+        self.assertLess(geocoder.limiter.rate, 1000)
+
+    def test_gives_up_when_always_throttled(self):
+        self.server.throttle_next = 100
+        geocoder = self.get_geocoder(max_retries=2)
+        result = geocoder.geocode("ashbury avenue", "oakwood avenue")
+        self.assertEqual(result, ((None, None), "TO"))
+        self.assertEqual(self.server.request_count, 3)
+
+    def test_geocode_many_concurrently_over_pooled_connections(self):
+        self.server.latency = 0.1
+        geocoder = self.get_geocoder(workers=4)
+        intersections = [(idx, "ashbury avenue", f"street {idx}") for idx in range(12)]
+        results = dict(geocoder.geocode_many(intersections))
+
+        self.assertEqual(sorted(results), list(range(12)))
+        self.assertEqual({status for _, status in results.values()}, {"FS"})
+        # Requests overlapped, but never more than one per worker
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 4)
+        # Connections are kept alive and reused rather than opened per request
+        self.assertLessEqual(len(self.server.clients), 4)
+
+
+class GeocodeCacheTests(StandInGeocoderMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "geocode.sqlite3")
+
+    def get_cache(self):
+        cache = GeocodeCache(self.path, ttls={"FNF": 60})
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_key_is_normalized_and_unordered(self):
+        self.assertEqual(
+            get_key("Queen St. W", "bay street"), get_key("bay st", "queen street west")
+        )
+
+    def test_found_entries_kept(self):
+        self.get_cache().set("queen st", "bay st", (43.6, -79.3), "FS", 0.9)
+        cache = self.get_cache()
+        cached = cache.get("bay street", "queen street", now=time.time() + 10**9)
+        self.assertEqual(cached, ((43.6, -79.3), "FS"))
+        self.assertEqual(cache.hits, 1)
+
+    def test_not_found_entries_expire(self):
+        cache = self.get_cache()
+        cache.set("queen street", "nowhere", (None, None), "FNF", 0.1)
+        self.assertEqual(cache.get("queen street", "nowhere"), ((None, None), "FNF"))
+        self.assertIsNone(cache.get("queen street", "nowhere", now=time.time() + 61))
+
+    def test_timeouts_not_cached(self):
+        cache = self.get_cache()
+        cache.set("queen street", "bay street", (None, None), "TO")
+        self.assertIsNone(cache.get("queen street", "bay street"))
+        self.server.throttle_next = 1
+        with Geocoder(
+            endpoint=self.server.url, rate=1000, max_retries=0, cache=cache
+        ) as geocoder:
+            _, status = geocoder.geocode("ashbury avenue", "oakwood avenue")
+            self.assertEqual(status, "TO")
+            _, status = geocoder.geocode("ashbury avenue", "oakwood avenue")
+            self.assertEqual(status, "FS")
+        self.assertEqual(self.server.request_count, 2)
+
+    def test_geocoder_reads_cache_first(self):
+        with Geocoder(
+            endpoint=self.server.url, rate=1000, cache=self.get_cache()
+        ) as geocoder:
+            first = geocoder.geocode("ashbury avenue", "oakwood avenue")
+            self.assertEqual(geocoder.geocode("oakwood ave", "ashbury ave"), first)
+        # Survives reopening the file
+        with Geocoder(
+            endpoint=self.server.url, rate=1000, cache=self.get_cache()
+        ) as geocoder:
+            self.assertEqual(
+                geocoder.geocode("ashbury avenue", "oakwood avenue"), first
+            )
+        self.assertEqual(self.server.request_count, 1)
+
+
+class SetLocationDataGeocodingTests(StandInGeocoderMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        for name in ["glenholme avenue", "oakwood avenue", "dufferin street"]:
+            Highway.objects.create(name=name)
+        for source_id, highway in enumerate(["ashbury avenue", "boon avenue"]):
+            ByLaw.objects.create(
+                source_id=source_id,
+                schedule="13",
+                schedule_name="No Parking",
+                highway=Highway.objects.create(name=highway),
+                between="glenholme avenue and oakwood avenue",
+            )
+
+    def set_location_data(self, **options):
+        stdout = StringIO()
+        with self.settings(
+            GEOCODER_URL=self.server.url,
+            GEOCODE_CACHE_PATH=os.path.join(self.tmp_dir, "geocode.sqlite3"),
+            SNAPSHOT_DIR=self.tmp_dir,
+        ):
+            call_command(
+                "set_location_data", rate=1000, workers=1, stdout=stdout, **options
+            )
+        return stdout.getvalue()
+
+    def get_statuses(self):
+        return list(
+            Intersection.objects.order_by("id").values_list("status", flat=True)
+        )
+
+    def test_intersections_geocoded(self):
+        self.set_location_data()
+        self.assertEqual(self.server.request_count, 4)
+        self.assertEqual(self.get_statuses(), ["FS"] * 4)
+        # Every intersection comes back with the same location from the stand in
+        bylaw = ByLaw.objects.first()
+        self.assertEqual(bylaw.midpoint, (43.690601, -79.439944))
+        run = GeocodingRun.objects.get()
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual((run.bylaws_done, run.requests_made), (2, 4))
+
+    def test_limit(self):
+        self.set_location_data(limit=1)
+        first, second = ByLaw.objects.order_by("id")
+        self.assertEqual(first.boundary_start.status, "FS")
+        self.assertEqual(first.boundary_end.status, "FS")
+        self.assertEqual(second.boundary_start.status, "NA")
+        self.assertEqual(second.boundary_end.status, "NA")
+        self.assertIsNone(GeocodingRun.objects.get().finished_at)
+
+    def test_budget_stops_run_and_resume_continues(self):
+        output = self.set_location_data(budget=3, batch_size=1)
+        self.assertIn("budget used up", output)
+        # The second bylaw's batch was cut short, what it got is still written
+        self.assertEqual(sorted(self.get_statuses()), ["FS", "FS", "FS", "NA"])
+        run = GeocodingRun.objects.get()
+        first_bylaw = ByLaw.objects.order_by("id").first()
+        self.assertEqual(run.last_bylaw_id, first_bylaw.id)
+        self.assertEqual(run.requests_made, 3)
+        self.assertIsNone(run.finished_at)
+
+        output = self.set_location_data(resume=True)
+        self.assertIn(f"Resuming Geocoding run {run.pk}", output)
+        self.assertEqual(self.get_statuses(), ["FS"] * 4)
+        run.refresh_from_db()
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(run.requests_made, 4)
+        self.assertEqual(self.server.request_count, 4)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_paces_requests(self):
+        bucket = TokenBucket(rate=50)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        # The first token is available right away, the other 5 at 50 a second
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_throttle_and_recover(self):
+        bucket = TokenBucket(rate=10, rate_step=2)
+        bucket.throttle(0)
+        bucket.throttle(0)
+        self.assertEqual(bucket.rate, 2.5)
+        for _ in range(10):
+            bucket.recover()
+        self.assertEqual(bucket.rate, 10)
+
+    def test_throttle_pauses_callers(self):
+        bucket = TokenBucket(rate=1000)
+        bucket.throttle(0.1)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
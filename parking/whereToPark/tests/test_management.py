@@ -1,5 +1,7 @@
 import os
+import tempfile
 import xml.etree.ElementTree as ET
+from io import StringIO
 
 from django.core.management import call_command
 from django.test import TestCase, SimpleTestCase
@@ -12,7 +14,8 @@ from whereToPark.management.commands.import_parking_data import (
 )
 from whereToPark.management.commands.set_location_data import Command as SetParkingCmd
 
-from whereToPark.models import ByLaw, Highway, Intersection
+from whereToPark.models import ByLaw, DatasetVersion, Highway, Intersection
+from whereToPark.signals import dataset_changed
 
 # Create your tests here.
 
@@ -41,6 +44,8 @@ class GetParkingDumpTests(SimpleTestCase):
 
 class SetLocationDataTests(TestCase):
     def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
         self.highway = Highway.objects.create(name="ashbury avenue")
         self.highway.save()
         self.cross_highway_a = Highway.objects.create(name="glenholme avenue")
@@ -57,7 +62,15 @@ class SetLocationDataTests(TestCase):
             between="glenholme avenue and oakwood avenue",
             times_and_or_days="12 hours",
         )
-        call_command("set_location_data")
+        self.set_location_data()
+
+    def set_location_data(self):
+        # Keeps the geocode cache and snapshots out of the project folder
+        with self.settings(
+            GEOCODE_CACHE_PATH=os.path.join(self.tmp_dir.name, "geocode_cache.sqlite3"),
+            SNAPSHOT_DIR=self.tmp_dir.name,
+        ):
+            call_command("set_location_data", stdout=StringIO())
 
     def test_intersection_a_imported(self):
         intersections = Intersection.objects.filter(
@@ -110,7 +123,7 @@ class SetLocationDataTests(TestCase):
             between="brock avenue and the west end of abbs street",
             times_and_or_days="12 hours",
         )
-        call_command("set_location_data")
+        self.set_location_data()
         law = ByLaw.objects.get(id=2)
         self.assertIsNone(law.boundary_start)
         self.assertIsNone(law.boundary_end)
@@ -165,3 +178,179 @@ class ImportParkingDataTests(TestCase):
         highway_with_parens = {"highway": "isaac devins boulevard (south branch)"}
         result = ImportParkingCmd().process_highway_name(highway_with_parens)
         self.assertEqual(highway_with_parens["highway"], "isaac devins boulevard")
+
+
+NO_PARKING_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<DATA>
+  <Record>
+    <ID>1</ID><Schedule>13</Schedule><ScheduleName>No Parking</ScheduleName>
+    <Highway>Queen Street (North Branch)</Highway><Side>North</Side>
+    <Between>Yonge Street and Bay Street</Between>
+    <Prohibited_Times_and_or_Days>Anytime</Prohibited_Times_and_or_Days>
+  </Record>
+  <Record>
+    <ID>2</ID><Schedule>13</Schedule><ScheduleName>No Parking</ScheduleName>
+    <Highway>King Street</Highway><Side>South</Side>
+    <Between>Yonge Street and Bay Street</Between>
+    <Prohibited_Times_and_or_Days>8:00 a.m. to 6:00 p.m., Mon. to Fri.</Prohibited_Times_and_or_Days>
+  </Record>
+  <Record>
+    <ID>3</ID><Schedule>13</Schedule><ScheduleName>No Parking</ScheduleName>
+    <Highway>Queen Street (North Branch)</Highway><Side>South</Side>
+    <Between>Bay Street and York Street</Between>
+    <Prohibited_Times_and_or_Days>Anytime</Prohibited_Times_and_or_Days>
+  </Record>
+</DATA>
+"""
+
+
+class StreamingImportTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.xml_file = os.path.join(self.tmp_dir.name, "no_parking.xml")
+        with open(self.xml_file, "w") as file:
+            file.write(NO_PARKING_XML)
+
+    def test_iter_bylaws_yields_records(self):
+        records = list(ImportParkingCmd().iter_bylaws(self.xml_file))
+        self.assertEqual([record["source_id"] for record in records], [1, 2, 3])
+        self.assertEqual(records[0]["highway"], "queen street")
+        self.assertEqual(
+            records[1]["times_and_or_days"], "8:00 a.m. to 6:00 p.m., mon. to fri."
+        )
+        self.assertIsNotNone(records[1]["active_times"])
+
+    def test_import_in_batches(self):
+        command = ImportParkingCmd()
+        command.files = [self.xml_file]
+        with self.settings(SNAPSHOT_DIR=self.tmp_dir.name):
+            call_command(command, batch_size=2, stdout=StringIO())
+            call_command(command, batch_size=2, stdout=StringIO())
+        self.assertEqual(ByLaw.objects.count(), 3)
+        self.assertEqual(Highway.objects.count(), 2)
+        self.assertEqual(
+            ByLaw.objects.get(source_id=3).highway,
+            Highway.objects.get(name="queen street"),
+        )
+
+    def test_highways_resolved_per_batch(self):
+        command = ImportParkingCmd()
+        bylaws = list(command.iter_bylaws(self.xml_file))
+        # One insert for the highways and one select mapping names to ids
+        with self.assertNumQueries(2):
+            command.import_highways(bylaws)
+        queen_street = Highway.objects.get(name="queen street")
+        self.assertEqual(bylaws[0]["highway_id"], queen_street.id)
+        self.assertEqual(bylaws[2]["highway_id"], queen_street.id)
+        self.assertNotIn("highway", bylaws[0])
+
+    def test_import_reports_queries(self):
+        command = ImportParkingCmd()
+        command.files = [self.xml_file]
+        stdout = StringIO()
+        with self.settings(SNAPSHOT_DIR=self.tmp_dir.name):
+            call_command(command, batch_size=2, stdout=stdout)
+        self.assertRegex(stdout.getvalue(), r"Imported 3 bylaws in [\d.]+s \(\d+ queries\)")
+
+    def test_delta_import(self):
+        command = ImportParkingCmd()
+        command.files = [self.xml_file]
+        with self.settings(SNAPSHOT_DIR=self.tmp_dir.name):
+            call_command(command, stdout=StringIO())
+            unchanged = ByLaw.objects.get(source_id=1)
+            removed = ByLaw.objects.get(source_id=3)
+            with open(self.xml_file, "w") as file:
+                xml = NO_PARKING_XML.replace(
+                    "Yonge Street and Bay Street", "Bay Street and Simcoe Street", 1
+                )
+                xml = xml.replace("<ID>2</ID>", "<ID>4</ID>")
+                xml = xml.replace("<ID>3</ID>", "<ID>3</ID><ByLawNo>[Repealed]</ByLawNo>")
+                file.write(xml)
+            received = []
+            receiver = lambda **kwargs: received.append(kwargs["changed_ids"])
+            dataset_changed.connect(receiver)
+            self.addCleanup(dataset_changed.disconnect, receiver)
+            stdout = StringIO()
+            call_command(command, delta=True, stdout=stdout)
+
+        self.assertIn(
+            "1 inserted, 1 updated, 2 deleted, 0 unchanged", stdout.getvalue()
+        )
+        self.assertEqual(
+            sorted(ByLaw.objects.values_list("source_id", flat=True)), [1, 4]
+        )
+        updated = ByLaw.objects.get(source_id=1)
+        self.assertEqual(updated.pk, unchanged.pk)
+        self.assertEqual(updated.between, "bay street and simcoe street")
+        inserted = ByLaw.objects.get(source_id=4)
+        self.assertEqual(len(received), 1)
+        self.assertIn(removed.pk, received[0])
+        self.assertIn(inserted.pk, received[0])
+        self.assertIn(updated.pk, received[0])
+
+    def test_delta_import_without_changes(self):
+        command = ImportParkingCmd()
+        command.files = [self.xml_file]
+        with self.settings(SNAPSHOT_DIR=self.tmp_dir.name):
+            call_command(command, delta=True, stdout=StringIO())
+            version = DatasetVersion.objects.current_version()
+            stdout = StringIO()
+            call_command(command, delta=True, stdout=stdout)
+        self.assertIn(
+            "0 inserted, 0 updated, 0 deleted, 3 unchanged", stdout.getvalue()
+        )
+        self.assertEqual(DatasetVersion.objects.current_version(), version)
+
+
+class ImportIntersectionsTests(TestCase):
+    def setUp(self):
+        self.highway = Highway.objects.create(name="ashbury avenue")
+        self.cross_highway_a = Highway.objects.create(name="glenholme avenue")
+        self.cross_highway_b = Highway.objects.create(name="oakwood avenue")
+        for source_id, between in [
+            (1, "glenholme avenue and oakwood avenue"),
+            (2, "oakwood avenue and glenholme avenue"),
+            (3, "brock avenue and the west end of abbs street"),
+        ]:
+            ByLaw.objects.create(
+                source_id=source_id,
+                schedule="13",
+                schedule_name="No Parking",
+                highway=self.highway,
+                between=between,
+            )
+
+    def test_bylaws_linked_in_constant_queries(self):
+        # Highways, bylaws, intersections, insert, intersections again, update
+        with self.assertNumQueries(6):
+            updated = SetParkingCmd().import_intersections()
+        self.assertEqual(updated, 2)
+        self.assertEqual(Intersection.objects.count(), 2)
+        first, second = ByLaw.objects.filter(source_id__in=[1, 2]).order_by("source_id")
+        self.assertEqual(first.boundary_start.cross_street, self.cross_highway_a)
+        self.assertEqual(first.boundary_end.cross_street, self.cross_highway_b)
+        self.assertEqual(first.boundary_start, second.boundary_end)
+        self.assertIsNone(ByLaw.objects.get(source_id=3).boundary_start)
+
+    def test_intersections_shared_by_both_streets(self):
+        # Oakwood avenue's bylaw ends at the same corner as ashbury avenue's
+        ByLaw.objects.create(
+            source_id=4,
+            schedule="13",
+            schedule_name="No Parking",
+            highway=self.cross_highway_b,
+            between="ashbury avenue and glenholme avenue",
+        )
+        SetParkingCmd().import_intersections()
+        ashbury = ByLaw.objects.get(source_id=1)
+        oakwood = ByLaw.objects.get(source_id=4)
+        self.assertEqual(ashbury.boundary_end, oakwood.boundary_start)
+        self.assertEqual(Intersection.objects.count(), 3)
+
+    def test_linked_bylaws_not_rewritten(self):
+        SetParkingCmd().import_intersections()
+        # Highways, bylaws and intersections only, nothing to write
+        with self.assertNumQueries(3):
+            updated = SetParkingCmd().import_intersections()
+        self.assertEqual(updated, 0)
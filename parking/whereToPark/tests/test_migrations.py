@@ -0,0 +1,63 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MergeDuplicateIntersectionsTests(TransactionTestCase):
+    migrate_from = [("whereToPark", "0008_geocodingrun")]
+    migrate_to = [("whereToPark", "0010_intersection_street_pair_ordered")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        apps = self.migrate(self.migrate_from)
+        Highway = apps.get_model("whereToPark", "Highway")
+        Intersection = apps.get_model("whereToPark", "Intersection")
+        ByLaw = apps.get_model("whereToPark", "ByLaw")
+        bloor, spadina, huron = [
+            Highway.objects.create(name=name) for name in ["bloor", "spadina", "huron"]
+        ]
+        self.bloor_id, self.spadina_id = bloor.id, spadina.id
+        # The same corner seen from both streets, only one has been geocoded
+        bloor_at_spadina = Intersection.objects.create(
+            main_street=bloor, cross_street=spadina, status="TO"
+        )
+        spadina_at_bloor = Intersection.objects.create(
+            main_street=spadina, cross_street=bloor, status="FS", lat=43.66, lng=-79.4
+        )
+        huron_at_bloor = Intersection.objects.create(
+            main_street=huron, cross_street=bloor, status="NA"
+        )
+        self.huron_at_bloor_id = huron_at_bloor.id
+        ByLaw.objects.create(
+            source_id=1,
+            schedule="13",
+            highway=bloor,
+            boundary_start=bloor_at_spadina,
+            boundary_end=spadina_at_bloor,
+        )
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicates_merged(self):
+        apps = self.migrate(self.migrate_to)
+        Intersection = apps.get_model("whereToPark", "Intersection")
+        ByLaw = apps.get_model("whereToPark", "ByLaw")
+
+        self.assertEqual(Intersection.objects.count(), 2)
+        corner = Intersection.objects.get(
+            main_street_id=min(self.bloor_id, self.spadina_id),
+            cross_street_id=max(self.bloor_id, self.spadina_id),
+        )
+        self.assertEqual((corner.status, corner.lat, corner.lng), ("FS", 43.66, -79.4))
+        bylaw = ByLaw.objects.get()
+        self.assertEqual(bylaw.boundary_start_id, corner.id)
+        self.assertEqual(bylaw.boundary_end_id, corner.id)
+        # Kept, but stored under the ordered pair
+        huron_at_bloor = Intersection.objects.get(id=self.huron_at_bloor_id)
+        self.assertLess(huron_at_bloor.main_street_id, huron_at_bloor.cross_street_id)
@@ -2,6 +2,7 @@ from django.test import TestCase
 
 from whereToPark.models import (
     ByLaw,
+    DatasetVersion,
     Highway,
     Intersection,
 )
@@ -42,6 +43,7 @@ class ByLawModelTest(TestCase):
             times_and_or_days="12 hours",
             max_period_permitted="12 hours",
         )
+        ByLaw.objects.update_midpoints()
 
     def test_source_id(self):
         law = ByLaw.objects.get(id=1)
@@ -104,6 +106,17 @@ class ByLawModelTest(TestCase):
         self.assertEqual(law.midpoint[0], midpoint_a)
         self.assertEqual(law.midpoint[1], midpoint_b)
 
+    def test_update_midpoints_uses_found_boundary(self):
+        Intersection.objects.filter(pk=self.intersection_1.pk).update(
+            lat=43.6392, lng=-79.4380, status="FS"
+        )
+        ByLaw.objects.update_midpoints()
+        law = ByLaw.objects.get(id=1)
+        self.assertEqual(law.midpoint, (43.6392, -79.4380))
+
+    def test_update_midpoints_skips_unchanged(self):
+        self.assertEqual(ByLaw.objects.update_midpoints(), 0)
+
 
 class HighwayModelTest(TestCase):
     @classmethod
@@ -161,3 +174,14 @@ class IntersectionModelTest(TestCase):
         cross = self.intersection.cross_street.name
         status = self.intersection.status
         self.assertEqual(self.intersection.__str__(), f"{main} at {cross} ({status})")
+
+
+class DatasetVersionModelTest(TestCase):
+    def test_current_creates_version(self):
+        self.assertEqual(DatasetVersion.objects.current().version, 0)
+
+    def test_bump_increments_version(self):
+        DatasetVersion.objects.bump()
+        version = DatasetVersion.objects.bump()
+        self.assertEqual(version.version, 2)
+        self.assertEqual(DatasetVersion.objects.count(), 1)
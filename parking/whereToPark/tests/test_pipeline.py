@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+
+from whereToPark.pipeline import chunked, prefetch
+
+
+class ChunkedTests(SimpleTestCase):
+    def test_chunks(self):
+        self.assertEqual(list(chunked(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(chunked([], 2)), [])
+
+
+class PrefetchTests(SimpleTestCase):
+    def test_yields_everything_in_order(self):
+        self.assertEqual(
+            list(prefetch(iter(range(100)), buffer_size=3)), list(range(100))
+        )
+
+    def test_reraises_producer_errors(self):
+        def produce():
+            yield 1
+            raise ValueError("bad record")
+
+        items = prefetch(produce())
+        self.assertEqual(next(items), 1)
+        with self.assertRaisesRegex(ValueError, "bad record"):
+            next(items)
+
+    def test_stops_producer_when_closed(self):
+        produced = []
+
+        def produce():
+            for idx in range(1000):
+                produced.append(idx)
+                yield idx
+
+        items = prefetch(produce(), buffer_size=1)
+        next(items)
+        items.close()
+        self.assertLess(len(produced), 10)
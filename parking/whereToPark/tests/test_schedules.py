@@ -0,0 +1,98 @@
+from datetime import datetime
+
+from django.test import SimpleTestCase
+
+from whereToPark.schedules import (
+    BITMAP_BYTES,
+    SLOTS_PER_DAY,
+    TIMEZONE,
+    compile_schedule,
+    from_bytes,
+    get_slot,
+    is_active,
+    parse_schedule,
+)
+
+MON, TUE, SAT, SUN = 0, 1, 5, 6
+
+
+def slot(day, hour, minute=0):
+    return day * SLOTS_PER_DAY + (hour * 60 + minute) // 15
+
+
+class ParseScheduleTests(SimpleTestCase):
+    def assertActive(self, text, active, inactive):
+        bitmap = parse_schedule(text)
+        self.assertIsNotNone(bitmap, text)
+        for when in active:
+            self.assertTrue(is_active(bitmap, slot(*when)), (text, when))
+        for when in inactive:
+            self.assertFalse(is_active(bitmap, slot(*when)), (text, when))
+
+    def test_times_and_days(self):
+        self.assertActive(
+            "8:00 a.m. to 6:00 p.m., mon. to fri.",
+            active=[(MON, 8), (TUE, 17, 45)],
+            inactive=[(MON, 7, 45), (MON, 18), (SAT, 12)],
+        )
+
+    def test_anytime(self):
+        self.assertEqual(parse_schedule("Anytime"), (1 << 7 * SLOTS_PER_DAY) - 1)
+
+    def test_several_ranges(self):
+        self.assertActive(
+            "7:00 a.m. to 9:00 a.m. and 4:00 p.m. to 6:00 p.m., mon. to fri.",
+            active=[(MON, 7), (MON, 16, 30)],
+            inactive=[(MON, 12), (SAT, 8)],
+        )
+
+    def test_except_days(self):
+        self.assertActive(
+            "8:00 a.m. to 6:00 p.m., except sat., sun. and public holidays",
+            active=[(TUE, 9)],
+            inactive=[(SAT, 9), (SUN, 9)],
+        )
+
+    def test_range_past_midnight(self):
+        self.assertActive(
+            "7:00 p.m. to 7:00 a.m., fri. to sun.",
+            active=[(SAT, 2), (SUN, 23), (MON, 6, 45)],
+            inactive=[(MON, 7), (TUE, 2), (MON, 22)],
+        )
+
+    def test_days_only(self):
+        self.assertActive(
+            "sat., sun.", active=[(SAT, 0), (SUN, 23, 45)], inactive=[(MON, 12)]
+        )
+
+    def test_noon_and_midnight(self):
+        self.assertActive(
+            "midnight to noon daily",
+            active=[(SUN, 0), (TUE, 11, 45)],
+            inactive=[(TUE, 12)],
+        )
+
+    def test_unknown(self):
+        for text in [
+            None,
+            "",
+            "12 hours",
+            "8:00 a.m. to 4:00 p.m., mon. to fri., from september 1 to june 30",
+        ]:
+            self.assertIsNone(parse_schedule(text), text)
+
+    def test_compile_round_trip(self):
+        packed = compile_schedule("8:00 a.m. to 6:00 p.m., mon. to fri.")
+        self.assertEqual(len(packed), BITMAP_BYTES)
+        self.assertEqual(
+            from_bytes(packed), parse_schedule("8:00 a.m. to 6:00 p.m., mon. to fri.")
+        )
+        self.assertIsNone(compile_schedule("12 hours"))
+
+
+class GetSlotTests(SimpleTestCase):
+    def test_slot_in_toronto_time(self):
+        # 2026-10-19 is a Monday, 13:10 UTC is 9:10 EDT
+        when = datetime.fromisoformat("2026-10-19T13:10:00+00:00")
+        self.assertEqual(get_slot(when), slot(MON, 9))
+        self.assertEqual(get_slot(when.astimezone(TIMEZONE)), slot(MON, 9))
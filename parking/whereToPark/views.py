@@ -2,10 +2,12 @@ import json
 
 from django.shortcuts import render
 from django.db.models import Q
+from whereToPark.conditional import dataset_condition
 from whereToPark.models import ByLaw
 
 
 # Create your views here.
+@dataset_condition
 def index(request):
     np_bylaws = ByLaw.objects.get_np_bylaws_to_display()
     rp_bylaws = ByLaw.objects.get_rp_bylaws_to_display()